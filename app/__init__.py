@@ -47,7 +47,11 @@ def create_app(config_class=Config):
             app.jinja_env._cache = None
     
     # Initialize extensions
+    from app.pool_telemetry import configure_pool_telemetry
+    configure_pool_telemetry(app)
     db.init_app(app)
+    from app.read_replica import init_read_replica, disable_read_replica
+    init_read_replica(app)
     login_manager.init_app(app)
     login_manager.login_view = 'auth.login'
     mail.init_app(app)
@@ -72,47 +76,42 @@ def create_app(config_class=Config):
     # Health check endpoint for Azure monitoring
     @app.route('/health')
     def health():
-        return {'status': 'healthy', 'service': 'quantum-blue-chatbot'}, 200
+        from app.groq_service import GroqService
+        from app.intent_classifier import intent_tier_stats
+        from app.database_service import DatabaseService
+        return {
+            'status': 'healthy',
+            'service': 'quantum-blue-chatbot',
+            'llm_cache': GroqService.get_cache_stats(),
+            'groq_client': GroqService.get_client_stats(),
+            'intent_tiers': intent_tier_stats.get_stats(),
+            'catalog_snapshot': DatabaseService().get_snapshot_stats(),
+            'identity_cache': DatabaseService().get_identity_cache_stats()
+        }, 200
+
+    # Per-call-site LLM latency/token histograms
+    @app.route('/health/llm')
+    def llm_metrics():
+        from app.groq_service import GroqService
+        return GroqService.get_llm_call_stats(), 200
+
+    # Connection pool checkout latency, concurrency, overflow/timeouts and sizing recommendations
+    @app.route('/health/db-pool')
+    def db_pool_metrics():
+        from app.pool_telemetry import get_pool_report
+        return get_pool_report(db.engines, app.config), 200
     
-    # Create database tables
+    # Create database tables and sample data (skipped when app_bootstrap_state is current)
     with app.app_context():
-        def _mssql_maintenance():
-            try:
-                # Expand otp_secret and phone columns if too small (idempotent)
-                from sqlalchemy import text
-                engine = db.get_engine()
-                with engine.connect() as conn:
-                    # Increase phone column to NVARCHAR(50)
-                    conn.execute(text("""
-IF EXISTS (SELECT 1 FROM sys.columns c
-           JOIN sys.objects o ON o.object_id = c.object_id
-           WHERE o.name = 'users' AND c.name = 'phone' AND c.max_length < 100)
-BEGIN
-    ALTER TABLE dbo.users ALTER COLUMN phone NVARCHAR(50) NOT NULL;
-END
-"""))
-                    # Increase otp_secret column to NVARCHAR(255)
-                    conn.execute(text("""
-IF EXISTS (SELECT 1 FROM sys.columns c
-           JOIN sys.objects o ON o.object_id = c.object_id
-           WHERE o.name = 'users' AND c.name = 'otp_secret' AND c.max_length < 510)
-BEGIN
-    ALTER TABLE dbo.users ALTER COLUMN otp_secret NVARCHAR(255) NULL;
-END
-"""))
-            except Exception:
-                # Non-fatal: continue app startup even if migration fails
-                pass
-
+        from app.bootstrap import bootstrap_database
+        
         # Attempt to init DB with optional retries if Azure is required
         require_azure = bool(app.config.get('REQUIRE_AZURE_DB')) and str(app.config.get('SQLALCHEMY_DATABASE_URI', '')).startswith('mssql')
         attempts = int(app.config.get('DB_CONNECT_RETRIES', 3)) if require_azure else 1
         last_err = None
         for _ in range(attempts):
             try:
-                db.create_all()
-                if str(app.config.get('SQLALCHEMY_DATABASE_URI', '')).startswith('mssql'):
-                    _mssql_maintenance()
+                bootstrap_database(app)
                 last_err = None
                 break
             except Exception as e:
@@ -124,33 +123,16 @@ END
             logging.warning(f"Primary DB init failed ({type(last_err).__name__}): {last_err}. Falling back to SQLite.")
             try:
                 app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///quantum_blue.db'
+                disable_read_replica(app)  # The replica belongs to the primary that just failed
                 db.session.remove()
                 try:
                     db.engine.dispose()
                 except Exception:
                     pass
-                db.create_all()
+                bootstrap_database(app)
             except Exception as e2:
                 logging.error(f"SQLite fallback failed ({type(e2).__name__}): {e2}")
                 raise
-        
-        # Initialize sample data
-        try:
-            from app.database_service import DatabaseService
-            db_service = DatabaseService()
-            
-            # Initialize warehouses
-            db_service.initialize_warehouses()
-            
-            # Create sample products
-            db_service.create_sample_products()
-            
-            # Create sample users
-            db_service.create_sample_users()
-            
-            logging.info("Sample data initialized successfully")
-        except Exception as e:
-            logging.warning(f"Failed to initialize sample data: {str(e)}")
     
     # Start stock checker background thread
     try:
@@ -189,9 +171,64 @@ END
         logging.warning(f"Failed to start stock checker background thread: {str(e)}")
         logging.warning("Pending orders will not be auto-fulfilled.")
     
+    # Start conversation archiver background thread
+    if app.config.get('CONVERSATION_ARCHIVE_ENABLED', True):
+        try:
+            from app.conversation_archive import ConversationArchiveService
+            
+            def conversation_archiver_worker():
+                """Background worker thread moving old conversations to the archive table"""
+                service = ConversationArchiveService()
+                logger = logging.getLogger(__name__)
+                interval = app.config.get('CONVERSATION_ARCHIVE_INTERVAL', 86400)
+                
+                while True:
+                    # First run after one interval, so startup is not slowed down
+                    time.sleep(interval)
+                    try:
+                        with app.app_context():
+                            report = service.archive_old_conversations()
+                            if report['rows_moved']:
+                                logger.info(f"🗄️ Conversation archive: {report['rows_moved']} conversations moved, {report['bytes_saved']} bytes saved")
+                    except Exception as e:
+                        logger.error(f"❌ Conversation archiver thread error: {str(e)}")
+            
+            conversation_archiver_thread = threading.Thread(target=conversation_archiver_worker, daemon=True, name="ConversationArchiver")
+            conversation_archiver_thread.start()
+            logging.info(f"🚀 Conversation archiver background thread started (runs every {app.config.get('CONVERSATION_ARCHIVE_INTERVAL', 86400)} seconds)")
+            
+        except Exception as e:
+            logging.warning(f"Failed to start conversation archiver background thread: {str(e)}")
+    
+    # Start pool sizer background thread (POOL_SIZING_MODE=apply)
+    if app.config.get('POOL_SIZING_MODE', 'off') == 'apply':
+        try:
+            from app.pool_telemetry import apply_pool_sizing
+            
+            def pool_sizer_worker():
+                """Background worker thread resizing connection pools from observed concurrency"""
+                logger = logging.getLogger(__name__)
+                interval = app.config.get('POOL_SIZING_INTERVAL', 300)
+                
+                while True:
+                    time.sleep(interval)
+                    try:
+                        with app.app_context():
+                            apply_pool_sizing(db.engines, app.config)
+                    except Exception as e:
+                        logger.error(f"❌ Pool sizer thread error: {str(e)}")
+            
+            pool_sizer_thread = threading.Thread(target=pool_sizer_worker, daemon=True, name="PoolSizer")
+            pool_sizer_thread.start()
+            logging.info(f"🚀 Pool sizer background thread started (runs every {app.config.get('POOL_SIZING_INTERVAL', 300)} seconds)")
+            
+        except Exception as e:
+            logging.warning(f"Failed to start pool sizer background thread: {str(e)}")
+    
     return app
 
 @login_manager.user_loader
 def load_user(user_id):
-    from app.models import User
-    return User.query.get(int(user_id))
\ No newline at end of file
+    # Read-only UserRecord from the identity cache; routes that modify the user load the row themselves
+    from app.database_service import DatabaseService
+    return DatabaseService().get_user_record(int(user_id))
\ No newline at end of file
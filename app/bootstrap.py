@@ -0,0 +1,225 @@
+import hashlib
+import logging
+import threading
+import time
+from contextlib import contextmanager
+from sqlalchemy import inspect, select, text
+from sqlalchemy.exc import SQLAlchemyError
+from app import db
+from app.migration_runner import MigrationRunner, discover_migrations
+from app.models import BootstrapState, User
+
+try:
+    import fcntl
+except ImportError:  # Windows App Service
+    fcntl = None
+    import msvcrt
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Bump to re-run create_all and the migration check without a model change
+SCHEMA_REVISION = 1
+# Bump when the sample warehouses, products or users change
+SEED_VERSION = 1
+# Bump when what daily_sales_rollups counts changes: the next start rebuilds it from orders
+SALES_ROLLUP_VERSION = 1
+
+_LOCK_RESOURCE = 'rb_bootstrap'
+_process_lock = threading.Lock()
+
+
+def schema_fingerprint():
+    """
+    Hash of every table, column and index in the models plus the migration
+    names; changes whenever create_all or the migration runner has work to do
+    """
+    digest = hashlib.sha256(f"revision:{SCHEMA_REVISION}".encode('utf-8'))
+    digest.update(f"\nmigrations:{','.join(discover_migrations())}".encode('utf-8'))
+    for name in sorted(db.metadata.tables):
+        table = db.metadata.tables[name]
+        digest.update(f"\ntable:{name}".encode('utf-8'))
+        for column in table.columns:
+            digest.update(f"|{column.name}:{column.type!r}:{column.nullable}".encode('utf-8'))
+        for index in sorted(table.indexes, key=lambda ix: ix.name or ''):
+            digest.update(f"|index:{index.name}:{','.join(c.name for c in index.columns)}".encode('utf-8'))
+    return digest.hexdigest()
+
+
+def read_versions():
+    """{component: version} from app_bootstrap_state; empty when the table does not exist yet"""
+    try:
+        with db.engine.connect() as conn:
+            return dict(conn.execute(select(BootstrapState.component, BootstrapState.version)).all())
+    except SQLAlchemyError:
+        return {}
+
+
+def write_version(component, version):
+    db.session.merge(BootstrapState(component=component, version=version))
+    db.session.commit()
+
+
+# ----------------------------------------------------------------------------
+## CROSS-PROCESS LOCK (one gunicorn worker bootstraps, the others wait)
+# ----------------------------------------------------------------------------
+
+@contextmanager
+def bootstrap_lock(engine, timeout):
+    """
+    Exclusive lock across workers: sp_getapplock on MSSQL, a lock file next to
+    the database on SQLite. When it cannot be taken within `timeout` seconds,
+    bootstrap carries on unlocked (every step is idempotent, just slower).
+    """
+    with _process_lock:
+        if engine.dialect.name == 'mssql':
+            with _mssql_applock(engine, timeout):
+                yield
+        elif engine.dialect.name == 'sqlite' and engine.url.database not in (None, '', ':memory:'):
+            with _file_lock(f"{engine.url.database}.bootstrap.lock", timeout):
+                yield
+        else:
+            yield
+
+
+@contextmanager
+def _mssql_applock(engine, timeout):
+    conn = engine.connect()
+    acquired = False
+    try:
+        result = conn.execute(text(
+            "SET NOCOUNT ON; DECLARE @result INT; "
+            "EXEC @result = sp_getapplock @Resource = :resource, @LockMode = 'Exclusive', "
+            "@LockOwner = 'Session', @LockTimeout = :timeout_ms; SELECT @result"
+        ), {'resource': _LOCK_RESOURCE, 'timeout_ms': int(timeout * 1000)}).scalar()
+        acquired = result is not None and result >= 0
+        if not acquired:
+            logger.warning(f"Bootstrap lock not acquired (sp_getapplock returned {result}); continuing without it")
+        yield
+    finally:
+        try:
+            if acquired:
+                conn.execute(text("EXEC sp_releaseapplock @Resource = :resource, @LockOwner = 'Session'"),
+                             {'resource': _LOCK_RESOURCE})
+        except Exception as e:
+            # Session-owned locks live as long as the connection: drop it
+            logger.warning(f"Error releasing bootstrap lock: {str(e)}")
+            conn.invalidate()
+        conn.close()
+
+
+@contextmanager
+def _file_lock(path, timeout):
+    handle = open(path, 'a+')
+    acquired = False
+    try:
+        deadline = time.time() + timeout
+        while True:
+            try:
+                if fcntl:
+                    fcntl.flock(handle.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+                else:
+                    handle.seek(0)
+                    msvcrt.locking(handle.fileno(), msvcrt.LK_NBLCK, 1)
+                acquired = True
+                break
+            except OSError:
+                if time.time() >= deadline:
+                    logger.warning(f"Bootstrap lock {path} not acquired in {timeout}s; continuing without it")
+                    break
+                time.sleep(0.1)
+        yield
+    finally:
+        if acquired:
+            if fcntl:
+                fcntl.flock(handle.fileno(), fcntl.LOCK_UN)
+            else:
+                handle.seek(0)
+                msvcrt.locking(handle.fileno(), msvcrt.LK_UNLCK, 1)
+        handle.close()
+
+
+# ----------------------------------------------------------------------------
+## SCHEMA AND SAMPLE DATA
+# ----------------------------------------------------------------------------
+
+def ensure_schema():
+    """
+    create_all, then the pending app/migrations steps. A database without a
+    users table is new: create_all builds the current schema, so every
+    migration is only recorded. Migration errors are logged and the schema
+    version is not recorded, so the next start retries them.
+    """
+    fresh = not inspect(db.engine).has_table(User.__tablename__)
+    db.create_all()
+    runner = MigrationRunner(db.engine)
+    if fresh:
+        runner.stamp()
+        return True
+    try:
+        runner.upgrade()
+        return True
+    except Exception as e:
+        logger.error(f"Schema migrations incomplete, will retry on next start: {str(e)}")
+        return False
+
+
+def seed_sample_data():
+    from app.database_service import DatabaseService
+    db_service = DatabaseService()
+    db_service.initialize_warehouses()
+    db_service.create_sample_products()
+    db_service.create_sample_users()
+
+
+def backfill_sales_rollups():
+    """Fill daily_sales_rollups from existing orders (the table starts empty on upgraded databases)"""
+    from app.sales_rollup import SalesRollupService
+    return SalesRollupService().rebuild()
+
+
+def bootstrap_database(app):
+    """
+    Create the schema, sample data and sales rollups unless app_bootstrap_state
+    shows all are current: the usual startup is one SELECT. Otherwise one
+    process at a time (bootstrap_lock) runs what is missing and records it.
+    Schema errors raise (create_app retries or falls back to SQLite); sample
+    data and rollup errors are logged and retried on the next start.
+    """
+    fingerprint = schema_fingerprint()
+    seed_version = str(SEED_VERSION)
+    # Rollups are only backfilled while they are maintained, so enabling them later backfills then
+    rollup_version = str(SALES_ROLLUP_VERSION) if app.config.get('SALES_ROLLUP_ENABLED', True) else None
+    versions = read_versions()
+    rollups_current = rollup_version is None or versions.get('sales_rollups') == rollup_version
+    if versions.get('schema') == fingerprint and versions.get('seed') == seed_version and rollups_current:
+        logger.info("Database schema and sample data up to date; skipping bootstrap")
+        return
+
+    started = time.time()
+    with bootstrap_lock(db.engine, app.config.get('BOOTSTRAP_LOCK_TIMEOUT', 120)):
+        # Another worker may have finished while this one waited for the lock
+        versions = read_versions()
+        if versions.get('schema') != fingerprint:
+            if ensure_schema():
+                write_version('schema', fingerprint)
+                logger.info("Database schema created/updated")
+
+        if versions.get('seed') != seed_version:
+            try:
+                seed_sample_data()
+                write_version('seed', seed_version)
+                logger.info("Sample data initialized successfully")
+            except Exception as e:
+                db.session.rollback()
+                logger.warning(f"Failed to initialize sample data: {str(e)}")
+
+        if rollup_version and versions.get('sales_rollups') != rollup_version:
+            try:
+                rows_written = backfill_sales_rollups()
+                write_version('sales_rollups', rollup_version)
+                logger.info(f"Sales rollups backfilled from existing orders ({rows_written} rows)")
+            except Exception as e:
+                db.session.rollback()
+                logger.warning(f"Failed to backfill sales rollups: {str(e)}")
+    logger.info(f"Database bootstrap finished in {time.time() - started:.2f}s")
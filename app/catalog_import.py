@@ -0,0 +1,297 @@
+import logging
+import time
+from datetime import datetime
+from pathlib import Path
+from flask import current_app
+from sqlalchemy import bindparam, case, func
+from app import db
+from app.catalog_snapshot import mark_products_changed
+from app.models import Product, Warehouse
+
+try:
+    import pandas as pd
+    PANDAS_AVAILABLE = True
+except ImportError:
+    PANDAS_AVAILABLE = False
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Accepted headers per products column (matched case-insensitively, spaces/dashes as underscores)
+COLUMN_ALIASES = {
+    'product_code': ('product_code', 'code', 'sku'),
+    'product_name': ('product_name', 'name'),
+    'product_description': ('product_description', 'description'),
+    'batch_number': ('batch_number', 'batch', 'batch_no'),
+    'expiry_date': ('expiry_date', 'expiry', 'exp_date'),
+    'product_quantity': ('product_quantity', 'quantity', 'qty'),
+    'price_of_product': ('price_of_product', 'price', 'unit_price'),
+    'discount_type': ('discount_type',),
+    'discount_value': ('discount_value', 'discount'),
+    'discount_name': ('discount_name',),
+    'scheme_type': ('scheme_type',),
+    'scheme_value': ('scheme_value',),
+    'scheme_name': ('scheme_name', 'scheme'),
+    'warehouse': ('warehouse', 'warehouse_location', 'location_name'),
+}
+REQUIRED_COLUMNS = ('product_code', 'batch_number', 'product_quantity')
+TEXT_COLUMNS = ('product_name', 'product_description', 'discount_type', 'discount_name', 'scheme_type', 'scheme_value', 'scheme_name')
+NULLABLE_COLUMNS = TEXT_COLUMNS + ('scheme', 'expiry_date')
+BATCH_KEY = ['warehouse_id', 'product_code', 'batch_number']
+
+
+class CatalogImportService:
+    """
+    Bulk upsert of product batches from a CSV or XLSX stock file.
+
+    The file is read in chunks (CATALOG_IMPORT_CHUNK_SIZE rows); each chunk is
+    validated column-wise with pandas, matched against existing batches
+    (warehouse, product_code, batch_number) with one query, then written with
+    one executemany UPDATE and one bulk INSERT and committed. The quantity in
+    the file is the batch's stock: available_for_sale is recomputed in the
+    UPDATE from the row's current blocked and confirmed quantities, so
+    reservations made during the import are kept. Columns missing from the
+    file are left unchanged on existing batches.
+    """
+
+    def __init__(self):
+        self.logger = logger
+
+    def import_file(self, source, filename, warehouse_location=None, restrict_to_warehouse=False,
+                    chunk_size=None, dry_run=False, check_pending_orders=True):
+        """
+        Import `source` (path or file object; format from the filename suffix).
+        warehouse_location is used for rows without a warehouse column/value;
+        with restrict_to_warehouse, rows naming another warehouse are rejected.
+        Returns a report with row counts, per-row errors and timings.
+        """
+        config = current_app.config
+        chunk_size = chunk_size or config.get('CATALOG_IMPORT_CHUNK_SIZE', 1000)
+        max_errors = config.get('CATALOG_IMPORT_MAX_ERRORS', 100)
+        started = time.time()
+
+        report = {
+            'success': True,
+            'filename': filename,
+            'dry_run': dry_run,
+            'chunks': 0,
+            'rows_read': 0,
+            'rows_invalid': 0,
+            'rows_failed': 0,
+            'inserted': 0,
+            'updated': 0,
+            'warehouses': [],
+            'errors': []
+        }
+
+        if not PANDAS_AVAILABLE:
+            report.update(success=False, error='pandas is not installed')
+            return report
+
+        try:
+            warehouse_ids = {w.location_name: w.id for w in Warehouse.query.filter_by(is_active=True).all()}
+            default_warehouse_id = None
+            if warehouse_location:
+                default_warehouse_id = warehouse_ids.get(warehouse_location)
+                if default_warehouse_id is None:
+                    raise ValueError(f"Unknown warehouse: {warehouse_location}")
+
+            touched_warehouses = set()
+            first_row = 2  # Line 1 is the header
+            for raw in self.iter_chunks(source, filename, chunk_size):
+                report['chunks'] += 1
+                report['rows_read'] += len(raw)
+                frame, errors = self._validate(raw, first_row, warehouse_ids, default_warehouse_id, restrict_to_warehouse)
+                first_row += len(raw)
+
+                try:
+                    inserted, updated, invalid = self._upsert_chunk(frame, dry_run)
+                    errors.extend(invalid)
+                    report['inserted'] += inserted
+                    report['updated'] += updated
+                    if inserted or updated:
+                        touched_warehouses.update(int(w) for w in frame['warehouse_id'].unique())
+                except Exception as e:
+                    db.session.rollback()
+                    self.logger.error(f"Error importing chunk {report['chunks']} of {filename}: {str(e)}")
+                    report['rows_failed'] += len(frame)
+                    errors.append({'row': None, 'error': f"Chunk {report['chunks']} not imported: {str(e)}"})
+
+                report['rows_invalid'] += sum(1 for error in errors if error['row'] is not None)
+                report['errors'].extend(errors[:max(max_errors - len(report['errors']), 0)])
+
+            report['warehouses'] = sorted(touched_warehouses)
+        except Exception as e:
+            db.session.rollback()
+            self.logger.error(f"Error importing {filename}: {str(e)}")
+            report.update(success=False, error=str(e))
+
+        report['duration_seconds'] = round(time.time() - started, 2)
+        self.logger.info(
+            f"Catalog import {filename}: {report['inserted']} inserted, {report['updated']} updated, "
+            f"{report['rows_invalid']} invalid of {report['rows_read']} rows in {report['duration_seconds']}s"
+            + (" (dry run)" if dry_run else "")
+        )
+
+        if check_pending_orders and not dry_run and (report['inserted'] or report['updated']):
+            from app.stock_check_service import StockCheckService
+            report['pending_order_check'] = StockCheckService().check_and_fulfill_pending_orders()
+        return report
+
+    def iter_chunks(self, source, filename, chunk_size):
+        """DataFrames of up to chunk_size rows, every cell as text"""
+        suffix = Path(filename).suffix.lower()
+        if suffix == '.csv':
+            yield from pd.read_csv(source, chunksize=chunk_size, dtype=str, keep_default_na=False, skipinitialspace=True)
+        elif suffix in ('.xlsx', '.xlsm'):
+            # Read-only openpyxl streams rows instead of loading the whole sheet
+            from openpyxl import load_workbook
+            workbook = load_workbook(source, read_only=True, data_only=True)
+            try:
+                rows = workbook.active.iter_rows(values_only=True)
+                header = [str(cell).strip() if cell is not None else '' for cell in next(rows, ())]
+                buffer = []
+                for row in rows:
+                    buffer.append(row[:len(header)])
+                    if len(buffer) >= chunk_size:
+                        yield pd.DataFrame(buffer, columns=header)
+                        buffer = []
+                if buffer:
+                    yield pd.DataFrame(buffer, columns=header)
+            finally:
+                workbook.close()
+        else:
+            raise ValueError(f"Unsupported file type {suffix or filename}; use .csv or .xlsx")
+
+    def _normalize_columns(self, frame):
+        lookup = {alias: column for column, aliases in COLUMN_ALIASES.items() for alias in aliases}
+        rename = {}
+        for header in frame.columns:
+            key = str(header).strip().lower().replace(' ', '_').replace('-', '_')
+            column = lookup.get(key)
+            if column and column not in rename.values():
+                rename[header] = column
+        missing = [column for column in REQUIRED_COLUMNS if column not in rename.values()]
+        if missing:
+            raise ValueError(f"Missing required column(s): {', '.join(missing)}")
+        frame = frame[list(rename)].rename(columns=rename)
+        # Text everywhere (Excel gives numbers/datetimes, CSV gives strings)
+        return frame.astype(object).where(frame.notna(), '').astype(str).apply(lambda column: column.str.strip())
+
+    def _validate(self, raw, first_row, warehouse_ids, default_warehouse_id, restrict_to_warehouse):
+        """(valid rows typed for the products table, [{'row', 'error'}]) for one chunk"""
+        frame = self._normalize_columns(raw)
+        frame['row'] = range(first_row, first_row + len(frame))
+        frame = frame[(frame.drop(columns='row') != '').any(axis=1)]  # Skip blank lines
+        error = pd.Series('', index=frame.index)
+
+        def flag(mask, message):
+            # First problem per row wins
+            error[mask & (error == '')] = message
+
+        flag(frame['product_code'] == '', 'missing product_code')
+        flag(frame['batch_number'] == '', 'missing batch_number')
+
+        quantity = pd.to_numeric(frame['product_quantity'], errors='coerce')
+        flag(quantity.isna() | (quantity < 0) | (quantity % 1 != 0), 'quantity must be a whole number >= 0')
+        frame['product_quantity'] = quantity
+
+        if 'price_of_product' in frame:
+            price = pd.to_numeric(frame['price_of_product'], errors='coerce')
+            flag(price.isna() | (price < 0), 'price must be a number >= 0')
+            frame['price_of_product'] = price
+
+        if 'discount_value' in frame:
+            discount = pd.to_numeric(frame['discount_value'].replace('', '0'), errors='coerce')
+            flag(discount.isna() | (discount < 0), 'discount must be a number >= 0')
+            frame['discount_value'] = discount
+
+        if 'expiry_date' in frame:
+            # ISO (2025-12-31) or day-first (31/12/2025); blank = no expiry
+            expiry = pd.to_datetime(frame['expiry_date'], errors='coerce', format='mixed', dayfirst=True)
+            flag(expiry.isna() & (frame['expiry_date'] != ''), 'invalid expiry_date')
+            frame['expiry_date'] = expiry.dt.date
+
+        if 'warehouse' in frame:
+            warehouse_id = frame['warehouse'].map(warehouse_ids)
+            named = frame['warehouse'] != ''
+            flag(named & warehouse_id.isna(), 'unknown warehouse')
+            if restrict_to_warehouse:
+                flag(named & (warehouse_id != default_warehouse_id), 'batch belongs to another warehouse')
+            warehouse_id = warehouse_id.where(named, default_warehouse_id)
+            frame = frame.drop(columns='warehouse')
+        else:
+            warehouse_id = pd.Series(default_warehouse_id, index=frame.index)
+        flag(warehouse_id.isna(), 'no warehouse (add a warehouse column or pass one)')
+        frame['warehouse_id'] = warehouse_id
+
+        for column in TEXT_COLUMNS:
+            if column in frame:
+                frame[column] = frame[column].where(frame[column] != '', None)
+        if 'scheme_name' in frame:
+            frame['scheme'] = frame['scheme_name']  # Legacy column still read by older pricing code
+
+        errors = [{'row': int(row), 'error': message} for row, message in zip(frame['row'], error) if message]
+        valid = frame[error == '']
+        valid = valid.astype({'warehouse_id': int, 'product_quantity': int})
+        # The last line for a batch wins
+        valid = valid.drop_duplicates(subset=BATCH_KEY, keep='last')
+        return valid, errors
+
+    def _upsert_chunk(self, frame, dry_run):
+        """Write one validated chunk in one transaction; returns (inserted, updated, invalid rows)"""
+        if frame.empty:
+            return 0, 0, []
+
+        existing = db.session.query(Product.id, Product.warehouse_id, Product.product_code, Product.batch_number).filter(
+            Product.warehouse_id.in_([int(w) for w in frame['warehouse_id'].unique()]),
+            Product.product_code.in_(frame['product_code'].unique().tolist())
+        ).all()
+        existing = pd.DataFrame([tuple(row) for row in existing], columns=['id'] + BATCH_KEY)
+        frame = frame.merge(existing.drop_duplicates(subset=BATCH_KEY), how='left', on=BATCH_KEY)
+
+        is_new = frame['id'].isna()
+        missing_name = is_new & (frame['product_name'].isna() if 'product_name' in frame else True)
+        invalid = [{'row': int(row), 'error': 'missing product_name for a new batch'} for row in frame.loc[missing_name, 'row']]
+        inserts = frame[is_new & ~missing_name].drop(columns=['row', 'id'])
+        updates = frame[~is_new].drop(columns='row')
+        if dry_run:
+            return len(inserts), len(updates), invalid
+
+        if not updates.empty:
+            table = Product.__table__
+            set_columns = [column for column in updates.columns if column not in ['id'] + BATCH_KEY]
+            values = {}
+            for column in set_columns:
+                value = bindparam(f"v_{column}", type_=table.c[column].type)
+                # Blank text/expiry cells keep what the batch already has
+                values[column] = func.coalesce(value, table.c[column]) if column in NULLABLE_COLUMNS else value
+            remaining = bindparam('v_product_quantity', type_=table.c.product_quantity.type) - table.c.blocked_quantity - table.c.confirmed_quantity
+            values['available_for_sale'] = case((remaining < 0, 0), else_=remaining)
+            values['is_active'] = True
+            values['updated_at'] = datetime.utcnow()
+            statement = table.update().where(table.c.id == bindparam('b_id')).values(values)
+            params = [
+                dict({f"v_{column}": record[column] for column in set_columns}, b_id=int(record['id']))
+                for record in self._records(updates)
+            ]
+            db.session.execute(statement, params)
+
+        if not inserts.empty:
+            rows = self._records(inserts)
+            for row in rows:
+                row.update(
+                    blocked_quantity=0,
+                    confirmed_quantity=0,
+                    available_for_sale=row['product_quantity'],
+                    is_active=True
+                )
+            db.session.bulk_insert_mappings(Product, rows)
+
+        mark_products_changed(db.session, {int(w) for w in frame['warehouse_id'].unique()})
+        db.session.commit()
+        return len(inserts), len(updates), invalid
+
+    def _records(self, frame):
+        """Row dicts with NaN/NaT as None and numpy scalars as Python values"""
+        return frame.astype(object).where(frame.notna(), None).to_dict('records')
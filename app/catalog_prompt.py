@@ -0,0 +1,133 @@
+import logging
+import threading
+import time
+from collections import OrderedDict
+from app.catalog_snapshot import add_invalidation_listener
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+CATALOG_HEADER = 'code|name|price|stock'
+
+
+def estimate_tokens(text):
+    """Rough token estimate (~4 characters per token) for prompt size logging"""
+    return (len(text) + 3) // 4 if text else 0
+
+
+def _format_price(price):
+    price = float(price or 0)
+    return str(int(price)) if price.is_integer() else f"{price:.2f}"
+
+
+class CatalogPromptBuilder:
+    """
+    Builds the compact product catalog block shared by every LLM prompt.
+
+    One line per product code ("RB001|Quantum Blue AI Processor|2500|120"),
+    sorted by code so the text is byte-identical between calls. Blocks are
+    cached per product set and dropped after any committed product change
+    (plus a TTL as a safety net for writes made outside this process).
+    """
+
+    def __init__(self, ttl_seconds=300, max_entries=256, max_products=50):
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self.max_products = max_products
+        self._entries = OrderedDict()
+        self._generation = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+
+    def invalidate(self):
+        """Drop every cached block (called on product stock/price changes)"""
+        with self._lock:
+            self._generation += 1
+            self._entries.clear()
+            self.invalidations += 1
+
+    def build(self, products):
+        """Return the catalog block (header + rows) for a list of Product rows"""
+        products = list(products or [])[:self.max_products]
+        key = tuple(product.id for product in products)
+        now = time.time()
+
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry and entry[0] == self._generation and entry[1] > now:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry[2]
+            self.misses += 1
+            generation = self._generation
+
+        # First row per product code wins, matching the previous listing
+        rows = {}
+        for product in products:
+            if product.product_code not in rows:
+                rows[product.product_code] = (
+                    f"{product.product_code}|{product.product_name}|"
+                    f"{_format_price(product.price_of_product)}|{product.available_for_sale or 0}"
+                )
+        block = CATALOG_HEADER + '\n' + '\n'.join(rows[code] for code in sorted(rows))
+
+        with self._lock:
+            # Skip storing if an invalidation happened while we were building
+            if generation == self._generation:
+                self._entries[key] = (generation, now + self.ttl_seconds, block)
+                self._entries.move_to_end(key)
+                while len(self._entries) > self.max_entries:
+                    self._entries.popitem(last=False)
+        return block
+
+    def system_message(self, products):
+        """
+        Catalog as the leading system message. Keeping it first and identical
+        lets provider-side prompt caching reuse the prefix across calls.
+        """
+        return {
+            "role": "system",
+            "content": (
+                "PRODUCT CATALOG for RB (Powered by Quantum Blue AI). "
+                "Use ONLY these product codes and names.\n" + self.build(products)
+            )
+        }
+
+    def get_stats(self):
+        with self._lock:
+            return {
+                'entries': len(self._entries),
+                'hits': self.hits,
+                'misses': self.misses,
+                'invalidations': self.invalidations,
+                'generation': self._generation
+            }
+
+
+_builder = None
+_builder_lock = threading.Lock()
+
+
+def get_catalog_builder(config=None):
+    """Return the process-wide CatalogPromptBuilder"""
+    global _builder
+    if _builder is None:
+        with _builder_lock:
+            if _builder is None:
+                config = config or {}
+                _builder = CatalogPromptBuilder(
+                    ttl_seconds=config.get('CATALOG_PROMPT_TTL', 300),
+                    max_products=config.get('CATALOG_PROMPT_MAX_PRODUCTS', 50)
+                )
+    return _builder
+
+
+def _invalidate_catalog(warehouse_ids):
+    if _builder is not None:
+        _builder.invalidate()
+
+
+# Rebuild blocks only after product changes are committed
+add_invalidation_listener(_invalidate_catalog)
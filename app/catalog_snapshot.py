@@ -0,0 +1,170 @@
+import logging
+import threading
+import time
+from collections import namedtuple
+from sqlalchemy import event, inspect, select
+from sqlalchemy.orm import Session
+from app import db
+from app.models import Product
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Immutable, detached copy of one products row. Same attribute names as the
+# Product model, so read-only code can use either interchangeably.
+ProductSnapshot = namedtuple('ProductSnapshot', [column.key for column in Product.__table__.columns])
+
+# Columns whose change makes a cached snapshot stale
+SNAPSHOT_FIELDS = tuple(ProductSnapshot._fields)
+
+_DIRTY_KEY = 'catalog_dirty_warehouses'
+_invalidation_listeners = []
+
+
+def add_invalidation_listener(callback):
+    """Register callback(warehouse_ids) to run after a commit that changed products"""
+    _invalidation_listeners.append(callback)
+
+
+def mark_products_changed(session, warehouse_ids):
+    """Record product changes made outside the unit of work (bulk/Core UPDATEs) for invalidation on commit"""
+    session.info.setdefault(_DIRTY_KEY, set()).update(w for w in warehouse_ids if w is not None)
+
+
+def to_snapshot(product):
+    return ProductSnapshot(*(getattr(product, field) for field in ProductSnapshot._fields))
+
+
+def load_committed_snapshots(warehouse_id):
+    """
+    Committed products of a warehouse, read on a connection of its own so a
+    caller's pending (flushed or autoflushable) changes can never be cached
+    """
+    table = Product.__table__
+    with db.engine.connect() as conn:
+        rows = conn.execute(select(table).where(table.c.warehouse_id == warehouse_id)).all()
+    return tuple(ProductSnapshot(*(row._mapping[column] for column in table.columns)) for row in rows)
+
+
+class CatalogSnapshotCache:
+    """
+    Per-warehouse tuple of ProductSnapshot records.
+
+    Entries are invalidated after any commit that inserts, deletes or changes
+    a product of that warehouse (FEFO allocation, order placement, distributor
+    confirmation, stock-checker fulfilment, admin edits...). The TTL only
+    bounds staleness from writes made by other processes.
+    """
+
+    def __init__(self, ttl_seconds=60):
+        self.ttl_seconds = ttl_seconds
+        self._entries = {}
+        self._generations = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+
+    def get(self, warehouse_id):
+        """Return the cached snapshot tuple for warehouse_id, loading it if needed"""
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(warehouse_id)
+            if entry is not None and entry[0] > now:
+                self.hits += 1
+                return entry[1]
+            self.misses += 1
+            generation = self._generations.get(warehouse_id, 0)
+
+        records = load_committed_snapshots(warehouse_id)
+
+        with self._lock:
+            # A commit landed while loading: serve the rows but don't cache them
+            if self._generations.get(warehouse_id, 0) == generation:
+                self._entries[warehouse_id] = (now + self.ttl_seconds, records)
+        return records
+
+    def invalidate(self, warehouse_ids=None):
+        """Drop snapshots for the given warehouses (all when None)"""
+        with self._lock:
+            if warehouse_ids is None:
+                warehouse_ids = set(self._entries) | set(self._generations)
+                self._entries.clear()
+            for warehouse_id in warehouse_ids:
+                self._entries.pop(warehouse_id, None)
+                self._generations[warehouse_id] = self._generations.get(warehouse_id, 0) + 1
+            self.invalidations += 1
+
+    def get_stats(self):
+        with self._lock:
+            return {
+                'warehouses_cached': len(self._entries),
+                'hits': self.hits,
+                'misses': self.misses,
+                'invalidations': self.invalidations
+            }
+
+
+_snapshot_cache = None
+_snapshot_cache_lock = threading.Lock()
+
+
+def get_snapshot_cache(config):
+    """Return the shared CatalogSnapshotCache, or None when disabled"""
+    global _snapshot_cache
+    if not config.get('CATALOG_SNAPSHOT_ENABLED', True):
+        return None
+    if _snapshot_cache is None:
+        with _snapshot_cache_lock:
+            if _snapshot_cache is None:
+                _snapshot_cache = CatalogSnapshotCache(ttl_seconds=config.get('CATALOG_SNAPSHOT_TTL', 60))
+    return _snapshot_cache
+
+
+# ----------------------------------------------------------------------------
+## CHANGE TRACKING (invalidate after commit, never before)
+# ----------------------------------------------------------------------------
+
+@event.listens_for(Session, 'after_flush')
+def _collect_product_changes(session, flush_context):
+    dirty = session.info.setdefault(_DIRTY_KEY, set())
+    for product in session.new:
+        if isinstance(product, Product):
+            dirty.add(product.warehouse_id)
+    for product in session.deleted:
+        if isinstance(product, Product):
+            dirty.add(product.warehouse_id)
+    for product in session.dirty:
+        if isinstance(product, Product):
+            state = inspect(product)
+            if any(state.attrs[field].history.has_changes() for field in SNAPSHOT_FIELDS):
+                dirty.add(product.warehouse_id)
+                # Moving a product between warehouses touches both
+                old_warehouse = state.attrs['warehouse_id'].history.deleted
+                dirty.update(w for w in old_warehouse if w is not None)
+
+
+def _invalidate(warehouse_ids):
+    if _snapshot_cache is not None:
+        _snapshot_cache.invalidate(warehouse_ids)
+    for callback in _invalidation_listeners:
+        try:
+            callback(warehouse_ids)
+        except Exception as e:
+            logger.error(f"Catalog invalidation listener failed: {str(e)}")
+
+
+@event.listens_for(Session, 'after_commit')
+def _invalidate_after_commit(session):
+    warehouse_ids = session.info.pop(_DIRTY_KEY, None)
+    if warehouse_ids:
+        _invalidate(warehouse_ids)
+
+
+@event.listens_for(Session, 'after_rollback')
+def _invalidate_after_rollback(session):
+    # Anything read through this session since the flush (e.g. a listener's
+    # prompt cache) may hold the rolled-back rows
+    warehouse_ids = session.info.pop(_DIRTY_KEY, None)
+    if warehouse_ids:
+        _invalidate(warehouse_ids)
@@ -1,14 +1,21 @@
-from flask import Blueprint, render_template, request, jsonify, session, current_app
+from flask import Blueprint, render_template, request, jsonify, session, current_app, g, Response, stream_with_context, url_for, send_file
 # Assuming 'app' contains the SQLAlchemy 'db' object and models
 from app import db 
-from app.models import Conversation, User, Warehouse, Product, Order, ChatSession
+from app.models import Conversation, ConversationArchive, Warehouse, Product, Order, ChatSession
 from app.database_service import DatabaseService
 from app.llm_classification_service import LLMClassificationService
 from app.web_search_service import WebSearchService
 from app.order_service import OrderService
 from app.enhanced_order_service import EnhancedOrderService
 from app.groq_service import GroqService 
-from app.email_utils import send_conversation_email 
+from app.intent_classifier import INTENT_TIER_TAG
+from app.streaming import stream_text_response, json_to_sse_response
+from app.email_utils import send_conversation_export_email
+from app.conversation_export import (
+    EXPORT_FORMATS, attachment_fits, count_conversations, export_filename, export_to_file, load_stored_export,
+    remove_export_file, store_export, stream_export
+)
+from app.conversation_history import encode_cursor, decode_cursor
 import logging
 from datetime import datetime
 
@@ -206,7 +213,7 @@ def process_message():
         llm_service = get_llm_service()
 
         # Get user context
-        user = User.query.get(session_user_id)
+        user = db_service.get_user_record(session_user_id)
         warehouse_location = session.get('warehouse_location')
         
         # Get user's warehouse
@@ -268,7 +275,7 @@ def process_message():
                 # Load products from warehouse for product matching
                 products = []
                 if warehouse:
-                    products = db_service.get_products_by_warehouse(warehouse.id)
+                    products = db_service.get_catalog_snapshot(warehouse.id)
                 
                 # Parse add product request with enhanced pattern matching
                 import re
@@ -502,7 +509,7 @@ Please try again with the exact product name, and I'll be happy to add it to you
         if intent == 'CALCULATE_COST':
             # Get products from user's warehouse
             if warehouse:
-                products = db_service.get_products_by_warehouse(warehouse.id)
+                products = db_service.get_catalog_snapshot(warehouse.id)
                 
                 # Get recent conversation history for context
                 session_id = session.get('session_id')
@@ -510,8 +517,8 @@ Please try again with the exact product name, and I'll be happy to add it to you
                 if session_id:
                     chat_session = ChatSession.query.filter_by(session_id=session_id).first()
                     if chat_session:
-                        conversations = db_service.get_session_conversations(chat_session.session_id)
-                        conversation_history = [conv.to_dict() for conv in conversations[-10:]]  # Last 10 conversations
+                        conversations = db_service.get_session_conversations(chat_session.session_id, limit=10)
+                        conversation_history = [conv.to_dict() for conv in conversations]  # Last 10 conversations
                 
                 # Calculate order cost
                 cost_data = classification_service.calculate_order_cost(user_message, products, conversation_history)
@@ -552,7 +559,7 @@ Would you like to proceed with this order?"""
         elif intent == 'PLACE_ORDER':
             # Get products from user's warehouse
             if warehouse:
-                products = db_service.get_products_by_warehouse(warehouse.id)
+                products = db_service.get_catalog_snapshot(warehouse.id)
                 
                 # Check if this is a simple order confirmation
                 is_simple_confirmation = ('confirm my order' in user_message.lower() or 'process the items in my cart' in user_message.lower()) and not any(product in user_message for product in ['Quantum Processor', 'AI Controller', 'Quantum Sensors', 'AI Memory Card', 'Neural Network Module'])
@@ -1178,8 +1185,8 @@ Thank you for choosing Quantum Blue!"""
                     if session_id:
                         chat_session = ChatSession.query.filter_by(session_id=session_id).first()
                         if chat_session:
-                            conversations = db_service.get_session_conversations(session_id)
-                            conversation_history = [conv.to_dict() for conv in conversations[-10:]]  # Last 10 conversations
+                            conversations = db_service.get_session_conversations(session_id, limit=10)
+                            conversation_history = [conv.to_dict() for conv in conversations]  # Last 10 conversations
                     
                     # Parse order details and create order
                     order_data = classification_service.parse_order_details(user_message, products, conversation_history)
@@ -1222,7 +1229,7 @@ Thank you for choosing Quantum Blue!"""
                     # Load products for browsing
                     products = []
                     if warehouse:
-                        products = db_service.get_products_by_warehouse(warehouse.id)
+                        products = db_service.get_catalog_snapshot(warehouse.id)
                     
                     # Generate response with interactive options
                     response = classification_service.generate_order_flow_response(
@@ -1390,6 +1397,34 @@ How can I help you today?"""
             response = search_result.get('synthesized_response', 'I couldn\'t find sufficient information to answer your query.')
             
         else:
+            if g.get('stream_response'):
+                # Stream the general answer over SSE and persist it once complete
+                session_id = session.get('session_id')
+
+                def _persist_streamed(text):
+                    if session_id:
+                        db_service.save_conversation(
+                            user_id=session_user_id,
+                            session_id=session_id,
+                            user_message=user_message,
+                            bot_response=text,
+                            data_sources=[intent, f"{INTENT_TIER_TAG}{classification_result.get('tier', 'llm')}"]
+                        )
+
+                return stream_text_response(
+                    llm_service.generate_response_stream(
+                        user_message,
+                        conversation_history=[],
+                        context_data=context_data
+                    ),
+                    on_complete=_persist_streamed,
+                    extra={
+                        'intent': intent,
+                        'confidence': classification_result.get('confidence', 0.0),
+                        'user_message': user_message
+                    }
+                ), 200
+
             # General conversation with professional tone
             response = llm_service.generate_response(
                 user_message,
@@ -1423,7 +1458,7 @@ How can I assist you today?""")
                     session_id=session_id,
                     user_message=user_message,
                     bot_response=response,
-                    data_sources=[intent],
+                    data_sources=[intent, f"{INTENT_TIER_TAG}{classification_result.get('tier', 'llm')}"],
                     response_time=0.5
                 )
 
@@ -1445,22 +1480,81 @@ How can I assist you today?""")
             pass
         return jsonify({'error': 'Failed to process message'}), 500
 
+@chatbot_bp.route('/message/stream', methods=['POST'])
+def process_message_stream():
+    """Streaming (Server-Sent Events) variant of /message"""
+    g.stream_response = True
+    return json_to_sse_response(process_message())
+
 # --- Helper Routes (DB and Session Handling Fixed) ---
 
 @chatbot_bp.route('/history')
 def get_history():
-    """Get conversation history"""
+    """
+    Get conversation history, newest first, one page at a time.
+    Query params: limit (default 50, max 200) and before (the next_cursor
+    of the previous page).
+    """
     session_user_id = session.get('user_id')
     if not session_user_id:
-        return jsonify({'conversations': []})
-    conversations = Conversation.query.filter_by(
-        user_id=session_user_id
-    ).order_by(Conversation.created_at.desc()).limit(50).all()
+        return jsonify({'conversations': [], 'next_cursor': None, 'has_more': False})
+    
+    limit = max(1, min(request.args.get('limit', 50, type=int) or 50, 200))
+    before = request.args.get('before')
+    if before:
+        try:
+            before = decode_cursor(before)
+        except ValueError:
+            return jsonify({'error': 'Invalid cursor'}), 400
+    
+    conversations, has_more = get_db_service().get_conversation_page(session_user_id, before=before, limit=limit)
     
     return jsonify({
-        'conversations': [conv.to_dict() for conv in conversations]
+        'conversations': [conv.to_dict() for conv in conversations],
+        'next_cursor': encode_cursor(conversations[-1]) if has_more and conversations else None,
+        'has_more': has_more
     })
 
+def email_conversation_export(user, session_pk=None):
+    """
+    Stream the user's (or one chat session's) conversations into a temp file
+    and email it as an attachment. When too large to attach, the file is kept
+    server-side (store_export) and the email carries a signed link to it, which
+    keeps working after /clear deletes the history and for the admin copy.
+    Returns the number of conversations exported (0 sends nothing).
+    """
+    conversation_count = count_conversations(user.id, session_pk)
+    if not conversation_count:
+        return 0
+    
+    fmt = current_app.config.get('EXPORT_EMAIL_FORMAT', 'html')
+    if fmt not in EXPORT_FORMATS:
+        fmt = 'html'
+    filename = export_filename(user.name, fmt)
+    export_path = None
+    try:
+        export_path, export_size = export_to_file(user.id, fmt, session_pk=session_pk, user_name=user.name)
+        download_url = None
+        if not attachment_fits(export_size):
+            token = store_export(export_path, filename, EXPORT_FORMATS[fmt][1])
+            export_path = None
+            download_url = url_for('chatbot.download_stored_export', token=token, _external=True)
+        send_conversation_export_email(
+            user.email,
+            current_app.config['ADMIN_EMAIL'],
+            user.name,
+            export_path,
+            export_size,
+            conversation_count,
+            filename=filename,
+            content_type=EXPORT_FORMATS[fmt][1],
+            download_url=download_url,
+            link_days=max(current_app.config.get('EXPORT_LINK_TTL', 7 * 86400) // 86400, 1)
+        )
+    finally:
+        remove_export_file(export_path)
+    return conversation_count
+
 @chatbot_bp.route('/export', methods=['POST'])
 def export_conversation():
     """Export and email conversation"""
@@ -1469,30 +1563,12 @@ def export_conversation():
         return jsonify({'error': 'No verified user session'}), 400
     
     try:
-        conversations = Conversation.query.filter_by(
-            user_id=session_user_id
-        ).order_by(Conversation.created_at.asc()).all()
-        
-        if not conversations:
-            return jsonify({'error': 'No conversations to export'}), 400
-        
-        from app.models import User
-        user = User.query.get(session_user_id)
+        user = get_db_service().get_user_record(session_user_id)
         if not user:
             return jsonify({'error': 'User not found'}), 400
         
-        conversation_data = {
-            'user_name': user.name,
-            'date': datetime.utcnow().strftime('%Y-%m-%d %H:%M:%S'),
-            'conversations': [conv.to_dict() for conv in conversations]
-        }
-        
-        admin_email = current_app.config['ADMIN_EMAIL']
-        send_conversation_email(
-            user.email,
-            admin_email,
-            conversation_data
-        )
+        if not email_conversation_export(user):
+            return jsonify({'error': 'No conversations to export'}), 400
         
         return jsonify({'message': 'Conversation exported and emailed successfully'}), 200
     
@@ -1500,6 +1576,37 @@ def export_conversation():
         logger.error(f'Export error: {str(e)}')
         return jsonify({'error': 'Failed to export conversation'}), 500
 
+@chatbot_bp.route('/export/download', methods=['GET'])
+def download_conversation_export():
+    """Stream the whole conversation history as a download (format=jsonl, csv or html)"""
+    session_user_id = session.get('user_id')
+    if not session_user_id:
+        return jsonify({'error': 'No verified user session'}), 400
+    
+    fmt = request.args.get('format', 'jsonl').lower()
+    if fmt not in EXPORT_FORMATS:
+        return jsonify({'error': f"Unsupported format. Use one of: {', '.join(EXPORT_FORMATS)}"}), 400
+    
+    user = get_db_service().get_user_record(session_user_id)
+    if not user:
+        return jsonify({'error': 'User not found'}), 400
+    
+    chunks = stream_export(user.id, fmt, user_name=user.name)
+    return Response(stream_with_context(chunks), mimetype=EXPORT_FORMATS[fmt][1], headers={
+        'Content-Disposition': f'attachment; filename="{export_filename(user.name, fmt)}"',
+        'X-Accel-Buffering': 'no'
+    })
+
+@chatbot_bp.route('/export/file/<token>', methods=['GET'])
+def download_stored_export(token):
+    """Serve an emailed export that was too large to attach (signed, expiring link; no session needed)"""
+    stored = load_stored_export(token)
+    if not stored:
+        return jsonify({'error': 'This download link is invalid or has expired'}), 404
+    
+    path, filename, content_type = stored
+    return send_file(path, mimetype=content_type, as_attachment=True, download_name=filename)
+
 @chatbot_bp.route('/order-status', methods=['GET'])
 def get_order_status():
     """Get current order and tracking session status"""
@@ -1530,30 +1637,24 @@ def clear_conversation():
     
     try:
         # 2. Retrieve data
-        user = User.query.get(session_user_id)
-        conversations = []
         db_service = get_db_service()  # Initialize db_service at the beginning
+        user = db_service.get_user_record(session_user_id)
         
+        # Export this chat session's conversations, or all of the user's when there is no session
+        export_session_pk = None
+        has_history = True
         if session_id:
             chat_session = ChatSession.query.filter_by(session_id=session_id).first()
+            has_history = chat_session is not None
             if chat_session:
-                conversations = db_service.get_session_conversations(session_id)
-        else:
-            conversations = Conversation.query.filter_by(user_id=session_user_id).order_by(Conversation.created_at.asc()).all()
+                export_session_pk = chat_session.id
         
         # 3. Export Email logic (Only run if user and conversations exist)
-        if user and conversations:
-            conversation_data = {
-                'user_name': user.name,
-                'date': datetime.utcnow().strftime('%Y-%m-%d %H:%M:%S'),
-                'conversations': [conv.to_dict() for conv in conversations]
-            }
-            admin_email = current_app.config['ADMIN_EMAIL']
-            
+        if user and has_history:
             try:
-                # Attempt to send email
-                send_conversation_email(user.email, admin_email, conversation_data)
-                logger.info(f"Conversation exported via email for user {session_user_id}.")
+                # Attempt to send email; the history is streamed to a temp file, never held in memory
+                if email_conversation_export(user, session_pk=export_session_pk):
+                    logger.info(f"Conversation exported via email for user {session_user_id}.")
             except Exception as email_e:
                 # Log email failure but proceed with database cleanup
                 logger.error(f"Email export failed for user {session_user_id}: {str(email_e)}. Proceeding with delete.")
@@ -1570,6 +1671,7 @@ def clear_conversation():
                 db_service.deactivate_session(session_id)
             else:
                 Conversation.query.filter_by(user_id=session_user_id).delete()
+                ConversationArchive.query.filter_by(user_id=session_user_id).delete()
                 db.session.commit()
             
             logger.info(f"Successfully cleared conversations for user {session_user_id}")
@@ -1642,7 +1744,7 @@ def get_products():
         db_service = get_db_service()
         warehouse = db_service.get_warehouse_by_location(warehouse_location)
         if warehouse:
-            products = db_service.get_products_by_warehouse(warehouse.id)
+            products = db_service.get_catalog_snapshot(warehouse.id)
             product_list = []
             for product in products:
                 product_list.append({
@@ -1679,7 +1781,7 @@ def place_order():
             return jsonify({'error': 'No items in cart'}), 400
         
         # Get user and warehouse
-        user = User.query.get(session_user_id)
+        user = get_db_service().get_user_record(session_user_id)
         db_service = get_db_service()
         warehouse = db_service.get_warehouse_by_location(warehouse_location)
         
@@ -1722,7 +1824,7 @@ def get_all_products():
         db_service = get_db_service()
         warehouse = db_service.get_warehouse_by_location(warehouse_location)
         if warehouse:
-            products = db_service.get_products_by_warehouse(warehouse.id)
+            products = db_service.get_catalog_snapshot(warehouse.id)
             
             # Convert to API format
             product_list = []
@@ -1814,7 +1916,13 @@ def get_pricing():
 
 @chatbot_bp.route('/api/update-quantities', methods=['POST'])
 def update_quantities():
-    """Update product quantities after order selection"""
+    """Reserve product quantities in the user's warehouse after order selection"""
+    session_user_id = session.get('user_id')
+    warehouse_location = session.get('warehouse_location')
+    
+    if not session_user_id or not warehouse_location:
+        return jsonify({'error': 'User not authenticated or warehouse not set'}), 401
+    
     try:
         data = request.get_json()
         product_quantities = data.get('product_quantities', {})
@@ -1823,15 +1931,23 @@ def update_quantities():
             return jsonify({'error': 'No product quantities provided'}), 400
         
         db_service = get_db_service()
-        success = db_service.update_product_quantities(product_quantities)
+        warehouse = db_service.get_warehouse_by_location(warehouse_location)
+        if not warehouse:
+            return jsonify({'error': 'Warehouse not found'}), 404
         
-        if success:
+        # Guarded FEFO reservation: all quantities are blocked, or none
+        allocations, message = db_service.allocate_order_fefo(
+            [{'product_code': code, 'quantity': int(quantity)} for code, quantity in product_quantities.items()],
+            warehouse_id=warehouse.id
+        )
+        
+        if allocations is not None:
             return jsonify({
                 'message': 'Product quantities updated successfully',
                 'timestamp': datetime.now().isoformat()
             }), 200
         else:
-            return jsonify({'error': 'Failed to update quantities'}), 500
+            return jsonify({'error': message}), 409
         
     except Exception as e:
         logger.error(f'Error updating quantities: {str(e)}')
@@ -1997,7 +2113,7 @@ def confirm_cart():
     try:
         db_service = get_db_service()
         warehouse = db_service.get_warehouse_by_location(warehouse_location)
-        user = User.query.get(session_user_id)
+        user = db_service.get_user_record(session_user_id)
         
         if not warehouse or not user:
             return jsonify({'error': 'Warehouse or user not found'}), 404
@@ -2059,7 +2175,7 @@ def update_cart():
             return jsonify({'error': 'No products provided'}), 400
         
         # Get user and warehouse
-        user = User.query.get(session_user_id)
+        user = get_db_service().get_user_record(session_user_id)
         db_service = get_db_service()
         warehouse = db_service.get_warehouse_by_location(warehouse_location)
         
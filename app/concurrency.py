@@ -0,0 +1,40 @@
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from flask import current_app
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def get_turn_executor(config):
+    """Process-wide thread pool for work that overlaps with a chat turn's DB queries"""
+    global _executor
+    if _executor is None:
+        with _executor_lock:
+            if _executor is None:
+                _executor = ThreadPoolExecutor(
+                    max_workers=int(config.get('TURN_WORKER_THREADS', 8)),
+                    thread_name_prefix='turn-worker'
+                )
+    return _executor
+
+
+def submit_with_app_context(fn, *args, **kwargs):
+    """
+    Run fn(*args, **kwargs) on the turn thread pool inside its own app context.
+
+    The worker gets its own scoped DB session (removed when the context ends),
+    so ORM objects it loads must not be handed back to the request thread;
+    return plain values instead.
+    """
+    app = current_app._get_current_object()
+
+    def run():
+        with app.app_context():
+            return fn(*args, **kwargs)
+
+    return get_turn_executor(app.config).submit(run)
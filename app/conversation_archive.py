@@ -0,0 +1,131 @@
+import logging
+from datetime import datetime, timedelta
+from flask import current_app
+from sqlalchemy import func
+from sqlalchemy.exc import IntegrityError
+from app import db
+from app.models import Conversation, ConversationArchive
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+
+class ConversationArchiveService:
+    """
+    Moves conversations older than CONVERSATION_ARCHIVE_AFTER_DAYS from the hot
+    conversations table into conversation_archives, compressing the message
+    bodies. Each batch is copied and deleted in one transaction, so a row is
+    always in exactly one of the two tables.
+    """
+
+    def __init__(self):
+        self.logger = logger
+
+    def archive_old_conversations(self, older_than_days=None, batch_size=None, max_batches=None, dry_run=False):
+        """
+        Archive conversations created before now - older_than_days.
+        Returns a compaction report: rows moved, bytes before/after and saved.
+        With dry_run the rows are compressed and measured but nothing is written.
+        """
+        config = current_app.config
+        older_than_days = older_than_days or config.get('CONVERSATION_ARCHIVE_AFTER_DAYS', 90)
+        batch_size = batch_size or config.get('CONVERSATION_ARCHIVE_BATCH_SIZE', 500)
+        cutoff = datetime.utcnow() - timedelta(days=older_than_days)
+        started = datetime.utcnow()
+
+        report = {
+            'cutoff': cutoff.isoformat(),
+            'dry_run': dry_run,
+            'rows_moved': 0,
+            'batches': 0,
+            'bytes_before': 0,
+            'bytes_after': 0,
+            'bytes_saved': 0,
+            'compression_ratio': None,
+            'errors': 0
+        }
+
+        last_id = 0
+        while max_batches is None or report['batches'] < max_batches:
+            # Walk by id so a dry run (or a batch that failed) does not revisit the same rows
+            batch = Conversation.query.filter(
+                Conversation.created_at < cutoff,
+                Conversation.id > last_id
+            ).order_by(Conversation.id).limit(batch_size).all()
+            if not batch:
+                break
+            last_id = batch[-1].id
+
+            archived = []
+            for conv in batch:
+                body, raw_size = ConversationArchive.pack_body(conv.user_message, conv.bot_response, conv.data_sources)
+                archived.append({
+                    'id': conv.id,
+                    'user_id': conv.user_id,
+                    'session_id': conv.session_id,
+                    'response_time': conv.response_time,
+                    'created_at': conv.created_at,
+                    'archived_at': started,
+                    'body': body,
+                    'codec': 'zlib',
+                    'raw_size': raw_size
+                })
+
+            bytes_before = sum(row['raw_size'] for row in archived)
+            bytes_after = sum(len(row['body']) for row in archived)
+
+            if not dry_run:
+                try:
+                    db.session.bulk_insert_mappings(ConversationArchive, archived)
+                    Conversation.query.filter(
+                        Conversation.id.in_([row['id'] for row in archived])
+                    ).delete(synchronize_session=False)
+                    db.session.commit()
+                except IntegrityError as e:
+                    # Another archiver moved (some of) these rows first
+                    db.session.rollback()
+                    report['errors'] += 1
+                    self.logger.warning(f"Conversation archive batch {archived[0]['id']}-{last_id} skipped: {str(e)}")
+                    continue
+                except Exception as e:
+                    db.session.rollback()
+                    report['errors'] += 1
+                    self.logger.error(f"Conversation archive batch failed: {str(e)}")
+                    break
+            else:
+                db.session.expunge_all()
+
+            report['batches'] += 1
+            report['rows_moved'] += len(archived)
+            report['bytes_before'] += bytes_before
+            report['bytes_after'] += bytes_after
+
+        report['bytes_saved'] = report['bytes_before'] - report['bytes_after']
+        if report['bytes_after']:
+            report['compression_ratio'] = round(report['bytes_before'] / report['bytes_after'], 2)
+        report['duration_seconds'] = round((datetime.utcnow() - started).total_seconds(), 2)
+        self.logger.info(
+            f"Conversation archive{' (dry run)' if dry_run else ''}: {report['rows_moved']} rows older than "
+            f"{older_than_days} days, {report['bytes_before']} -> {report['bytes_after']} bytes "
+            f"({report['bytes_saved']} saved)"
+        )
+        return report
+
+    def get_archive_stats(self):
+        """Row counts of the hot and archive tables and the archive's raw/stored bytes"""
+        # LEN() on MSSQL is for strings; DATALENGTH() counts varbinary bytes
+        if db.session.get_bind().dialect.name == 'mssql':
+            stored_size = func.datalength(ConversationArchive.body)
+        else:
+            stored_size = func.length(ConversationArchive.body)
+        archived_rows, raw_bytes, stored_bytes = db.session.query(
+            func.count(ConversationArchive.id),
+            func.coalesce(func.sum(ConversationArchive.raw_size), 0),
+            func.coalesce(func.sum(stored_size), 0)
+        ).one()
+        return {
+            'hot_rows': db.session.query(func.count(Conversation.id)).scalar() or 0,
+            'archived_rows': int(archived_rows),
+            'archived_raw_bytes': int(raw_bytes),
+            'archived_stored_bytes': int(stored_bytes)
+        }
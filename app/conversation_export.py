@@ -0,0 +1,243 @@
+import csv
+import io
+import json
+import logging
+import os
+import secrets
+import shutil
+import tempfile
+import time
+from datetime import datetime
+from html import escape
+from flask import current_app
+from itsdangerous import BadSignature, URLSafeTimedSerializer
+from app import db
+from app.models import Conversation, ConversationArchive
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+_LINK_SALT = 'conversation-export'
+
+CSV_COLUMNS = ['id', 'created_at', 'user_message', 'bot_response', 'response_time', 'data_sources']
+
+
+def iter_conversations(user_id, session_pk=None, chunk_size=None):
+    """
+    Yield a user's (or one chat session's) conversations as dicts, oldest first,
+    starting with archived ones. Rows are fetched in server-side chunks of
+    chunk_size (yield_per) as plain column tuples, so memory stays flat however
+    long the history is.
+    """
+    chunk_size = chunk_size or current_app.config.get('EXPORT_CHUNK_SIZE', 500)
+
+    archived = db.session.query(
+        ConversationArchive.id,
+        ConversationArchive.created_at,
+        ConversationArchive.response_time,
+        ConversationArchive.codec,
+        ConversationArchive.body
+    ).filter(ConversationArchive.user_id == user_id)
+    if session_pk is not None:
+        archived = archived.filter(ConversationArchive.session_id == session_pk)
+    archived = archived.order_by(ConversationArchive.created_at.asc(), ConversationArchive.id.asc()).yield_per(chunk_size)
+
+    for conversation_id, created_at, response_time, codec, body in archived:
+        unpacked = ConversationArchive.unpack(body, codec)
+        yield {
+            'id': conversation_id,
+            'created_at': created_at.isoformat() if created_at else None,
+            'user_message': unpacked.get('user_message'),
+            'bot_response': unpacked.get('bot_response'),
+            'response_time': response_time,
+            'data_sources': unpacked.get('data_sources')
+        }
+
+    query = db.session.query(
+        Conversation.id,
+        Conversation.created_at,
+        Conversation.user_message,
+        Conversation.bot_response,
+        Conversation.response_time,
+        Conversation.data_sources
+    ).filter(Conversation.user_id == user_id)
+    if session_pk is not None:
+        query = query.filter(Conversation.session_id == session_pk)
+    query = query.order_by(Conversation.created_at.asc(), Conversation.id.asc()).yield_per(chunk_size)
+
+    for conversation_id, created_at, user_message, bot_response, response_time, data_sources in query:
+        yield {
+            'id': conversation_id,
+            'created_at': created_at.isoformat() if created_at else None,
+            'user_message': user_message,
+            'bot_response': bot_response,
+            'response_time': response_time,
+            'data_sources': data_sources
+        }
+
+
+def count_conversations(user_id, session_pk=None):
+    """Number of conversations an export would contain (hot and archived)"""
+    total = 0
+    for model in (Conversation, ConversationArchive):
+        query = db.session.query(db.func.count(model.id)).filter(model.user_id == user_id)
+        if session_pk is not None:
+            query = query.filter(model.session_id == session_pk)
+        total += query.scalar() or 0
+    return total
+
+
+# Renderers: each turns the conversation stream into a stream of text chunks
+def render_jsonl(conversations, **header):
+    for conv in conversations:
+        yield json.dumps(conv, default=str, ensure_ascii=False) + '\n'
+
+
+def render_csv(conversations, **header):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(CSV_COLUMNS)
+    for conv in conversations:
+        row = dict(conv, data_sources=json.dumps(conv['data_sources'], default=str) if conv['data_sources'] else '')
+        writer.writerow([row[column] for column in CSV_COLUMNS])
+        if buffer.tell() > 64 * 1024:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+    yield buffer.getvalue()
+
+
+def render_html(conversations, user_name='', date=''):
+    yield f'''<!DOCTYPE html>
+<html>
+<head>
+    <meta charset="utf-8">
+    <title>Conversation History - {escape(user_name)}</title>
+    <style>
+        body {{ font-family: Arial, sans-serif; line-height: 1.6; color: #333; max-width: 800px; margin: 0 auto; padding: 20px; background-color: #f5f5f5; }}
+        .header {{ background: linear-gradient(135deg, #667eea 0%, #764ba2 100%); color: white; padding: 25px; border-radius: 8px; text-align: center; margin-bottom: 30px; }}
+        .turn {{ margin-bottom: 20px; padding: 15px; background-color: #f8f9fa; border-radius: 5px; border-left: 4px solid #007bff; }}
+        .label {{ color: white; padding: 4px 8px; border-radius: 3px; font-size: 12px; font-weight: bold; }}
+        .message {{ margin: 10px 0; padding: 10px; background-color: white; border-radius: 4px; white-space: pre-wrap; }}
+        .meta {{ margin: 10px 0 0 0; font-size: 12px; color: #666; }}
+    </style>
+</head>
+<body>
+    <div class="header">
+        <h1 style="margin: 0;">💬 Conversation History</h1>
+        <p style="margin: 10px 0 0 0; opacity: 0.9;">{escape(user_name)} - {escape(date)}</p>
+    </div>
+'''
+    for conv in conversations:
+        # Bot responses are the app's own formatted HTML; user messages are escaped
+        yield f'''    <div class="turn">
+        <span class="label" style="background-color: #007bff;">YOU</span>
+        <div class="message">{escape(conv['user_message'] or '')}</div>
+        <span class="label" style="background-color: #28a745;">AI ASSISTANT</span>
+        <div class="message">{conv['bot_response'] or ''}</div>
+        <p class="meta"><em>{conv['created_at'] or ''} · Response time: {conv['response_time'] or 0:.2f}s</em></p>
+    </div>
+'''
+    yield '''</body>
+</html>
+'''
+
+
+# format -> (renderer, mimetype, file extension)
+EXPORT_FORMATS = {
+    'jsonl': (render_jsonl, 'application/x-ndjson', 'jsonl'),
+    'csv': (render_csv, 'text/csv', 'csv'),
+    'html': (render_html, 'text/html', 'html'),
+}
+
+
+def export_filename(user_name, fmt):
+    safe_name = ''.join(ch if ch.isalnum() else '_' for ch in (user_name or 'user')).strip('_') or 'user'
+    return f"conversation_{safe_name}_{datetime.utcnow().strftime('%Y%m%d_%H%M%S')}.{EXPORT_FORMATS[fmt][2]}"
+
+
+def stream_export(user_id, fmt='jsonl', session_pk=None, user_name=''):
+    """Text chunks of a conversation export, for an HTTP streaming response"""
+    renderer = EXPORT_FORMATS[fmt][0]
+    date = datetime.utcnow().strftime('%Y-%m-%d %H:%M:%S')
+    return renderer(iter_conversations(user_id, session_pk), user_name=user_name, date=date)
+
+
+def export_to_file(user_id, fmt='html', session_pk=None, user_name=''):
+    """
+    Write a conversation export chunk by chunk to a temp file.
+    Returns (path, size in bytes); the caller removes the file when done.
+    """
+    handle, path = tempfile.mkstemp(prefix='rb_export_', suffix=f".{EXPORT_FORMATS[fmt][2]}")
+    try:
+        with os.fdopen(handle, 'w', encoding='utf-8', newline='') as export_file:
+            for chunk in stream_export(user_id, fmt, session_pk, user_name):
+                export_file.write(chunk)
+        return path, os.path.getsize(path)
+    except Exception as e:
+        logger.error(f"Conversation export to file failed for user {user_id}: {str(e)}")
+        remove_export_file(path)
+        raise
+
+
+def remove_export_file(path):
+    try:
+        if path and os.path.exists(path):
+            os.remove(path)
+    except OSError as e:
+        logger.warning(f"Could not remove export file {path}: {str(e)}")
+
+
+def attachment_fits(export_size):
+    return export_size <= current_app.config.get('EXPORT_ATTACHMENT_MAX_BYTES', 5 * 1024 * 1024)
+
+
+# ----------------------------------------------------------------------------
+## STORED EXPORTS (too large to attach; served by a signed link)
+# ----------------------------------------------------------------------------
+
+def _storage_dir():
+    path = current_app.config.get('EXPORT_STORAGE_DIR') or os.path.join(current_app.instance_path, 'exports')
+    os.makedirs(path, exist_ok=True)
+    return path
+
+
+def _serializer():
+    return URLSafeTimedSerializer(current_app.config['SECRET_KEY'], salt=_LINK_SALT)
+
+
+def store_export(path, filename, content_type):
+    """
+    Move a finished export file into EXPORT_STORAGE_DIR and return a signed
+    token for it. The file outlives the user's history and session (e.g. after
+    /clear) and is removed once EXPORT_LINK_TTL has passed.
+    """
+    purge_expired_exports()
+    stored_name = f"{secrets.token_urlsafe(16)}.{os.path.splitext(path)[1].lstrip('.') or 'dat'}"
+    shutil.move(path, os.path.join(_storage_dir(), stored_name))
+    return _serializer().dumps({'file': stored_name, 'filename': filename, 'type': content_type})
+
+
+def load_stored_export(token):
+    """(path, download filename, content type) for a valid, unexpired token, else None"""
+    try:
+        data = _serializer().loads(token, max_age=current_app.config.get('EXPORT_LINK_TTL', 7 * 86400))
+    except BadSignature:
+        return None
+    path = os.path.join(_storage_dir(), os.path.basename(data['file']))
+    if not os.path.exists(path):
+        return None
+    return path, data['filename'], data['type']
+
+
+def purge_expired_exports():
+    """Delete stored exports older than EXPORT_LINK_TTL"""
+    cutoff = time.time() - current_app.config.get('EXPORT_LINK_TTL', 7 * 86400)
+    storage_dir = _storage_dir()
+    for name in os.listdir(storage_dir):
+        path = os.path.join(storage_dir, name)
+        try:
+            if os.path.isfile(path) and os.path.getmtime(path) < cutoff:
+                os.remove(path)
+        except OSError as e:
+            logger.warning(f"Could not remove expired export {path}: {str(e)}")
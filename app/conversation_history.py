@@ -0,0 +1,73 @@
+import base64
+import logging
+import threading
+from datetime import datetime
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+
+def encode_cursor(conversation):
+    """Opaque keyset cursor for a conversation row: its (created_at, id)"""
+    raw = f"{conversation.created_at.isoformat()}|{conversation.id}"
+    return base64.urlsafe_b64encode(raw.encode('utf-8')).decode('ascii')
+
+
+def decode_cursor(cursor):
+    """(created_at, id) from encode_cursor output; raises ValueError when malformed"""
+    try:
+        raw = base64.urlsafe_b64decode(cursor.encode('ascii')).decode('utf-8')
+        created_at, conversation_id = raw.rsplit('|', 1)
+        return datetime.fromisoformat(created_at), int(conversation_id)
+    except Exception:
+        raise ValueError(f"Invalid history cursor: {cursor!r}")
+
+
+class LazyConversationHistory:
+    """
+    Last N turns of a user's conversation, fetched on first use.
+
+    Behaves like a list of conversation dicts (oldest first) for the prompt
+    builders (truthiness, len, iteration, slicing), so a turn that never
+    builds a prompt from history never queries it. Rows are converted to
+    dicts so the history can be read from the turn worker thread as well.
+    """
+
+    def __init__(self, db_service, user_id, limit=10):
+        self.db_service = db_service
+        self.user_id = user_id
+        self.limit = limit
+        self._turns = None
+        self._lock = threading.Lock()
+
+    @property
+    def loaded(self):
+        return self._turns is not None
+
+    def _load(self):
+        if self._turns is None:
+            with self._lock:
+                if self._turns is None:
+                    try:
+                        conversations = self.db_service.get_recent_turns(user_id=self.user_id, limit=self.limit)
+                        self._turns = [conv.to_dict() for conv in conversations]
+                    except Exception as e:
+                        logger.error(f"Failed to load conversation history for user {self.user_id}: {str(e)}")
+                        self._turns = []
+        return self._turns
+
+    def __bool__(self):
+        return bool(self._load())
+
+    def __len__(self):
+        return len(self._load())
+
+    def __iter__(self):
+        return iter(self._load())
+
+    def __getitem__(self, index):
+        return self._load()[index]
+
+    def __repr__(self):
+        state = f"{len(self._turns)} turns" if self._turns is not None else 'not loaded'
+        return f'<LazyConversationHistory user={self.user_id} limit={self.limit} {state}>'
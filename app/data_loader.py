@@ -127,6 +127,10 @@ class DataLoader:
             
             # 1. Get raw search results from Tavily (Constrained by domains)
             client = TavilyClient(api_key=tavily_api_key)
+            base_url = current_app.config.get('TAVILY_BASE_URL')
+            if base_url:
+                suffix = '/search' if client.base_url.endswith('/search') else ''
+                client.base_url = base_url.rstrip('/') + suffix
             logger.info(f"🔎 Getting raw search results from Tavily for: {query}. Constrained to domains: {include_domains}")
             
             tavily_response = client.search(
@@ -1,8 +1,13 @@
 import logging
-from datetime import datetime
-from sqlalchemy import text, and_, or_
+from datetime import datetime, timedelta
+from flask import current_app
+from sqlalchemy import text, and_, or_, func, cast, Date
+from sqlalchemy.orm import joinedload
 from app import db
-from app.models import User, Warehouse, Product, Order, OrderItem, CartItem, ChatSession, Conversation, PendingOrderProducts
+from app.catalog_snapshot import get_snapshot_cache, to_snapshot
+from app.identity_cache import get_identity_cache, to_user_record, to_warehouse_record
+from app.read_replica import read_session
+from app.models import User, Warehouse, Product, Order, OrderItem, CartItem, ChatSession, Conversation, ConversationArchive, PendingOrderProducts
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
@@ -13,6 +18,14 @@ class DatabaseService:
     def __init__(self):
         self.logger = logger
     
+    def read_query(self, *entities):
+        """
+        Query for read-only results: on the read replica when this request may
+        use it (see read_replica.py), otherwise on the primary. Never modify
+        what it returns.
+        """
+        return read_session().query(*entities)
+    
     # User Management
     def get_user_by_email(self, email):
         """Get user by email"""
@@ -65,17 +78,66 @@ class DatabaseService:
             user.warehouse_location = warehouse_location
             user.last_verification = datetime.utcnow()
             db.session.commit()
+            self.invalidate_user_cache(user_id)
             return user
         return None
     
+    def get_user_record(self, user_id=None, email=None, phone=None, unique_id=None):
+        """
+        Read-only UserRecord by id, email, phone or unique_id, served from the
+        identity cache. Use User.query / get_user_by_* when the row will be modified.
+        """
+        for field, value in (('id', user_id), ('email', email), ('phone', phone), ('unique_id', unique_id)):
+            if value is not None:
+                break
+        else:
+            return None
+        cache = get_identity_cache(current_app.config)
+        if cache is None:
+            user = User.query.get(value) if field == 'id' else User.query.filter(getattr(User, field) == value).first()
+            return to_user_record(user) if user else None
+        return cache.get('user', field, value)
+    
+    def invalidate_user_cache(self, user_id=None):
+        """Drop cached user records (all when user_id is None), e.g. after bulk UPDATEs"""
+        cache = get_identity_cache(current_app.config)
+        if cache is not None:
+            cache.invalidate('user', None if user_id is None else [user_id])
+    
     # Warehouse Management
     def get_warehouses(self):
         """Get all active warehouses"""
         return Warehouse.query.filter_by(is_active=True).all()
     
     def get_warehouse_by_location(self, location_name):
-        """Get warehouse by location name"""
-        return Warehouse.query.filter_by(location_name=location_name, is_active=True).first()
+        """Get active warehouse by location name (read-only WarehouseRecord from the identity cache)"""
+        return self.get_warehouse_record(location_name=location_name)
+    
+    def get_warehouse_record(self, warehouse_id=None, location_name=None):
+        """Read-only WarehouseRecord of an active warehouse by id or location name"""
+        cache = get_identity_cache(current_app.config)
+        if warehouse_id is not None:
+            if cache is not None:
+                return cache.get('warehouse', 'id', warehouse_id, active_only=True)
+            warehouse = Warehouse.query.filter_by(id=warehouse_id, is_active=True).first()
+        elif location_name is not None:
+            if cache is not None:
+                return cache.get('warehouse', 'location_name', location_name, active_only=True)
+            warehouse = Warehouse.query.filter_by(location_name=location_name, is_active=True).first()
+        else:
+            return None
+        return to_warehouse_record(warehouse) if warehouse else None
+    
+    def invalidate_warehouse_cache(self, warehouse_id=None):
+        """Drop cached warehouse records (all when warehouse_id is None)"""
+        cache = get_identity_cache(current_app.config)
+        if cache is not None:
+            cache.invalidate('warehouse', None if warehouse_id is None else [warehouse_id])
+    
+    def get_identity_cache_stats(self):
+        """Hit/miss counters for the user/warehouse identity cache"""
+        cache = get_identity_cache(current_app.config)
+        return cache.get_stats() if cache is not None else {'enabled': False}
     
     def create_warehouse(self, location_name, address=None, city=None, state=None, country=None):
         """Create new warehouse"""
@@ -95,6 +157,21 @@ class DatabaseService:
         """Get products by warehouse"""
         return Product.query.filter_by(warehouse_id=warehouse_id).all()
     
+    def get_catalog_snapshot(self, warehouse_id):
+        """
+        Read-only product records for a warehouse, served from the in-memory
+        snapshot. Use get_products_by_warehouse when rows will be modified.
+        """
+        cache = get_snapshot_cache(current_app.config)
+        if cache is None:
+            return [to_snapshot(p) for p in self.get_products_by_warehouse(warehouse_id)]
+        return list(cache.get(warehouse_id))
+
+    def get_snapshot_stats(self):
+        """Hit/miss counters for the catalog snapshot cache"""
+        cache = get_snapshot_cache(current_app.config)
+        return cache.get_stats() if cache is not None else {'enabled': False}
+    
     def get_products_by_warehouse_location(self, warehouse_location):
         """Get products by warehouse location name"""
         warehouse = self.get_warehouse_by_location(warehouse_location)
@@ -109,16 +186,6 @@ class DatabaseService:
             warehouse_id=warehouse_id
         ).first()
     
-    def update_product_quantities(self, product_id, quantity_ordered):
-        """Update product quantities when order is placed"""
-        product = Product.query.get(product_id)
-        if product and product.available_for_sale >= quantity_ordered:
-            product.blocked_quantity += quantity_ordered
-            product.update_available_quantity()
-            db.session.commit()
-            return True
-        return False
-    
     def search_products(self, query, warehouse_id=None):
         """Search products by name or code"""
         search_filter = or_(
@@ -128,11 +195,11 @@ class DatabaseService:
         )
         
         if warehouse_id:
-            return Product.query.filter(
+            return self.read_query(Product).filter(
                 and_(search_filter, Product.warehouse_id == warehouse_id)
             ).all()
         else:
-            return Product.query.filter(search_filter).all()
+            return self.read_query(Product).filter(search_filter).all()
     
     # Order Management
     def create_order(self, user_id, warehouse_id, warehouse_location, user_email):
@@ -176,22 +243,30 @@ class DatabaseService:
     
     def get_orders_by_user(self, user_id):
         """Get orders by user"""
-        return Order.query.filter_by(user_id=user_id).order_by(Order.order_date.desc()).all()
+        return self.read_query(Order).filter_by(user_id=user_id).order_by(Order.order_date.desc()).all()
     
     def get_orders_by_email(self, email):
         """Get orders by email"""
-        return Order.query.filter_by(user_email=email).order_by(Order.order_date.desc()).all()
+        return self.read_query(Order).filter_by(user_email=email).order_by(Order.order_date.desc()).all()
     
     def get_order_by_id(self, order_id):
         """Get order by order ID"""
         return Order.query.filter_by(order_id=order_id).first()
     
+    def get_order_items_with_products(self, order_id):
+        """Get the items of an order (by primary key) with their products loaded in the same query"""
+        return OrderItem.query.options(joinedload(OrderItem.product)).filter_by(order_id=order_id).all()
+    
     def update_order_status(self, order_id, status):
         """Update order status"""
         order = Order.query.filter_by(order_id=order_id).first()
         if order:
+            was_cancelled = order.status == 'cancelled'
             order.status = status
             db.session.commit()
+            if status == 'cancelled' and not was_cancelled:
+                from app.sales_rollup import SalesRollupService
+                SalesRollupService().record_order_cancelled(order)
             return order
         return None
     
@@ -243,14 +318,12 @@ class DatabaseService:
                 self.logger.warning(f"No chat session found for session_id: {session_id}")
                 return True
             
-            # Delete conversations using the chat_session.id (integer)
-            conversations = Conversation.query.filter_by(session_id=chat_session.id).all()
-            
-            for conv in conversations:
-                db.session.delete(conv)
+            # Delete conversations using the chat_session.id (integer), in SQL rather than row by row
+            deleted = Conversation.query.filter_by(session_id=chat_session.id).delete(synchronize_session=False)
+            deleted += ConversationArchive.query.filter_by(session_id=chat_session.id).delete(synchronize_session=False)
             
             db.session.commit()
-            self.logger.info(f"Deleted {len(conversations)} conversations for session {session_id}")
+            self.logger.info(f"Deleted {deleted} conversations for session {session_id}")
             return True
             
         except Exception as e:
@@ -298,8 +371,52 @@ class DatabaseService:
             Conversation.created_at.desc()
         ).limit(limit).all()
     
-    def get_session_conversations(self, session_id):
-        """Get conversations for a session"""
+    def _latest_conversations(self, model, user_id=None, session_pk=None, before=None, limit=10):
+        """Newest-first rows of Conversation or ConversationArchive (same columns), keyset-filtered by `before`"""
+        query = self.read_query(model)
+        if user_id is not None:
+            query = query.filter(model.user_id == user_id)
+        if session_pk is not None:
+            query = query.filter(model.session_id == session_pk)
+        if before:
+            created_at, conversation_id = before
+            query = query.filter(or_(
+                model.created_at < created_at,
+                and_(model.created_at == created_at, model.id < conversation_id)
+            ))
+        return query.order_by(model.created_at.desc(), model.id.desc()).limit(limit).all()
+    
+    def _latest_with_archive(self, user_id=None, session_pk=None, before=None, limit=10):
+        """
+        Newest-first conversations, continuing into conversation_archives when the
+        hot table runs out (archived rows are always older than the hot ones).
+        """
+        conversations = self._latest_conversations(Conversation, user_id, session_pk, before, limit)
+        if len(conversations) < limit:
+            conversations += self._latest_conversations(
+                ConversationArchive, user_id, session_pk, before, limit - len(conversations)
+            )
+        return conversations
+    
+    def get_recent_turns(self, user_id=None, session_pk=None, limit=10):
+        """Last `limit` conversations of a user or chat session (ChatSession.id), oldest first"""
+        conversations = self._latest_with_archive(user_id, session_pk, limit=limit)
+        conversations.reverse()
+        return conversations
+    
+    def get_conversation_page(self, user_id, session_pk=None, before=None, limit=50):
+        """
+        One page of a user's conversations, newest first, using keyset pagination.
+        `before` is a (created_at, id) pair from the last row of the previous page,
+        so every page is an index seek rather than an OFFSET scan. Pages continue
+        into archived conversations once the hot ones are exhausted.
+        Returns (conversations, has_more).
+        """
+        conversations = self._latest_with_archive(user_id, session_pk, before, limit + 1)
+        return conversations[:limit], len(conversations) > limit
+    
+    def get_session_conversations(self, session_id, limit=None):
+        """Get conversations for a session (only the last `limit` when given), oldest first"""
         try:
             # First, find the chat session by session_id to get the integer ID
             chat_session = ChatSession.query.filter_by(session_id=session_id).first()
@@ -307,8 +424,14 @@ class DatabaseService:
                 self.logger.warning(f"No chat session found for session_id: {session_id}")
                 return []
             
-            # Query conversations using the chat_session.id (integer)
-            conversations = Conversation.query.filter_by(session_id=chat_session.id).order_by(
+            if limit:
+                return self.get_recent_turns(session_pk=chat_session.id, limit=limit)
+            
+            # Query conversations using the chat_session.id (integer); archived ones are the oldest
+            conversations = ConversationArchive.query.filter_by(session_id=chat_session.id).order_by(
+                ConversationArchive.created_at.asc()
+            ).all()
+            conversations += Conversation.query.filter_by(session_id=chat_session.id).order_by(
                 Conversation.created_at.asc()
             ).all()
             
@@ -348,14 +471,13 @@ class DatabaseService:
             {'location_name': 'Chennai East', 'city': 'Chennai', 'state': 'Tamil Nadu', 'country': 'India'}
         ]
         
-        for warehouse_data in warehouses:
-            existing = Warehouse.query.filter_by(location_name=warehouse_data['location_name']).first()
-            if not existing:
-                warehouse = Warehouse(**warehouse_data)
-                db.session.add(warehouse)
-        
-        db.session.commit()
-        self.logger.info("Warehouses initialized")
+        # One existence query and one bulk insert instead of a query per warehouse
+        existing = {name for (name,) in db.session.query(Warehouse.location_name).all()}
+        missing = [data for data in warehouses if data['location_name'] not in existing]
+        if missing:
+            db.session.bulk_insert_mappings(Warehouse, missing)
+            db.session.commit()
+        self.logger.info(f"Warehouses initialized ({len(missing)} created)")
     
     def create_sample_products(self):
         """Create sample products for testing with enhanced discount and scheme system"""
@@ -507,31 +629,33 @@ class DatabaseService:
             }
         ]
         
+        # One existence query for all warehouse x product pairs, then one bulk insert
+        from app.catalog_snapshot import mark_products_changed
+        codes = [product_data['product_code'] for product_data in sample_products]
+        existing = {
+            (warehouse_id, product_code)
+            for warehouse_id, product_code in db.session.query(Product.warehouse_id, Product.product_code)
+            .filter(Product.product_code.in_(codes)).all()
+        }
+        rows = []
         for warehouse in warehouses:
             for product_data in sample_products:
-                existing = Product.query.filter_by(
-                    product_code=product_data['product_code'],
-                    warehouse_id=warehouse.id
-                ).first()
-                
-                if not existing:
-                    product = Product(
-                        warehouse_id=warehouse.id,
-                        **product_data
-                    )
-                    # Ensure all quantity fields are properly initialized
-                    if product.product_quantity is None:
-                        product.product_quantity = 0
-                    if product.blocked_quantity is None:
-                        product.blocked_quantity = 0
-                    if product.available_for_sale is None:
-                        product.available_for_sale = 0
-                    
-                    product.update_available_quantity()
-                    db.session.add(product)
+                if (warehouse.id, product_data['product_code']) in existing:
+                    continue
+                # Quantity fields initialized as update_available_quantity() would
+                rows.append(dict(
+                    product_data,
+                    warehouse_id=warehouse.id,
+                    blocked_quantity=0,
+                    confirmed_quantity=0,
+                    available_for_sale=product_data['product_quantity']
+                ))
         
-        db.session.commit()
-        self.logger.info("Sample products created")
+        if rows:
+            db.session.bulk_insert_mappings(Product, rows)
+            mark_products_changed(db.session, {row['warehouse_id'] for row in rows})
+            db.session.commit()
+        self.logger.info(f"Sample products created ({len(rows)} new)")
     
     def create_sample_users(self):
         """Create sample users for testing"""
@@ -646,17 +770,24 @@ class DatabaseService:
             }
         ]
         
+        # One existence query and one bulk insert instead of a query per user
+        emails = [user_data['email'] for user_data in sample_users]
+        existing = {email for (email,) in db.session.query(User.email).filter(User.email.in_(emails)).all()}
+        rows = []
         for user_data in sample_users:
-            existing = User.query.filter_by(email=user_data['email']).first()
-            if not existing:
-                user = User(**user_data)
-                user.generate_unique_id()
-                user.is_verified = True
-                user.email_verified = True
-                db.session.add(user)
+            if user_data['email'] in existing:
+                continue
+            rows.append(dict(
+                user_data,
+                unique_id=User(user_type=user_data['user_type']).generate_unique_id(),
+                is_verified=True,
+                email_verified=True
+            ))
         
-        db.session.commit()
-        self.logger.info("Sample users created")
+        if rows:
+            db.session.bulk_insert_mappings(User, rows)
+            db.session.commit()
+        self.logger.info(f"Sample users created ({len(rows)} new)")
     
     def get_product_by_code(self, product_code):
         """Get product by product code"""
@@ -808,217 +939,245 @@ class DatabaseService:
                 'discount_amount': 0
             }
     
-    def update_product_quantities(self, product_quantities):
-        """Update product quantities after order selection"""
-        try:
-            for product_code, quantity in product_quantities.items():
-                product = Product.query.filter_by(product_code=product_code).first()
-                if product:
-                    # Reduce available quantity
-                    if product.available_for_sale >= quantity:
-                        product.available_for_sale -= quantity
-                        product.update_available_quantity()
-                    else:
-                        self.logger.warning(f"Insufficient stock for {product_code}: requested {quantity}, available {product.available_for_sale}")
+    def _product_not_in_warehouse_message(self, product_code, warehouse_id):
+        """Error message for a product with no stock at all in the requested warehouse"""
+        # Check if product exists in other warehouses
+        product_in_other_warehouse = Product.query.filter_by(
+            product_code=product_code,
+            is_active=True
+        ).filter(
+            Product.warehouse_id != warehouse_id
+        ).first()
+        
+        if product_in_other_warehouse:
+            other_warehouse = Warehouse.query.get(product_in_other_warehouse.warehouse_id)
+            warehouse_name = other_warehouse.location_name if other_warehouse else f"warehouse {product_in_other_warehouse.warehouse_id}"
+            self.logger.warning(f"Product {product_code} exists in {warehouse_name}, but not in requested warehouse {warehouse_id}")
+            # Get the requested warehouse name for better error message
+            requested_warehouse = Warehouse.query.get(warehouse_id)
+            requested_name = requested_warehouse.location_name if requested_warehouse else f"warehouse {warehouse_id}"
+            return f"Product {product_code} is not available in your warehouse ({requested_name}). It is available in {warehouse_name}. Please contact support to transfer stock or place order from the correct warehouse."
+        return f"Product {product_code} not found in any warehouse"
+    
+    def _plan_fefo_allocation(self, batches, available, product_code, warehouse_id, quantity_to_allocate, today):
+        """
+        FEFO allocation of one product in one warehouse from already-loaded batches.
+        Non-expired batches earliest expiry first (NULL expiry last), expired
+        batches only when there is no non-expired batch.
+        available maps batch id -> quantity still free in this plan and is only
+        decremented when the full quantity can be allocated; batches are not modified.
+        Returns (allocations, message); allocations is None on failure.
+        """
+        from datetime import date
+        
+        fefo_order = lambda b: (b.expiry_date is None, b.expiry_date or date.max)
+        candidates = sorted(
+            [b for b in batches if b.expiry_date is None or b.expiry_date >= today],
+            key=fefo_order
+        )
+        using_expired = False
+        
+        if not candidates:
+            candidates = sorted([b for b in batches if b.expiry_date and b.expiry_date < today], key=fefo_order)
+            if not candidates:
+                return None, self._product_not_in_warehouse_message(product_code, warehouse_id)
+            using_expired = True
+        
+        total_available = sum(available[batch.id] for batch in candidates if available[batch.id] > 0)
+        if total_available < quantity_to_allocate:
+            if using_expired:
+                return None, f"Insufficient expired stock for {product_code}. Available expired: {total_available}, Requested: {quantity_to_allocate}"
+            return None, f"Insufficient stock for {product_code}. Available: {total_available}, Requested: {quantity_to_allocate}"
+        
+        if using_expired:
+            self.logger.warning(f"⚠️ Using EXPIRED batches for {product_code} in warehouse {warehouse_id}. Available expired stock: {total_available}")
+        
+        allocations = []
+        remaining_quantity = quantity_to_allocate
+        for batch in candidates:
+            if remaining_quantity <= 0:
+                break
+            if available[batch.id] <= 0:
+                continue
             
-            db.session.commit()
-            return True
-        except Exception as e:
-            self.logger.error(f"Error updating product quantities: {str(e)}")
-            db.session.rollback()
+            allocate_from_batch = min(remaining_quantity, available[batch.id])
+            available[batch.id] -= allocate_from_batch
+            
+            allocation = {
+                'batch_id': batch.id,
+                'batch_number': batch.batch_number,
+                'expiry_date': batch.expiry_date.isoformat() if batch.expiry_date else None,
+                'quantity': allocate_from_batch,
+                'product_code': batch.product_code,
+                'product_name': batch.product_name,
+                'days_until_expiry': (batch.expiry_date - today).days if batch.expiry_date else None
+            }
+            if using_expired:
+                allocation['is_expired'] = True
+            allocations.append(allocation)
+            remaining_quantity -= allocate_from_batch
+        
+        return allocations, "Allocation successful (using expired stock)" if using_expired else "Allocation successful"
+    
+    def reserve_batch_quantity(self, batch_id, quantity):
+        """
+        Block quantity on one batch with a single guarded UPDATE.
+        The row only changes if it still has enough stock at write time, so two
+        concurrent orders can never both take the same units. Does not commit.
+        Returns True if reserved, False if the stock is no longer there.
+        """
+        updated = Product.query.filter(
+            Product.id == batch_id,
+            Product.is_active == True,
+            Product.available_for_sale >= quantity
+        ).update({
+            Product.blocked_quantity: Product.blocked_quantity + quantity,
+            Product.available_for_sale: Product.available_for_sale - quantity,
+            Product.updated_at: datetime.utcnow()
+        }, synchronize_session=False)
+        return updated == 1
+    
+    def release_batch_quantity(self, batch_id, quantity):
+        """Undo reserve_batch_quantity for one batch (does not commit)"""
+        Product.query.filter(Product.id == batch_id).update({
+            Product.blocked_quantity: Product.blocked_quantity - quantity,
+            Product.available_for_sale: Product.available_for_sale + quantity,
+            Product.updated_at: datetime.utcnow()
+        }, synchronize_session=False)
+    
+    def confirm_batch_quantity(self, batch_id, quantity):
+        """Move quantity from blocked to confirmed in one UPDATE (does not commit)"""
+        from app.catalog_snapshot import mark_products_changed
+        
+        batch = Product.query.get(batch_id)
+        if not batch:
             return False
+        # SET expressions read the pre-update values, so available_for_sale is unchanged
+        Product.query.filter(Product.id == batch_id).update({
+            Product.confirmed_quantity: Product.confirmed_quantity + quantity,
+            Product.blocked_quantity: Product.blocked_quantity - quantity,
+            Product.available_for_sale: Product.product_quantity - Product.blocked_quantity - Product.confirmed_quantity,
+            Product.updated_at: datetime.utcnow()
+        }, synchronize_session=False)
+        db.session.expire(batch, ['confirmed_quantity', 'blocked_quantity', 'available_for_sale', 'updated_at'])
+        mark_products_changed(db.session, [batch.warehouse_id])
+        return True
+    
+    def _reserve_allocations(self, line_allocations):
+        """
+        Apply planned allocations with guarded UPDATEs, one per batch.
+        On the first batch that no longer has the stock, the batches already
+        reserved in this call are released again and that batch id is returned.
+        Returns None when everything was reserved.
+        """
+        quantity_by_batch = {}
+        for allocations in line_allocations:
+            for allocation in allocations:
+                quantity_by_batch[allocation['batch_id']] = quantity_by_batch.get(allocation['batch_id'], 0) + allocation['quantity']
+        
+        reserved = []
+        # Fixed order so concurrent orders lock rows in the same sequence
+        for batch_id in sorted(quantity_by_batch):
+            if not self.reserve_batch_quantity(batch_id, quantity_by_batch[batch_id]):
+                for reserved_id in reserved:
+                    self.release_batch_quantity(reserved_id, quantity_by_batch[reserved_id])
+                return batch_id
+            reserved.append(batch_id)
+        return None
     
-    def allocate_quantity_fefo(self, product_code, warehouse_id, quantity_to_allocate):
+    def allocate_order_fefo(self, order_lines, warehouse_id, commit=True):
         """
-        Allocate quantity using FEFO (First Expiry, First Out) logic
-        Returns list of allocations with batch numbers and quantities
+        Allocate every line of an order using FEFO in a single transaction.
+        order_lines: list of dicts with product_code, quantity and an optional
+        fallback_warehouse_id (tried when the line can't be allocated in warehouse_id).
+        Candidate batches are loaded and locked once (UPDLOCK/ROWLOCK on MSSQL) and
+        allocations are computed in memory, then written with guarded UPDATEs that
+        only succeed while the stock is still there. If another order took the stock
+        in between, the plan is recomputed from fresh rows (bounded retries).
+        Returns (list of allocations per line, message). If any line fails the
+        session is rolled back and (None, message) is returned, so nothing is blocked.
         """
+        import random
+        import time
         from datetime import date
-        from sqlalchemy import or_
+        from app.catalog_snapshot import mark_products_changed
         
         try:
-            # Get all batches of this product in the warehouse
-            # Filter out expired batches and sort by expiry date (earliest first)
-            # Batches with NULL expiry_date go to the end (treated as never expiring)
             today = date.today()
+            product_codes = {line['product_code'] for line in order_lines}
+            warehouse_ids = {warehouse_id}
+            warehouse_ids.update(line['fallback_warehouse_id'] for line in order_lines if line.get('fallback_warehouse_id'))
+            max_retries = int(current_app.config.get('STOCK_RESERVATION_MAX_RETRIES', 3))
+            retry_delay = float(current_app.config.get('STOCK_RESERVATION_RETRY_DELAY', 0.05))
             
-            # Get all batches, filtering out expired ones
-            all_batches = Product.query.filter_by(
-                product_code=product_code,
-                warehouse_id=warehouse_id,
-                is_active=True
-            ).filter(
-                or_(
-                    Product.expiry_date >= today,
-                    Product.expiry_date.is_(None)
-                )
-            ).all()
-            
-            # Sort batches: those with expiry_date first (earliest first), then NULL expiry_date ones
-            batches = sorted(
-                all_batches,
-                key=lambda b: (b.expiry_date is None, b.expiry_date or date.max)
-            )
-            
-            # FEFO VERIFICATION LOGGING
-            self.logger.info(f"=== FEFO ALLOCATION START ===")
-            self.logger.info(f"Product: {product_code}, Warehouse: {warehouse_id}, Requested: {quantity_to_allocate}")
-            self.logger.info(f"Total batches found: {len(batches)}")
-            
-            # Log all batches with their expiry dates for verification
-            for idx, batch in enumerate(batches):
-                expiry_str = batch.expiry_date.isoformat() if batch.expiry_date else "No expiry (NULL)"
-                days_until_expiry = (batch.expiry_date - today).days if batch.expiry_date else "N/A"
-                self.logger.info(f"  Batch #{idx+1}: {batch.batch_number} | Expiry: {expiry_str} | Days until expiry: {days_until_expiry} | Available: {batch.available_for_sale}")
-            
-            if not batches:
-                self.logger.warning(f"No non-expired batches found for product {product_code} in warehouse {warehouse_id}")
-                # Check if product exists in this warehouse but is expired
-                expired_batches_raw = Product.query.filter_by(
-                    product_code=product_code,
-                    warehouse_id=warehouse_id,
-                    is_active=True
-                ).filter(
-                    Product.expiry_date.isnot(None),
-                    Product.expiry_date < today
-                ).all()
+            for attempt in range(max_retries + 1):
+                batches_by_key = {}
+                batches = []
+                if product_codes:
+                    # populate_existing: batches already in the session take the values read under the lock
+                    batches = Product.query.with_hint(
+                        Product, 'WITH (UPDLOCK, ROWLOCK)', 'mssql'
+                    ).populate_existing().filter(
+                        Product.product_code.in_(list(product_codes)),
+                        Product.warehouse_id.in_(list(warehouse_ids)),
+                        Product.is_active == True
+                    ).all()
+                    for batch in batches:
+                        batches_by_key.setdefault((batch.warehouse_id, batch.product_code), []).append(batch)
+                available = {batch.id: batch.available_for_sale or 0 for batch in batches}
                 
-                if expired_batches_raw:
-                    # Use expired batches as fallback (still follow FEFO - earliest expired first)
-                    expired_batches = sorted(
-                        expired_batches_raw,
-                        key=lambda b: (b.expiry_date is None, b.expiry_date or date.max)
+                self.logger.info(f"FEFO order allocation: {len(order_lines)} lines, {len(batches)} candidate batches in warehouses {sorted(warehouse_ids)} (attempt {attempt + 1})")
+                
+                results = []
+                for line in order_lines:
+                    product_code = line['product_code']
+                    quantity = line['quantity']
+                    allocations, message = self._plan_fefo_allocation(
+                        batches_by_key.get((warehouse_id, product_code), []),
+                        available, product_code, warehouse_id, quantity, today
                     )
-                    earliest_expiry = min(batch.expiry_date for batch in expired_batches if batch.expiry_date)
-                    days_expired = (today - earliest_expiry).days
-                    total_expired_stock = sum(batch.available_for_sale for batch in expired_batches if batch.available_for_sale > 0)
-                    self.logger.warning(f"⚠️ Using EXPIRED batches for {product_code} in warehouse {warehouse_id} (expired {days_expired} days ago). Available expired stock: {total_expired_stock}")
-                    
-                    if total_expired_stock < quantity_to_allocate:
-                        return None, f"Insufficient expired stock for {product_code}. Available expired: {total_expired_stock}, Requested: {quantity_to_allocate}"
                     
-                    # Allocate from expired batches using FEFO
-                    allocations = []
-                    remaining_quantity = quantity_to_allocate
+                    # If not found in the requested warehouse, try the line's fallback warehouse
+                    fallback_warehouse_id = line.get('fallback_warehouse_id')
+                    if not allocations and fallback_warehouse_id and fallback_warehouse_id != warehouse_id:
+                        self.logger.warning(f"Product {product_code} not allocatable in warehouse {warehouse_id}, trying product's warehouse ({fallback_warehouse_id})")
+                        allocations, message = self._plan_fefo_allocation(
+                            batches_by_key.get((fallback_warehouse_id, product_code), []),
+                            available, product_code, fallback_warehouse_id, quantity, today
+                        )
                     
-                    for batch_idx, batch in enumerate(expired_batches):
-                        if remaining_quantity <= 0:
-                            break
-                        
-                        available_in_batch = batch.available_for_sale
-                        if available_in_batch <= 0:
-                            continue
-                        
-                        allocate_from_batch = min(remaining_quantity, available_in_batch)
-                        batch.blocked_quantity += allocate_from_batch
-                        batch.update_available_quantity()
-                        
-                        expiry_str = batch.expiry_date.isoformat() if batch.expiry_date else "No expiry"
-                        days_until = (batch.expiry_date - today).days if batch.expiry_date else None
-                        self.logger.warning(f"⚠️ FEFO ALLOCATION FROM EXPIRED: Batch #{batch_idx+1} {batch.batch_number} | Allocated: {allocate_from_batch} | Expires: {expiry_str} | Days expired: {abs(days_until) if days_until else 'N/A'} | Remaining to allocate: {remaining_quantity}")
-                        
-                        allocations.append({
-                            'batch_id': batch.id,
-                            'batch_number': batch.batch_number,
-                            'expiry_date': batch.expiry_date.isoformat() if batch.expiry_date else None,
-                            'quantity': allocate_from_batch,
-                            'product_code': batch.product_code,
-                            'product_name': batch.product_name,
-                            'days_until_expiry': days_until,
-                            'is_expired': True
-                        })
-                        
-                        remaining_quantity -= allocate_from_batch
+                    if not allocations:
+                        self.logger.error(f"FEFO allocation failed for {product_code}: {message}")
+                        db.session.rollback()
+                        return None, message
                     
-                    db.session.commit()
-                    self.logger.warning(f"⚠️ FEFO: Successfully allocated all {quantity_to_allocate} units from EXPIRED batches")
-                    
-                    return allocations, "Allocation successful (using expired stock)"
-                
-                # Check if product exists in other warehouses
-                product_in_other_warehouse = Product.query.filter_by(
-                    product_code=product_code,
-                    is_active=True
-                ).filter(
-                    Product.warehouse_id != warehouse_id
-                ).first()
+                    batch_info = ", ".join(f"Batch {a['batch_number']} ({a['quantity']} units, expires: {a['expiry_date']})" for a in allocations)
+                    self.logger.info(f"FEFO allocation for {product_code}: {batch_info}")
+                    results.append(allocations)
                 
-                if product_in_other_warehouse:
-                    other_warehouse = Warehouse.query.get(product_in_other_warehouse.warehouse_id)
-                    warehouse_name = other_warehouse.location_name if other_warehouse else f"warehouse {product_in_other_warehouse.warehouse_id}"
-                    self.logger.warning(f"Product {product_code} exists in {warehouse_name}, but not in requested warehouse {warehouse_id}")
-                    # Get the requested warehouse name for better error message
-                    requested_warehouse = Warehouse.query.get(warehouse_id)
-                    requested_name = requested_warehouse.location_name if requested_warehouse else f"warehouse {warehouse_id}"
-                    return None, f"Product {product_code} is not available in your warehouse ({requested_name}). It is available in {warehouse_name}. Please contact support to transfer stock or place order from the correct warehouse."
-                else:
-                    return None, f"Product {product_code} not found in any warehouse"
-            
-            # Calculate total available across all batches
-            total_available = sum(batch.available_for_sale for batch in batches if batch.available_for_sale > 0)
-            self.logger.info(f"Total available stock: {total_available}")
-            
-            if total_available < quantity_to_allocate:
-                self.logger.warning(f"FEFO: Insufficient stock. Available: {total_available}, Requested: {quantity_to_allocate}")
-                return None, f"Insufficient stock for {product_code}. Available: {total_available}, Requested: {quantity_to_allocate}"
-            
-            allocations = []
-            remaining_quantity = quantity_to_allocate
-            self.logger.info(f"Starting allocation - remaining to allocate: {remaining_quantity}")
-            
-            # Allocate from earliest expiring batches first
-            for batch_idx, batch in enumerate(batches):
-                if remaining_quantity <= 0:
+                conflict_batch_id = self._reserve_allocations(results)
+                if conflict_batch_id is None:
                     break
                 
-                available_in_batch = batch.available_for_sale
-                if available_in_batch <= 0:
-                    continue
-                
-                # Allocate as much as possible from this batch
-                allocate_from_batch = min(remaining_quantity, available_in_batch)
-                
-                # Block the quantity
-                batch.blocked_quantity += allocate_from_batch
-                batch.update_available_quantity()
-                
-                expiry_str = batch.expiry_date.isoformat() if batch.expiry_date else "No expiry"
-                days_until = (batch.expiry_date - today).days if batch.expiry_date else None
-                self.logger.info(f"FEFO ALLOCATION: Batch #{batch_idx+1} {batch.batch_number} | Allocated: {allocate_from_batch} | Expires: {expiry_str} | Days until expiry: {days_until} | Remaining to allocate: {remaining_quantity}")
-                
-                allocations.append({
-                    'batch_id': batch.id,
-                    'batch_number': batch.batch_number,
-                    'expiry_date': batch.expiry_date.isoformat() if batch.expiry_date else None,
-                    'quantity': allocate_from_batch,
-                    'product_code': batch.product_code,
-                    'product_name': batch.product_name,
-                    'days_until_expiry': days_until
-                })
-                
-                remaining_quantity -= allocate_from_batch
-            
-            db.session.commit()
-            
-            if remaining_quantity > 0:
-                self.logger.warning(f"FEFO: Could not allocate full quantity. Remaining: {remaining_quantity}")
+                self.logger.warning(f"Stock of batch {conflict_batch_id} changed while reserving (attempt {attempt + 1}/{max_retries + 1})")
+                if attempt < max_retries:
+                    time.sleep(retry_delay * (attempt + 1) * random.uniform(0.5, 1.5))
             else:
-                self.logger.info(f"FEFO: Successfully allocated all {quantity_to_allocate} units")
+                db.session.rollback()
+                return None, "Stock changed while placing the order. Please try again."
             
-            # FEFO VERIFICATION SUMMARY
-            self.logger.info(f"=== FEFO ALLOCATION COMPLETE ===")
-            self.logger.info(f"Total batches used: {len(allocations)}")
-            for alloc in allocations:
-                self.logger.info(f"  - {alloc['quantity']} units from batch {alloc['batch_number']} (expires: {alloc['expiry_date']}, days until: {alloc.get('days_until_expiry', 'N/A')})")
+            # The guarded UPDATEs bypass the ORM: reload quantities on next access
+            # and invalidate the catalog snapshots of these warehouses on commit
+            for batch in batches:
+                db.session.expire(batch, ['blocked_quantity', 'available_for_sale', 'updated_at'])
+            mark_products_changed(db.session, {batch.warehouse_id for batch in batches})
             
-            return allocations, "Allocation successful"
+            if commit:
+                db.session.commit()
+            return results, "Allocation successful"
             
         except Exception as e:
-            error_msg = str(e)
-            self.logger.error(f"Error in FEFO allocation for {product_code}: {error_msg}")
-            # Check if it's a database connection error
-            if 'Connection' in error_msg or 'pymssql' in error_msg.lower() or 'InterfaceError' in error_msg:
-                self.logger.error(f"Database connection error detected. Please check database connectivity.")
+            self.logger.error(f"Error in FEFO order allocation: {str(e)}")
             db.session.rollback()
             return None, f"Error allocating products: {str(e)}"
     
@@ -1084,6 +1243,24 @@ class DatabaseService:
         """Get user's cart items"""
         return CartItem.query.filter_by(user_id=user_id).all()
     
+    def get_cart_items_with_products(self, user_id):
+        """Get user's cart items with their products loaded in the same query"""
+        return CartItem.query.options(joinedload(CartItem.product)).filter_by(user_id=user_id).all()
+    
+    def get_batches_by_product_codes(self, product_codes, warehouse_id):
+        """Get all active batches of the given product codes in a warehouse, grouped by product code"""
+        batches_by_code = {code: [] for code in product_codes}
+        if not batches_by_code:
+            return batches_by_code
+        batches = Product.query.filter(
+            Product.product_code.in_(list(batches_by_code)),
+            Product.warehouse_id == warehouse_id,
+            Product.is_active == True
+        ).all()
+        for batch in batches:
+            batches_by_code[batch.product_code].append(batch)
+        return batches_by_code
+    
     def update_cart_item_quantity(self, cart_item_id, quantity):
         """Update cart item quantity"""
         try:
@@ -1188,7 +1365,7 @@ class DatabaseService:
         warehouse = distributor_user.nearest_warehouse
         
         # Build query
-        query = Order.query.filter(Order.warehouse_location == warehouse)
+        query = self.read_query(Order).filter(Order.warehouse_location == warehouse)
         
         # Apply status filter
         if status_filter:
@@ -1282,4 +1459,122 @@ class DatabaseService:
         except Exception as e:
             self.logger.error(f"Error marking pending order as notified: {str(e)}")
             db.session.rollback()
-            return None
\ No newline at end of file
+            return None
+    
+    # Analytics (aggregated in the database; only summary rows are returned)
+    def order_day_expression(self):
+        """Order date truncated to the day, per dialect"""
+        if db.session.get_bind().dialect.name == 'sqlite':
+            return func.date(Order.order_date)
+        return cast(Order.order_date, Date)
+    
+    def get_order_status_breakdown(self, warehouse_location):
+        """Order count and amount per (status, order_stage) for a warehouse"""
+        rows = self.read_query(
+            Order.status,
+            Order.order_stage,
+            func.count(Order.id),
+            func.coalesce(func.sum(Order.total_amount), 0)
+        ).filter(
+            Order.warehouse_location == warehouse_location
+        ).group_by(Order.status, Order.order_stage).all()
+        return [{
+            'status': status,
+            'order_stage': order_stage,
+            'orders': count,
+            'total_amount': round(float(total or 0), 2)
+        } for status, order_stage, count, total in rows]
+    
+    def get_revenue_by_day(self, warehouse_location, days=30):
+        """Orders and revenue per day over the last `days` days (cancelled orders excluded)"""
+        since = datetime.utcnow() - timedelta(days=days)
+        day = self.order_day_expression().label('day')
+        rows = self.read_query(
+            day,
+            func.count(Order.id),
+            func.coalesce(func.sum(Order.total_amount), 0)
+        ).filter(
+            Order.warehouse_location == warehouse_location,
+            Order.order_date >= since,
+            Order.status != 'cancelled'
+        ).group_by(day).order_by(day).all()
+        return [{
+            'date': str(order_day),
+            'orders': count,
+            'revenue': round(float(total or 0), 2)
+        } for order_day, count, total in rows]
+    
+    def get_product_sales(self, warehouse_location, days=None, limit=10):
+        """Units, free units, revenue and order count per product, best sellers first"""
+        revenue = func.coalesce(func.sum(OrderItem.total_price), 0)
+        query = self.read_query(
+            OrderItem.product_code,
+            func.max(Product.product_name),
+            func.coalesce(func.sum(OrderItem.product_quantity_ordered), 0),
+            func.coalesce(func.sum(OrderItem.free_quantity), 0),
+            revenue,
+            func.count(func.distinct(OrderItem.order_id))
+        ).join(
+            Order, Order.id == OrderItem.order_id
+        ).outerjoin(
+            Product, Product.id == OrderItem.product_id
+        ).filter(
+            Order.warehouse_location == warehouse_location,
+            Order.status != 'cancelled'
+        )
+        if days:
+            query = query.filter(Order.order_date >= datetime.utcnow() - timedelta(days=days))
+        rows = query.group_by(OrderItem.product_code).order_by(revenue.desc()).limit(limit).all()
+        return [{
+            'product_code': product_code,
+            'product_name': product_name or product_code,
+            'units': int(units or 0),
+            'free_units': int(free_units or 0),
+            'revenue': round(float(total or 0), 2),
+            'orders': orders
+        } for product_code, product_name, units, free_units, total, orders in rows]
+    
+    def get_pending_quantities(self, warehouse_location):
+        """Quantity waiting for stock per product"""
+        rows = self.read_query(
+            PendingOrderProducts.product_code,
+            func.max(PendingOrderProducts.product_name),
+            func.coalesce(func.sum(PendingOrderProducts.requested_quantity), 0),
+            func.count(PendingOrderProducts.id)
+        ).filter(
+            PendingOrderProducts.warehouse_location == warehouse_location,
+            PendingOrderProducts.status == 'pending'
+        ).group_by(PendingOrderProducts.product_code).all()
+        return [{
+            'product_code': product_code,
+            'product_name': product_name,
+            'requested_quantity': int(quantity or 0),
+            'requests': count
+        } for product_code, product_name, quantity, count in rows]
+    
+    def get_distributor_analytics(self, warehouse_location, days=30, top_limit=10):
+        """All distributor analytics aggregates for one warehouse"""
+        status_breakdown = self.get_order_status_breakdown(warehouse_location)
+        status_totals = {}
+        for row in status_breakdown:
+            status_totals[row['status']] = status_totals.get(row['status'], 0) + row['orders']
+        
+        # Sales figures come from the daily rollups when they are maintained
+        sales_source = self
+        if current_app.config.get('SALES_ROLLUP_ENABLED', True):
+            from app.sales_rollup import SalesRollupService
+            sales_source = SalesRollupService()
+        revenue_by_day = sales_source.get_revenue_by_day(warehouse_location, days=days)
+        return {
+            'warehouse_location': warehouse_location,
+            'total_orders': sum(row['orders'] for row in status_breakdown),
+            'total_revenue': round(sum(row['total_amount'] for row in status_breakdown if row['status'] != 'cancelled'), 2),
+            'orders_by_status': status_totals,
+            'orders_by_status_and_stage': status_breakdown,
+            'period_days': days,
+            'period_revenue': round(sum(row['revenue'] for row in revenue_by_day), 2),
+            'revenue_by_day': revenue_by_day,
+            'top_products': sales_source.get_product_sales(warehouse_location, days=days, limit=top_limit),
+            'top_products_all_time': sales_source.get_product_sales(warehouse_location, limit=top_limit),
+            'pending_quantities': self.get_pending_quantities(warehouse_location)
+        }
@@ -1,4 +1,5 @@
 import logging
+from datetime import datetime
 from flask import current_app, render_template_string
 from flask_mail import Message
 from app import mail, db
@@ -7,8 +8,8 @@ from app.models import EmailLog
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-def send_email(to_email, subject, html_content, email_type='general'):
-    """Send email via SMTP"""
+def send_email(to_email, subject, html_content, email_type='general', attachments=None):
+    """Send email via SMTP; attachments is a list of (filename, content_type, file path)"""
     try:
         msg = Message(
             subject=subject,
@@ -16,6 +17,9 @@ def send_email(to_email, subject, html_content, email_type='general'):
             html=html_content,
             sender=current_app.config['MAIL_DEFAULT_SENDER']
         )
+        for filename, content_type, path in attachments or []:
+            with open(path, 'rb') as attachment:
+                msg.attach(filename, content_type, attachment.read())
         
         mail.send(msg)
         
@@ -387,4 +391,60 @@ def send_conversation_email(user_email, admin_email, conversation_data):
     send_email(user_email, subject, html_content, 'conversation')
     
     # Send to admin with [Admin] prefix
-    send_email(admin_email, f'[Admin] {subject}', html_content, 'conversation_admin')
\ No newline at end of file
+    send_email(admin_email, f'[Admin] {subject}', html_content, 'conversation_admin')
+
+def send_conversation_export_email(user_email, admin_email, user_name, export_path, export_size, conversation_count,
+                                   filename, content_type, download_url=None, link_days=None):
+    """
+    Send a conversation export (written by app.conversation_export) to user and admin.
+    With download_url (a signed link to the stored export, for files over
+    EXPORT_ATTACHMENT_MAX_BYTES) the email links to it; otherwise the file is attached.
+    """
+    date = datetime.utcnow().strftime('%Y-%m-%d %H:%M:%S')
+    subject = f'Conversation Summary - {date}'
+    attach = not download_url
+    size_mb = export_size / (1024 * 1024)
+    
+    if attach:
+        delivery_html = f'<p>Your full conversation history is attached as <strong>{filename}</strong>.</p>'
+    else:
+        delivery_html = f'''
+        <p>Your conversation history is too large to attach ({size_mb:.1f} MB).</p>
+        <p style="text-align: center;">
+            <a href="{download_url}" style="background-color: #007bff; color: white; padding: 10px 20px; border-radius: 5px; text-decoration: none;">Download conversation history</a>
+        </p>
+        <p style="font-size: 12px; color: #666;">The link works without signing in and expires in {link_days or 7} days.</p>
+        '''
+    
+    html_content = f'''
+    <!DOCTYPE html>
+    <html>
+    <body style="font-family: Arial, sans-serif; line-height: 1.6; color: #333; max-width: 800px; margin: 0 auto; padding: 20px;">
+        <div style="background: linear-gradient(135deg, #667eea 0%, #764ba2 100%); color: white; padding: 25px; border-radius: 8px; text-align: center; margin-bottom: 30px;">
+            <h1 style="margin: 0;">📊 Conversation Summary</h1>
+            <p style="margin: 10px 0 0 0; opacity: 0.9;">Your AI Chat History</p>
+        </div>
+        
+        <p><strong>User:</strong> {user_name}<br>
+        <strong>📧 Email:</strong> {user_email}<br>
+        <strong>Total Messages:</strong> {conversation_count}<br>
+        <strong>Date:</strong> {date}</p>
+        
+        {delivery_html}
+        
+        <hr style="margin: 30px 0; border: none; border-top: 2px solid #e9ecef;">
+        
+        <p style="text-align: center; color: #666; font-size: 14px;">
+            This is an automated email from Quantum Blue. Please do not reply.<br>
+            <em>Generated on {date}</em>
+        </p>
+    </body>
+    </html>
+    '''
+    attachments = [(filename, content_type, export_path)] if attach else None
+    
+    # Send to user
+    send_email(user_email, subject, html_content, 'conversation', attachments=attachments)
+    
+    # Send to admin with [Admin] prefix
+    send_email(admin_email, f'[Admin] {subject}', html_content, 'conversation_admin', attachments=attachments)
@@ -1,4 +1,4 @@
-from flask import Blueprint, render_template, request, jsonify, session, current_app, make_response
+from flask import Blueprint, render_template, request, jsonify, session, current_app, make_response, g
 from app import db 
 from app.models import Conversation, User, Warehouse, Product, Order, ChatSession, CartItem
 from app.database_service import DatabaseService
@@ -8,6 +8,11 @@ from app.enhanced_order_service import EnhancedOrderService
 from app.llm_order_service import LLMOrderService
 from app.pricing_service import PricingService
 from app.groq_service import GroqService 
+from app.intent_classifier import INTENT_TIER_TAG
+from app.llm_metrics import loads_llm_json
+from app.streaming import stream_text_response, json_to_sse_response
+from app.concurrency import submit_with_app_context
+from app.conversation_history import LazyConversationHistory
 from app.email_utils import send_otp_email, send_conversation_email
 import logging
 import time
@@ -287,7 +292,7 @@ def process_message():
         if state == 'ask_intent':
             # Use LLM to understand what user wants to do
             db_service = get_db_service()
-            user = User.query.get(session.get('user_id'))
+            user = db_service.get_user_record(session.get('user_id'))
             
             llm_service = get_llm_service()
             if llm_service and llm_service.client:
@@ -310,21 +315,18 @@ Respond with ONLY a JSON object:
 }}"""
 
                 try:
-                    response = llm_service.client.chat.completions.create(
-                        model=current_app.config.get('GROQ_MODEL', 'llama-3.3-70b-versatile'),
+                    result_text = llm_service.chat_completion(
                         messages=[{"role": "user", "content": intent_prompt}],
                         temperature=0.1,
                         max_tokens=200
-                    )
-                    
-                    result_text = response.choices[0].message.content.strip()
+                    ).strip()
                     # Clean JSON response
                     if result_text.startswith('```'):
                         lines = result_text.split('\n')
                         if len(lines) > 2:
                             result_text = '\n'.join(lines[1:-1])
                     
-                    intent_result = json.loads(result_text)
+                    intent_result = loads_llm_json(result_text, current_app.config)
                     detected_intent = intent_result.get('intent', 'OTHER')
                     next_state = intent_result.get('next_state', 'continue_conversation')
                     
@@ -344,7 +346,7 @@ Respond with ONLY a JSON object:
                     elif detected_intent == 'PRODUCT_INFO':
                         # Show available products
                         warehouse = db_service.get_warehouse_by_location(user.nearest_warehouse) if user.nearest_warehouse else None
-                        products = db_service.get_products_by_warehouse(warehouse.id) if warehouse else db_service.get_products_by_warehouse(1)  # Fallback to warehouse 1
+                        products = db_service.get_catalog_snapshot(warehouse.id) if warehouse else db_service.get_catalog_snapshot(1)  # Fallback to warehouse 1
                         product_list = "\n".join([f"• {p.product_name} ({p.product_code}) - ${p.price_of_product} - Available: {p.available_for_sale}" for p in products[:10]])
                         return jsonify({
                             'response': f'Here are our available products:\n\n{product_list}\n\nWould you like to place an order for any of these products?'
@@ -385,15 +387,37 @@ Respond with ONLY a JSON object:
 
         # Get services
         db_service = get_db_service()
-        classification_service = get_classification_service()
         web_search_service = get_web_search_service()
         enhanced_order_service = get_enhanced_order_service()
         llm_order_service = get_llm_order_service()
         pricing_service = get_pricing_service()
 
-        # Get user context
-        user = User.query.get(session_user_id)
         warehouse_location = session.get('warehouse_location')
+
+        # Conversation history feeds the turn analysis and order prompts; it is only
+        # queried the first time one of them reads it (oldest first, last 10 turns)
+        conversation_history = LazyConversationHistory(db_service, session_user_id, limit=10)
+
+        # Get cart items to check if user has items to confirm
+        cart_items = db_service.get_cart_items(session_user_id)
+
+        # One fused analysis call: intent, cart action, products and order IDs.
+        # It runs on a worker thread while the remaining context is loaded below.
+        analysis_args = dict(
+            user_id=session_user_id,
+            context_data={'user_warehouse': warehouse_location},
+            conversation_history=conversation_history,
+            has_cart=bool(cart_items)
+        )
+        analysis_future = None
+        if current_app.config.get('TURN_CONCURRENCY_ENABLED', True):
+            try:
+                analysis_future = submit_with_app_context(llm_order_service.analyze_turn, user_message, **analysis_args)
+            except Exception as e:
+                logger.warning(f"Could not start concurrent turn analysis, running inline: {str(e)}")
+
+        # Get user context
+        user = db_service.get_user_record(session_user_id)
         
         # Get user's warehouse
         warehouse = db_service.get_warehouse_by_location(warehouse_location)
@@ -408,115 +432,42 @@ Respond with ONLY a JSON object:
         recent_orders = db_service.get_orders_by_email(user.email)
         context_data['recent_orders'] = recent_orders[:3]
 
-        # Get conversation history
-        conversation_history = db_service.get_conversation_history(session_user_id, limit=10)
+        if analysis_future is not None:
+            try:
+                turn_analysis = analysis_future.result(timeout=current_app.config.get('TURN_ANALYSIS_TIMEOUT', 30))
+            except Exception as e:
+                logger.error(f"Concurrent turn analysis failed: {str(e)}")
+                turn_analysis = llm_order_service._analyze_turn_fallback(user_message, bool(cart_items))
+        else:
+            turn_analysis = llm_order_service.analyze_turn(user_message, **analysis_args)
 
-        # Use LLM to analyze if user wants to confirm order or add products
-        # Get cart items to check if user has items to confirm
-        cart_items = db_service.get_cart_items(session_user_id)
-        
-        # If user has items in cart, use LLM to determine intent
+        # If user has items in cart, the cart action decides confirmation/listing first
         if cart_items:
-            llm_service = get_llm_service()
-            if llm_service and llm_service.client:
-                try:
-                    intent_prompt = f"""You are an AI assistant analyzing user intent in an e-commerce chatbot.
-
-User's message: "{user_message}"
-
-Context:
-- The user has items in their shopping cart
-- The system just showed them their cart with total price
-
-Determine the user's intent:
-
-1. **CONFIRM_ORDER** - User wants to place/confirm/finalize the order for items already in cart
-   Examples: "confirm my order", "place the order", "proceed", "yes", "ok", "go ahead", "finalize"
-   
-2. **ADD_TO_CART** - User wants to add more products to the cart
-   Examples: "add 5 quantum sensors", "ok add more items", "put 10 processors", "include product 001"
-   
-3. **MODIFY_CART** - User wants to modify existing cart items (remove, update quantity)
-   Examples: "remove product x", "change quantity", "update cart"
-
-4. **PRODUCT_INFO** - User wants to see product information or list products
-   Examples: "list all products", "show products available", "what products do you have", "list products in database"
-
-5. **DATABASE_QUERY** - User wants to query database for specific information
-   Examples: "show me all products in database", "list available products", "what's in stock"
-
-Important Rules:
-- If message asks to "list", "show", "display" products/database → PRODUCT_INFO or DATABASE_QUERY
-- If message contains product names/codes AND action words like "add", "put", "include" → ADD_TO_CART
-- If message is a simple confirmation like "ok", "yes", "proceed" WITHOUT product mentions → CONFIRM_ORDER
-- If message explicitly says "confirm order", "place order" → CONFIRM_ORDER
-- NEVER treat product listing requests as order confirmations
-
-Respond with ONLY a JSON object:
-{{
-    "intent": "CONFIRM_ORDER" | "ADD_TO_CART" | "MODIFY_CART" | "PRODUCT_INFO" | "DATABASE_QUERY",
-    "confidence": 0.0-1.0,
-    "reasoning": "brief explanation"
-}}"""
+            cart_action = turn_analysis.get('cart_action')
+            confidence = turn_analysis.get('confidence', 0.5)
+            logger.info(f"Cart action: {cart_action} (confidence: {confidence:.2f}, tier: {turn_analysis.get('tier')}) - {turn_analysis.get('reasoning', '')}")
+
+            if cart_action == 'CONFIRM_ORDER' and confidence >= 0.7:
+                return handle_order_confirmation(user, session_user_id)
+            elif cart_action in ['PRODUCT_INFO', 'DATABASE_QUERY']:
+                # Handle product listing/database queries
+                logger.info(f"Detected {cart_action} cart action - handling database query")
+                return handle_product_info_or_query(user_message, user, context_data)
+            elif cart_action == 'ADD_TO_CART':
+                # Continue to normal flow to handle adding products
+                logger.info("Detected ADD_TO_CART cart action - proceeding with order processing")
+
+        intent = turn_analysis.get('classification', 'OTHER')
+        # Remembered for save_conversation so past turns can train the local intent model
+        g.intent = intent
+        g.intent_tier = turn_analysis.get('tier')
 
-                    response = llm_service.client.chat.completions.create(
-                        model=current_app.config.get('GROQ_MODEL', 'llama-3.3-70b-versatile'),
-                        messages=[{"role": "user", "content": intent_prompt}],
-                        temperature=0.1,
-                        max_tokens=200
-                    )
-                    
-                    result_text = response.choices[0].message.content.strip()
-                    # Clean JSON response
-                    if result_text.startswith('```'):
-                        lines = result_text.split('\n')
-                        if len(lines) > 2:
-                            result_text = '\n'.join(lines[1:-1])
-                    
-                    intent_result = json.loads(result_text)
-                    detected_intent = intent_result.get('intent', 'ADD_TO_CART')
-                    confidence = intent_result.get('confidence', 0.5)
-                    reasoning = intent_result.get('reasoning', '')
-                    
-                    logger.info(f"LLM Intent Analysis: {detected_intent} (confidence: {confidence:.2f}) - {reasoning}")
-                    
-                    # Handle different intents
-                    if detected_intent == 'CONFIRM_ORDER' and confidence >= 0.7:
-                        return handle_order_confirmation(user, session_user_id)
-                    elif detected_intent in ['PRODUCT_INFO', 'DATABASE_QUERY']:
-                        # Handle product listing/database queries
-                        logger.info(f"LLM detected {detected_intent} intent - handling database query")
-                        return handle_product_info_or_query(user_message, user, context_data)
-                    elif detected_intent == 'ADD_TO_CART':
-                        # Continue to normal flow to handle adding products
-                        logger.info("LLM detected ADD_TO_CART intent - proceeding with order processing")
-                except Exception as e:
-                    logger.error(f"Error analyzing intent with LLM: {str(e)}")
-                    # Fallback to keyword matching if LLM fails
-                    message_lower = user_message.lower().strip()
-                    add_keywords = ['add', 'put', 'include']
-                    has_add_word = any(keyword in message_lower for keyword in add_keywords)
-                    has_product_mention = any(keyword in message_lower for keyword in [
-                        'quantum', 'processor', 'sensor', 'memory', 'neural', 'controller',
-                        'rb001', 'rb002', 'rb003', 'rb004', 'rb005',
-                        '001', '002', '003', '004', '005'
-                    ])
-                    
-                    # Only confirm if no "add" keyword with product mention
-                    if not (has_add_word and has_product_mention):
-                        confirmation_keywords = ['yes proceed', 'confirm order', 'place order', 'proceed', 'confirm', 'yes', 'ok']
-                        if any(keyword in message_lower for keyword in confirmation_keywords):
-                            return handle_order_confirmation(user, session_user_id)
-        
-        # Classify user intent using LLM
-        classification_result = classification_service.classify_user_intent(user_message, context_data)
-        intent = classification_result.get('classification', 'OTHER')
-        
         logger.info(f"Intent classified as: {intent}")
 
         # Process based on classification
         if intent == 'PLACE_ORDER':
-            return handle_place_order(user_message, user, context_data, conversation_history)
+            return handle_place_order(user_message, user, context_data, conversation_history,
+                                      extraction_result=turn_analysis.get('product_extraction'))
         elif intent == 'TRACK_ORDER':
             return handle_track_order(user_message, user, context_data)
         elif intent == 'CALCULATE_COST':
@@ -569,16 +520,17 @@ def handle_order_confirmation(user, user_id):
         logger.error(f"Error handling order confirmation: {str(e)}")
         return jsonify({'response': 'Sorry, I encountered an error placing your order. Please try again.'}), 500
 
-def handle_place_order(user_message, user, context_data, conversation_history):
+def handle_place_order(user_message, user, context_data, conversation_history, extraction_result=None):
     """Handle order placement requests"""
     try:
         enhanced_order_service = get_enhanced_order_service()
         
-        # Process order request using LLM extraction
+        # Process order request using LLM extraction (reusing the turn analysis when available)
         result = enhanced_order_service.process_order_request(
             user_message, 
             user.id, 
-            conversation_history
+            conversation_history,
+            extraction_result=extraction_result
         )
         
         if result['success']:
@@ -666,7 +618,7 @@ def handle_track_order(user_message, user, context_data):
                     summary += "| Product Code | Product Name | Requested Qty | Customer | Order ID | Requested Date |\n"
                     summary += "|--------------|--------------|---------------|----------|----------|----------------|\n"
                     for item in pending_items:
-                        customer = User.query.get(item.user_id)
+                        customer = db_service.get_user_record(item.user_id)
                         customer_name = customer.name if customer else 'Unknown'
                         order_ref = item.original_order_id if item.original_order_id else 'N/A'
                         summary += f"| {item.product_code} | {item.product_name} | {item.requested_quantity} | {customer_name} | {order_ref} | {item.created_at.strftime('%Y-%m-%d')} |\n"
@@ -830,7 +782,7 @@ def handle_product_info_or_query(user_message, user, context_data):
         
         # Get all products from user's warehouse or all products
         if warehouse:
-            products = db_service.get_products_by_warehouse(warehouse.id)
+            products = db_service.get_catalog_snapshot(warehouse.id)
         else:
             # Get all products if no warehouse
             products = Product.query.filter_by(is_active=True).all()
@@ -850,7 +802,8 @@ def handle_product_info_or_query(user_message, user, context_data):
                         'code': product.product_code,
                         'price': product.price_of_product,
                         'available': product.available_for_sale,
-                        'warehouse': product.warehouse.location_name if product.warehouse else 'N/A'
+                        # Snapshot records carry no relationships; every row belongs to `warehouse`
+                        'warehouse': warehouse.location_name if warehouse else (product.warehouse.location_name if product.warehouse else 'N/A')
                     }
                 else:
                     # If duplicate, add to available quantity
@@ -883,27 +836,27 @@ def handle_product_info_or_query(user_message, user, context_data):
 def handle_distributor_analytics(user_message, user, db_service, llm_service):
     """Handle dynamic database queries and analytics for distributors"""
     try:
-        from app.models import Order, OrderItem, Product, User
-        
         # Build warehouse context
         warehouse_location = user.nearest_warehouse
         
-        # Get relevant data for analytics
-        warehouse_orders = Order.query.filter_by(warehouse_location=warehouse_location).all()
+        # Aggregated in SQL (GROUP BY); only summary rows come back
+        analytics = db_service.get_distributor_analytics(warehouse_location)
+        compact = lambda rows: json.dumps(rows, separators=(',', ':'), default=str)
         
         # Create context for LLM
         analytics_context = f"""
 Warehouse: {warehouse_location}
-Total Orders: {len(warehouse_orders)}
-Recent Orders: {min(10, len(warehouse_orders))} orders
-Order Statuses: {', '.join(set(o.status for o in warehouse_orders[:10]))}
-
-Available Tables and Data:
-- orders: Order information (order_id, status, total_amount, order_date, user_email, warehouse_location)
-- order_items: Order line items (product_code, quantity, unit_price, total_price)
-- products: Product information (product_code, product_name, price_of_product, available_for_sale, warehouse_id)
-- pending_order_products: Pending orders waiting for stock (product_code, requested_quantity, customer, status)
-- users: Customer information (name, email, user_type, warehouse_location)
+Total Orders: {analytics['total_orders']}
+Total Revenue (excluding cancelled): ${analytics['total_revenue']:,.2f}
+Orders by Status: {compact(analytics['orders_by_status'])}
+Orders by Status and Stage: {compact(analytics['orders_by_status_and_stage'])}
+Revenue Last {analytics['period_days']} Days: ${analytics['period_revenue']:,.2f}
+Revenue by Day (last {analytics['period_days']} days): {compact(analytics['revenue_by_day'])}
+Top Products (last {analytics['period_days']} days, by revenue): {compact(analytics['top_products'])}
+Top Products (all time, by revenue): {compact(analytics['top_products_all_time'])}
+Pending Quantities (waiting for stock): {compact(analytics['pending_quantities'])}
+
+Use only these figures for numbers in your answer.
 
 User Query: {user_message}
 """
@@ -941,12 +894,10 @@ Provide a direct answer:"""
         # Try to enhance with actual data
         if 'how many orders' in user_message.lower() or 'count of orders' in user_message.lower():
             response_text += f"\n\n**Actual Data:**\n"
-            response_text += f"• Total orders in warehouse: {len(warehouse_orders)}\n"
+            response_text += f"• Total orders in warehouse: {analytics['total_orders']}\n"
             
             # Count by status
-            from collections import Counter
-            status_counts = Counter(o.status for o in warehouse_orders)
-            for status, count in status_counts.items():
+            for status, count in analytics['orders_by_status'].items():
                 response_text += f"• {status}: {count}\n"
         
         save_conversation(user.id, user_message, response_text)
@@ -1027,6 +978,24 @@ Your task:
 
 Respond naturally and helpfully."""
 
+        if g.get('stream_response'):
+            # Stream tokens over SSE; the full text is persisted once the stream completes
+            return stream_text_response(
+                llm_service.stream_completion(
+                    messages=[{"role": "user", "content": context_prompt}],
+                    temperature=0.7,
+                    max_tokens=500
+                ),
+                on_complete=lambda text: save_conversation(user.id, user_message, text),
+                fallback_text="I'm here to help you with orders, tracking, and company information. How can I assist you today?",
+                extra={'action_buttons': [
+                    {'text': 'Place Order', 'action': 'place_order'},
+                    {'text': 'Track Order', 'action': 'track_order'},
+                    {'text': 'Company Info', 'action': 'company_info'},
+                    {'text': 'Get Help', 'action': 'help'}
+                ]}
+            ), 200
+
         response_obj = llm_service.client.chat.completions.create(
             model=current_app.config.get('GROQ_MODEL', 'mixtral-8x7b-32768'),
             messages=[{"role": "user", "content": context_prompt}],
@@ -1079,16 +1048,33 @@ def save_conversation(user_id, user_message, bot_response):
         db_service = get_db_service()
         session_id = session.get('session_id')
         
+        data_sources = None
+        if g.get('intent'):
+            data_sources = [g.intent]
+            if g.get('intent_tier'):
+                data_sources.append(f"{INTENT_TIER_TAG}{g.intent_tier}")
+
         if session_id:
             db_service.save_conversation(
                 user_id=user_id,
                 session_id=session_id,
                 user_message=user_message,
-                bot_response=bot_response
+                bot_response=bot_response,
+                data_sources=data_sources
             )
     except Exception as e:
         logger.error(f"Error saving conversation: {str(e)}")
 
+@chatbot_bp.route('/message/stream', methods=['POST'])
+def process_message_stream():
+    """
+    Streaming variant of /message using Server-Sent Events.
+    Free-form LLM answers arrive as 'token' events followed by a 'done' event;
+    every other flow returns its usual JSON payload as a single 'done' event.
+    """
+    g.stream_response = True
+    return json_to_sse_response(process_message())
+
 @chatbot_bp.route('/place_order', methods=['POST'])
 def place_order():
     """Place order from cart"""
@@ -1180,7 +1166,7 @@ def distributor_confirm_order():
         if not distributor_user_id:
             return jsonify({'error': 'User not logged in'}), 401
         
-        user = User.query.get(distributor_user_id)
+        user = get_db_service().get_user_record(distributor_user_id)
         if not user or user.user_type != 'distributor':
             return jsonify({'error': 'Access denied. Distributor access required.'}), 403
         
@@ -1202,3 +1188,43 @@ def distributor_confirm_order():
     except Exception as e:
         logger.error(f"Error confirming order: {str(e)}")
         return jsonify({'error': 'Error confirming order'}), 500
+
+@chatbot_bp.route('/distributor/import_stock', methods=['POST'])
+def distributor_import_stock():
+    """Distributor bulk stock import: CSV/XLSX of product batches for their own warehouse"""
+    try:
+        distributor_user_id = session.get('user_id')
+        
+        if not distributor_user_id:
+            return jsonify({'error': 'User not logged in'}), 401
+        
+        user = get_db_service().get_user_record(distributor_user_id)
+        if not user or user.user_type != 'distributor':
+            return jsonify({'error': 'Access denied. Distributor access required.'}), 403
+        
+        upload = request.files.get('file')
+        if not upload or not upload.filename:
+            return jsonify({'error': 'No file uploaded'}), 400
+        dry_run = request.form.get('dry_run', 'false').lower() == 'true'
+        
+        from app.catalog_import import CatalogImportService
+        from app.stock_check_service import StockCheckService
+        report = CatalogImportService().import_file(
+            upload.stream,
+            upload.filename,
+            warehouse_location=user.nearest_warehouse,
+            restrict_to_warehouse=True,
+            dry_run=dry_run,
+            check_pending_orders=False
+        )
+        
+        # Pending orders waiting for this stock are placed in the background
+        if not dry_run and (report['inserted'] or report['updated']):
+            submit_with_app_context(StockCheckService().check_and_fulfill_pending_orders)
+            report['pending_order_check'] = 'scheduled'
+        
+        return jsonify(report), 200 if report['success'] else 400
+            
+    except Exception as e:
+        logger.error(f"Error importing stock: {str(e)}")
+        return jsonify({'error': 'Error importing stock'}), 500
@@ -2,9 +2,10 @@ import logging
 from datetime import datetime
 from flask import current_app
 from app import db
-from app.models import Order, OrderItem, Product, User, CartItem
+from app.models import Order, OrderItem, Product, CartItem
 from app.database_service import DatabaseService
 from app.pricing_service import PricingService
+from app.sales_rollup import SalesRollupService
 from app.llm_order_service import LLMOrderService
 from app.email_utils import send_email
 
@@ -18,15 +19,17 @@ class EnhancedOrderService:
         self.db_service = DatabaseService()
         self.pricing_service = PricingService()
         self.llm_service = LLMOrderService()
+        self.rollup_service = SalesRollupService()
         self.logger = logger
     
-    def process_order_request(self, user_message, user_id, conversation_history=None):
+    def process_order_request(self, user_message, user_id, conversation_history=None, extraction_result=None):
         """
-        Process user order request using LLM extraction and cart management
+        Process user order request using LLM extraction and cart management.
+        extraction_result may carry products already extracted by the turn analysis.
         """
         try:
             # Get user info first
-            user = User.query.get(user_id)
+            user = self.db_service.get_user_record(user_id)
             if not user:
                 return {
                     'success': False,
@@ -35,7 +38,7 @@ class EnhancedOrderService:
             
             # Extract products from user message
             extraction_result = self.llm_service.extract_products_from_message(
-                user_message, user_id, conversation_history
+                user_message, user_id, conversation_history, extraction_result=extraction_result
             )
             
             self.logger.info(f"Extraction result: {extraction_result}")
@@ -277,14 +280,15 @@ class EnhancedOrderService:
         """
         try:
             # Get user and cart items
-            user = User.query.get(user_id)
+            user = self.db_service.get_user_record(user_id)
             if not user:
                 return {
                     'success': False,
                     'message': "User not found"
                 }
             
-            cart_items = self.db_service.get_cart_items(user_id)
+            # Cart items come with their products; batches are loaded once for all of them below
+            cart_items = self.db_service.get_cart_items_with_products(user_id)
             if not cart_items:
                 return {
                     'success': False,
@@ -292,7 +296,7 @@ class EnhancedOrderService:
                 }
             
             # Determine who placed the order
-            placed_by_user = User.query.get(placed_by_user_id) if placed_by_user_id else user
+            placed_by_user = self.db_service.get_user_record(placed_by_user_id) if placed_by_user_id else user
             
             # Get warehouse
             warehouse = self.db_service.get_warehouse_by_location(user.nearest_warehouse)
@@ -302,28 +306,41 @@ class EnhancedOrderService:
                     'message': "Warehouse not found for your location"
                 }
             
+            # All active batches of every product in the cart, in one query
+            batches_by_code = self.db_service.get_batches_by_product_codes(
+                [cart_item.product_code for cart_item in cart_items],
+                warehouse.id
+            )
+            
             # Separate cart items into expired and non-expired products FIRST
             # (Don't create order until we know there are valid items)
-            valid_cart_items = []  # Products that can be ordered (non-expired or limited availability)
-            expired_cart_items = []  # Products that are expired/out of stock
+            # Each line is a plain dict so it stays usable after the commits below expire the ORM objects
+            valid_cart_items = []  # Cart items that can be ordered (used for the order summary)
+            valid_lines = []  # Products that can be ordered (non-expired or limited availability)
+            expired_lines = []  # Products that are expired/out of stock
             expired_products_info = []  # Detailed info for notifications
             
+            # Check availability WITHOUT allocating (to avoid double allocation)
+            from datetime import date
+            today = date.today()
+            
             # Pre-process cart items to separate expired vs valid products
             for cart_item in cart_items:
-                product = Product.query.get(cart_item.product_id)
+                product = cart_item.product
                 if not product:
                     continue
                 
-                # Check availability WITHOUT allocating (to avoid double allocation)
-                from datetime import date
-                today = date.today()
+                line = {
+                    'product_id': cart_item.product_id,
+                    'product_code': cart_item.product_code,
+                    'product_name': product.product_name,
+                    'product_warehouse_id': product.warehouse_id,
+                    'quantity': cart_item.product_quantity,
+                    'unit_price': cart_item.unit_price
+                }
                 
-                # Get all batches of this product in the warehouse
-                all_batches = Product.query.filter_by(
-                    product_code=cart_item.product_code,
-                    warehouse_id=warehouse.id,
-                    is_active=True
-                ).all()
+                # All batches of this product in the warehouse
+                all_batches = batches_by_code.get(cart_item.product_code, [])
                 
                 # Check if any non-expired batches exist
                 non_expired_batches = [b for b in all_batches if not b.expiry_date or b.expiry_date >= today]
@@ -340,14 +357,9 @@ class EnhancedOrderService:
                 
                 if non_expired_qty < cart_item.product_quantity:
                     # Not enough non-expired stock - treat as expired/insufficient
-                    expired_cart_items.append(cart_item)
-                    
-                    # Track info for notification
-                    product_name = product.product_name if product else cart_item.product_code
-                    
                     expired_info = {
                         'product_code': cart_item.product_code,
-                        'product_name': product_name,
+                        'product_name': product.product_name,
                         'expired_batches': [],
                         'available_qty': non_expired_qty,
                         'requested_qty': cart_item.product_quantity,
@@ -368,6 +380,9 @@ class EnhancedOrderService:
                     
                     # Always add to expired_products_info for notification
                     expired_products_info.append(expired_info)
+                    line['available_qty'] = non_expired_qty
+                    line['reason'] = expired_info['reason']
+                    expired_lines.append(line)
                     
                     # Log the issue
                     if expired_batches:
@@ -375,7 +390,13 @@ class EnhancedOrderService:
                     else:
                         self.logger.warning(f"⚠️ INSUFFICIENT STOCK: {cart_item.product_code} - Requested: {cart_item.product_quantity}, Available: {non_expired_qty}, creating pending order")
                 else:
-                    # Has enough non-expired stock - add to valid list
+                    # Has enough non-expired stock - add to valid list, priced once from the loaded product
+                    line['pricing'] = self.pricing_service.calculate_product_pricing(
+                        cart_item.product_id,
+                        cart_item.product_quantity,
+                        product=product
+                    )
+                    valid_lines.append(line)
                     valid_cart_items.append(cart_item)
                     
                     # Still track any expired batches for notification
@@ -391,63 +412,51 @@ class EnhancedOrderService:
                                 })
                         
                         if expired_batches_info:
-                            product_name = product.product_name if product else cart_item.product_code
-                            
                             expired_info = {
                                 'product_code': cart_item.product_code,
-                                'product_name': product_name,
+                                'product_name': product.product_name,
                                 'expired_batches': expired_batches_info
                             }
                             
                             expired_products_info.append(expired_info)
-                
+            
             
             # If no valid cart items and no expired items, return error
-            if not valid_cart_items and not expired_cart_items:
+            if not valid_lines and not expired_lines:
                 return {
                     'success': False,
                     'message': "No products could be processed. Please check your cart items."
                 }
             
+            # Expired items details for the user message
+            expired_items_details = [{
+                'product_id': line['product_id'],
+                'product_code': line['product_code'],
+                'product_name': line['product_name'],
+                'quantity': line['quantity'],
+                'available_qty': line['available_qty'],
+                'reason': line['reason']
+            } for line in expired_lines]
+            
             # If there are NO valid items (all are expired/insufficient), handle differently
             # (No order creation needed - just pending orders)
-            if not valid_cart_items:
+            if not valid_lines:
                 # Only expired/insufficient items - don't create a regular order
                 # Just create pending orders and inform user
-                
-                # Store expired items info BEFORE clearing cart
-                expired_items_details = []
-                for expired_item in expired_cart_items:
-                    product = Product.query.get(expired_item.product_id)
-                    if product:
-                        expired_info = next((info for info in expired_products_info if info['product_code'] == expired_item.product_code), None)
-                        expired_items_details.append({
-                            'product_id': expired_item.product_id,
-                            'product_code': expired_item.product_code,
-                            'product_name': product.product_name,
-                            'quantity': expired_item.product_quantity,
-                            'available_qty': expired_info.get('available_qty', 0) if expired_info else 0,
-                            'reason': expired_info.get('reason', 'expired') if expired_info else 'expired'
-                        })
-                
-                # Create pending orders
                 pending_products_created = []
-                for expired_item in expired_cart_items:
-                    product = Product.query.get(expired_item.product_id)
-                    if product:
-                        expired_info = next((info for info in expired_products_info if info['product_code'] == expired_item.product_code), None)
-                        pending_order = self.db_service.create_pending_order_product(
-                            original_order_id=None,  # No order created yet
-                            product_code=expired_item.product_code,
-                            product_name=product.product_name,
-                            requested_quantity=expired_item.product_quantity,
-                            user_id=user.id,
-                            user_email=user.email,
-                            warehouse_id=warehouse.id,
-                            warehouse_location=warehouse.location_name
-                        )
-                        if pending_order:
-                            pending_products_created.append(pending_order)
+                for line in expired_lines:
+                    pending_order = self.db_service.create_pending_order_product(
+                        original_order_id=None,  # No order created yet
+                        product_code=line['product_code'],
+                        product_name=line['product_name'],
+                        requested_quantity=line['quantity'],
+                        user_id=user.id,
+                        user_email=user.email,
+                        warehouse_id=warehouse.id,
+                        warehouse_location=warehouse.location_name
+                    )
+                    if pending_order:
+                        pending_products_created.append(pending_order)
                 
                 # Clear cart
                 self.db_service.clear_cart(user_id)
@@ -481,6 +490,10 @@ You'll receive an email when any of these products become available."""
                     'pending_orders': len(pending_products_created)
                 }
             
+            # Generate order summary using valid cart items only, while they and their
+            # products are still loaded (the commits below expire them)
+            order_summary = self.llm_service.generate_order_summary(valid_cart_items, user)
+            
             # Now create the order since we have valid items
             order = Order(
                 user_id=user_id,
@@ -494,28 +507,25 @@ You'll receive an email when any of these products become available."""
             )
             order.generate_order_id()
             db.session.add(order)
-            db.session.commit()
+            db.session.flush()  # Assigns order.id; committed once with the items and allocations
             
             # Add order items and calculate totals only for valid cart items
+            allocation_lines = []
             subtotal = 0
             discount_total = 0
             scheme_discount_total = 0
             
-            for cart_item in valid_cart_items:
-                # Calculate final pricing
-                pricing = self.pricing_service.calculate_product_pricing(
-                    cart_item.product_id, 
-                    cart_item.product_quantity
-                )
+            for line in valid_lines:
+                pricing = line['pricing']
                 
                 if 'error' not in pricing:
                     # Create order item
                     order_item = OrderItem(
-                    order_id=order.id,
-                        product_id=cart_item.product_id,
-                        product_code=cart_item.product_code,
-                        product_quantity_ordered=cart_item.product_quantity,
-                        unit_price=cart_item.unit_price,
+                        order_id=order.id,
+                        product_id=line['product_id'],
+                        product_code=line['product_code'],
+                        product_quantity_ordered=line['quantity'],
+                        unit_price=line['unit_price'],
                         total_price=pricing['pricing']['total_amount'],
                         base_price=pricing['base_price'],
                         discount_amount=pricing['discount']['amount'],
@@ -530,38 +540,23 @@ You'll receive an email when any of these products become available."""
                     subtotal += pricing['pricing']['total_amount']
                     discount_total += (pricing['base_price'] * pricing['scheme']['paid_quantity']) - pricing['pricing']['total_amount']
                     
-                    # Allocate quantity using FEFO (First Expiry, First Out) logic
-                    product = Product.query.get(cart_item.product_id)
-                    if product:
-                        # First try user's warehouse
-                        allocations, allocation_message = self.db_service.allocate_quantity_fefo(
-                            product_code=cart_item.product_code,
-                            warehouse_id=warehouse.id,
-                            quantity_to_allocate=cart_item.product_quantity
-                        )
-                        
+                    # Allocated below for all lines at once
+                    allocation_lines.append({
+                        'product_code': line['product_code'],
+                        'quantity': line['quantity'],
                         # If not found in user's warehouse, try the product's actual warehouse
-                        if not allocations and product.warehouse_id != warehouse.id:
-                            self.logger.warning(f"Product {cart_item.product_code} not in user's warehouse ({warehouse.id}), trying product's warehouse ({product.warehouse_id})")
-                            allocations, allocation_message = self.db_service.allocate_quantity_fefo(
-                                product_code=cart_item.product_code,
-                                warehouse_id=product.warehouse_id,
-                                quantity_to_allocate=cart_item.product_quantity
-                            )
-                            
-                            if allocations:
-                                self.logger.info(f"✓ Successfully allocated from product's warehouse ({product.warehouse_id}) instead of user's warehouse ({warehouse.id})")
-                        
-                        if not allocations:
-                            self.logger.error(f"FEFO allocation failed for {cart_item.product_code}: {allocation_message}")
-                            raise Exception(f"Failed to allocate products: {allocation_message}")
-                        
-                        # Log allocation details
-                        batch_info = ", ".join([
-                            f"Batch {alloc['batch_number']} ({alloc['quantity']} units, expires: {alloc['expiry_date']})"
-                            for alloc in allocations
-                        ])
-                        self.logger.info(f"FEFO allocation for {cart_item.product_code}: {batch_info}")
+                        'fallback_warehouse_id': line['product_warehouse_id']
+                    })
+            
+            # Allocate all lines using FEFO (First Expiry, First Out) logic in one pass;
+            # the order, its items and the blocked quantities are committed together below
+            allocations, allocation_message = self.db_service.allocate_order_fefo(
+                allocation_lines,
+                warehouse_id=warehouse.id,
+                commit=False
+            )
+            if allocations is None:
+                raise Exception(f"Failed to allocate products: {allocation_message}")
             
             # Update order totals
             # Note: subtotal already contains the final pricing (with discounts applied)
@@ -574,64 +569,39 @@ You'll receive an email when any of these products become available."""
             order.order_stage = 'distributor_notified'
             
             db.session.commit()
+            self.rollup_service.record_order_placed(order)
             
-            # Store all needed information BEFORE clearing cart
-            # Store expired items details
-            expired_items_details = []
-            for expired_item in expired_cart_items:
-                product = Product.query.get(expired_item.product_id)
-                if product:
-                    expired_info = next((info for info in expired_products_info if info['product_code'] == expired_item.product_code), None)
-                    expired_items_details.append({
-                        'product_id': expired_item.product_id,
-                        'product_code': expired_item.product_code,
-                        'product_name': product.product_name,
-                        'quantity': expired_item.product_quantity,
-                        'available_qty': expired_info.get('available_qty', 0) if expired_info else 0,
-                        'reason': expired_info.get('reason', 'expired') if expired_info else 'expired'
-                    })
-            
-            # Store valid items details (for order summary)
+            # Valid items details (for order summary), from the pricing computed above
             valid_items_details = []
-            for cart_item in valid_cart_items:
-                product = Product.query.get(cart_item.product_id)
-                if product:
-                    pricing = self.pricing_service.calculate_product_pricing(
-                        cart_item.product_id, 
-                        cart_item.product_quantity
-                    )
-                    if 'error' not in pricing:
-                        valid_items_details.append({
-                            'name': product.product_name,
-                            'code': cart_item.product_code,
-                            'quantity': cart_item.product_quantity,
-                            'free': pricing['scheme']['free_quantity'],
-                            'unit_price': pricing['pricing']['final_price'],
-                            'total': pricing['pricing']['total_amount'],
-                            'scheme': pricing['scheme']['name']
-                        })
+            for line in valid_lines:
+                pricing = line['pricing']
+                if 'error' not in pricing:
+                    valid_items_details.append({
+                        'name': line['product_name'],
+                        'code': line['product_code'],
+                        'quantity': line['quantity'],
+                        'free': pricing['scheme']['free_quantity'],
+                        'unit_price': pricing['pricing']['final_price'],
+                        'total': pricing['pricing']['total_amount'],
+                        'scheme': pricing['scheme']['name']
+                    })
             
             # Create pending orders for expired products
             pending_products_created = []
-            for expired_item in expired_cart_items:
-                product = Product.query.get(expired_item.product_id)
-                if product:
-                    pending_order = self.db_service.create_pending_order_product(
-                        original_order_id=order.order_id,
-                        product_code=expired_item.product_code,
-                        product_name=product.product_name,
-                        requested_quantity=expired_item.product_quantity,
-                        user_id=user.id,
-                        user_email=user.email,
-                        warehouse_id=warehouse.id,
-                        warehouse_location=warehouse.location_name
-                    )
-                    if pending_order:
-                        pending_products_created.append(pending_order)
+            for line in expired_lines:
+                pending_order = self.db_service.create_pending_order_product(
+                    original_order_id=order.order_id,
+                    product_code=line['product_code'],
+                    product_name=line['product_name'],
+                    requested_quantity=line['quantity'],
+                    user_id=user.id,
+                    user_email=user.email,
+                    warehouse_id=warehouse.id,
+                    warehouse_location=warehouse.location_name
+                )
+                if pending_order:
+                    pending_products_created.append(pending_order)
             
-            # Generate order summary using valid cart items only (before clearing)
-            order_summary = self.llm_service.generate_order_summary(valid_cart_items, user)
-
             # Clear cart
             self.db_service.clear_cart(user_id)
             
@@ -739,7 +709,7 @@ We're excited to deliver cutting-edge technology to you."""
                     'success': False,
                     'message': "Order not found"
                 }
-            distributor = User.query.get(distributor_user_id)
+            distributor = self.db_service.get_user_record(distributor_user_id)
             if not distributor or distributor.user_type != 'distributor':
                 return {
                     'success': False,
@@ -750,6 +720,8 @@ We're excited to deliver cutting-edge technology to you."""
                     'success': False,
                     'message': "This order doesn't belong to your warehouse."
                 }
+            # A repeated confirmation must not count the order twice in the sales rollups
+            already_confirmed = bool(order.distributor_confirmed)
             # Update order status
             order.distributor_confirmed = True
             order.distributor_confirmed_at = datetime.utcnow()
@@ -757,13 +729,11 @@ We're excited to deliver cutting-edge technology to you."""
             order.status = 'confirmed'
             order.order_stage = 'distributor_confirmed'
             # Move blocked quantities to confirmed
-            order_items = OrderItem.query.filter_by(order_id=order.id).all()
+            # (atomic UPDATEs, safe against concurrent reservations on the same batches)
+            order_items = self.db_service.get_order_items_with_products(order.id)
             for item in order_items:
-                product = Product.query.get(item.product_id)
-                if product:
-                    product.confirmed_quantity += item.product_quantity_ordered
-                    product.blocked_quantity -= item.product_quantity_ordered
-                    product.available_for_sale = product.product_quantity - product.blocked_quantity - product.confirmed_quantity
+                if item.product:
+                    self.db_service.confirm_batch_quantity(item.product_id, item.product_quantity_ordered)
             db.session.commit()
             # Generate invoice
             invoice_number = self._generate_invoice(order)
@@ -772,11 +742,13 @@ We're excited to deliver cutting-edge technology to you."""
             order.invoice_number = invoice_number
             order.order_stage = 'invoice_generated'
             db.session.commit()
+            if not already_confirmed:
+                self.rollup_service.record_order_confirmed(order)
 
             # Send enhanced confirmation email to MR or customer
-            mr = User.query.get(order.user_id)
+            mr = self.db_service.get_user_record(order.user_id)
             admin_email = current_app.config.get('ADMIN_EMAIL') if current_app else None
-            order_items_list = OrderItem.query.filter_by(order_id=order.id).all()
+            order_items_list = self.db_service.get_order_items_with_products(order.id)
             table = """<table style='border-collapse:collapse; width:100%;'><tr style='background:#f2f2f2;'><th>Product</th><th>Quantity</th><th>Unit Price</th><th>Discount</th><th>Scheme</th><th>Total</th></tr>"""
             for item in order_items_list:
                 paid = item.paid_quantity or (item.product_quantity_ordered or 0)
@@ -838,7 +810,7 @@ We're excited to deliver cutting-edge technology to you."""
             
             # Get order items
             order_items = []
-            for item in order.order_items:
+            for item in self.db_service.get_order_items_with_products(order.id):
                 order_items.append({
                     'product_code': item.product_code,
                     'product_name': item.product.product_name,
@@ -854,7 +826,7 @@ We're excited to deliver cutting-edge technology to you."""
             # Get distributor info
             distributor_info = None
             if order.distributor_confirmed_by:
-                distributor = User.query.get(order.distributor_confirmed_by)
+                distributor = self.db_service.get_user_record(order.distributor_confirmed_by)
                 if distributor:
                     distributor_info = {
                         'name': distributor.name,
@@ -894,7 +866,7 @@ We're excited to deliver cutting-edge technology to you."""
     
     def get_order_status_for_distributor(self, order_id, distributor_id):
         """Get order status for a distributor based on warehouse/location"""
-        distributor = User.query.get(distributor_id)
+        distributor = self.db_service.get_user_record(distributor_id)
         if not distributor or distributor.user_type != "distributor":
             return {
                 'success': False,
@@ -913,7 +885,7 @@ We're excited to deliver cutting-edge technology to you."""
             }
         # Compose table
         items = []
-        for item in order.order_items:
+        for item in self.db_service.get_order_items_with_products(order.id):
             paid = item.paid_quantity or (item.product_quantity_ordered or 0)
             free = item.free_quantity or 0
             items.append({
@@ -949,16 +921,11 @@ We're excited to deliver cutting-edge technology to you."""
         """
         try:
             # Get distributor for the warehouse
-            distributors = self.db_service.get_distributors()
-            distributor = None
-            for dist in distributors:
-                if dist.nearest_warehouse == order.warehouse_location:
-                    distributor = dist
-                    break
+            distributor = self.db_service.get_distributor_for_warehouse(order.warehouse_location)
             if not distributor:
                 self.logger.warning(f"No distributor found for warehouse {order.warehouse_location}")
                 return
-            order_items = OrderItem.query.filter_by(order_id=order.id).all()
+            order_items = self.db_service.get_order_items_with_products(order.id)
             # --- Table ---
             table = """
             <table style='width:100%;border-collapse:collapse;margin-bottom:16px;'>
@@ -1114,7 +1081,7 @@ We're excited to deliver cutting-edge technology to you."""
         try:
             # Get order details
             order_items = []
-            for item in order.order_items:
+            for item in self.db_service.get_order_items_with_products(order.id):
                 order_items.append({
                     'product_code': item.product_code,
                     'product_name': item.product.product_name,
@@ -1124,7 +1091,7 @@ We're excited to deliver cutting-edge technology to you."""
                 })
             
             # Email to customer
-            customer = User.query.get(order.user_id)
+            customer = self.db_service.get_user_record(order.user_id)
             if customer:
                 subject = f"Invoice Generated - Order {order.order_id}"
                 html_content = self._generate_invoice_html(order, order_items, customer, distributor)
@@ -2,18 +2,11 @@ import time
 import logging
 import json
 from flask import current_app
-from groq import Groq # Import Groq Client
+from app.llm_cache import get_response_cache
+from app.llm_client import get_groq_client, get_client_stats
+from app.llm_metrics import caller_site, get_llm_metrics
 # REMOVED: from groq.lib.chat_completion_service import ChatCompletion # This line caused the error
 
-# --- Dependency Check ---
-try:
-    from groq import Groq
-    GROQ_AVAILABLE = True
-except ImportError:
-    GROQ_AVAILABLE = False
-    logger = logging.getLogger(__name__)
-    logger.error("Groq package not installed. Install with: pip install groq")
-
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
@@ -29,16 +22,106 @@ class GroqService:
         """Initialize Groq client"""
         try:
             api_key = current_app.config.get('GROQ_API_KEY')
-            
+
             if api_key:
-                # Use the newer API format without proxies parameter
-                self.client = Groq(api_key=api_key)
-                logger.info('Groq client initialized')
+                # Process-wide pooled client (deadline, retries, circuit breaker) shared by all services
+                self.client = get_groq_client(current_app.config)
             else:
                 logger.warning('Groq API configuration missing - using fallback responses')
         except Exception as e:
             logger.error(f'Failed to initialize Groq client: {str(e)}')
 
+    # ------------------------------------------------------------------------
+    ## CACHED CHAT COMPLETION
+    # ------------------------------------------------------------------------
+
+    def chat_completion(self, messages, temperature=0.7, max_tokens=2000, model=None, **params):
+        """
+        Run a chat completion and return the response text.
+        Deterministic calls (temperature <= LLM_CACHE_MAX_TEMPERATURE) are served
+        from the shared response cache when possible. Raises on API errors so
+        callers keep their own fallbacks.
+        """
+        if not self.client:
+            raise RuntimeError('Groq client not available')
+
+        model = model or current_app.config.get('GROQ_MODEL', 'llama-3.3-70b-versatile')
+        cache = None
+        cache_key = None
+        if temperature <= current_app.config.get('LLM_CACHE_MAX_TEMPERATURE', 0.1):
+            cache = get_response_cache(current_app.config)
+        if cache is not None:
+            cache_key = cache.make_key(model, messages, temperature=temperature, max_tokens=max_tokens, **params)
+            cached = cache.get(cache_key)
+            if cached is not None:
+                logger.info('LLM cache hit')
+                metrics = get_llm_metrics(current_app.config)
+                if metrics is not None:
+                    metrics.record_call(caller_site(), model, 0.0, outcome='cache_hit')
+                return cached
+
+        response = self.client.chat.completions.create(
+            model=model,
+            messages=messages,
+            temperature=temperature,
+            max_tokens=max_tokens,
+            **params
+        )
+        content = response.choices[0].message.content
+
+        if cache is not None and content:
+            cache.set(cache_key, content)
+        return content
+
+    def stream_completion(self, messages, temperature=0.7, max_tokens=2000, model=None, **params):
+        """
+        Run a streaming chat completion and yield text deltas as they arrive.
+        Raises on API errors before the first token so callers can fall back.
+        """
+        if not self.client:
+            raise RuntimeError('Groq client not available')
+
+        model = model or current_app.config.get('GROQ_MODEL', 'llama-3.3-70b-versatile')
+        stream = self.client.chat.completions.create(
+            model=model,
+            messages=messages,
+            temperature=temperature,
+            max_tokens=max_tokens,
+            stream=True,
+            **params
+        )
+        try:
+            for chunk in stream:
+                if not chunk.choices:
+                    continue
+                delta = chunk.choices[0].delta.content
+                if delta:
+                    yield delta
+        finally:
+            # Consumer stopped early (client disconnected): free the connection and concurrency slot
+            stream.close()
+
+    @staticmethod
+    def get_cache_stats():
+        """Hit/miss counters for the deterministic response cache"""
+        cache = get_response_cache(current_app.config)
+        if cache is None:
+            return {'enabled': False}
+        return cache.get_stats()
+
+    @staticmethod
+    def get_llm_call_stats():
+        """Per-call-site latency histograms, token usage and JSON parse outcomes"""
+        metrics = get_llm_metrics(current_app.config)
+        if metrics is None:
+            return {'enabled': False}
+        return metrics.get_stats()
+
+    @staticmethod
+    def get_client_stats():
+        """Concurrency, retry and circuit breaker counters for the shared Groq client"""
+        return get_client_stats()
+
     # ------------------------------------------------------------------------
     ## LLM ROUTER (NEW FEATURE)
     # ------------------------------------------------------------------------
@@ -77,15 +160,11 @@ User Query: "{user_message}"
 Output **ONLY** one of the following two words: **PERFORM_SEARCH** or **NO_SEARCH**."""
         
         try:
-            groq_model = current_app.config.get('GROQ_MODEL', 'llama-3.3-70b-versatile')
-            response = self.client.chat.completions.create(
-                model=groq_model,
+            decision = self.chat_completion(
                 messages=[{"role": "user", "content": router_prompt}],
                 temperature=0.0,
                 max_tokens=10,
-            )
-            
-            decision = response.choices[0].message.content.strip().upper()
+            ).strip().upper()
             
             if "PERFORM_SEARCH" in decision:
                 logger.info("LLM Router Decision: PERFORM_SEARCH")
@@ -146,6 +225,34 @@ Output **ONLY** one of the following two words: **PERFORM_SEARCH** or **NO_SEARC
             logger.error(f'Groq API error: {str(e)}')
             return self._generate_fallback_response(user_message, context_data, start_time)
     
+    def generate_response_stream(self, user_message, conversation_history=None, context_data=None):
+        """Streaming variant of generate_response: yields text deltas"""
+        start_time = time.time()
+
+        if not self.client:
+            yield self._generate_fallback_response(user_message, context_data, start_time)['response']
+            return
+
+        system_message = self._build_system_message(context_data)
+        messages = [{"role": "system", "content": system_message}]
+
+        if conversation_history:
+            for conv in conversation_history[-5:]:
+                messages.append({"role": "user", "content": conv.user_message})
+                messages.append({"role": "assistant", "content": conv.bot_response})
+
+        messages.append({"role": "user", "content": user_message})
+
+        streamed_any = False
+        try:
+            for delta in self.stream_completion(messages, temperature=0.7, max_tokens=2000, top_p=0.95):
+                streamed_any = True
+                yield delta
+        except Exception as e:
+            logger.error(f'Groq streaming error: {str(e)}')
+            if not streamed_any:
+                yield self._generate_fallback_response(user_message, context_data, start_time)['response']
+
     def _build_system_message(self, context_data):
         """Build system message with context, including product count."""
         
@@ -0,0 +1,201 @@
+import logging
+import threading
+import time
+from collections import namedtuple
+from flask_login import UserMixin
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+from app.models import User, Warehouse
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Credentials never leave the ORM row
+_USER_PRIVATE_FIELDS = ('password_hash', 'otp_secret', 'otp_created_at')
+
+_UserRecordBase = namedtuple('UserRecordBase', [
+    column.key for column in User.__table__.columns if column.key not in _USER_PRIVATE_FIELDS
+])
+
+
+class UserRecord(_UserRecordBase, UserMixin):
+    """
+    Immutable, detached copy of one users row (without credentials). Same
+    attribute names as the User model, so read-only code can use either;
+    it also works as a Flask-Login user (is_active comes from the row).
+    """
+    __slots__ = ()
+
+
+# Immutable, detached copy of one warehouses row
+WarehouseRecord = namedtuple('WarehouseRecord', [column.key for column in Warehouse.__table__.columns])
+
+# Lookup columns per kind; 'id' first
+USER_LOOKUPS = ('id', 'email', 'phone', 'unique_id')
+WAREHOUSE_LOOKUPS = ('id', 'location_name')
+
+_DIRTY_KEY = 'identity_dirty'
+
+
+def to_user_record(user):
+    return UserRecord(*(getattr(user, field) for field in UserRecord._fields))
+
+
+def to_warehouse_record(warehouse):
+    return WarehouseRecord(*(getattr(warehouse, field) for field in WarehouseRecord._fields))
+
+
+# kind -> (model, record factory, lookup columns)
+_KINDS = {
+    'user': (User, to_user_record, USER_LOOKUPS),
+    'warehouse': (Warehouse, to_warehouse_record, WAREHOUSE_LOOKUPS),
+}
+
+
+class IdentityCache:
+    """
+    Read-through cache of UserRecord / WarehouseRecord by id and by their
+    other unique lookups (user email/phone/unique_id, warehouse location_name).
+
+    Entries are dropped after any commit (or rollback) that changed or deleted
+    the row, and by explicit invalidate() calls; the TTL only bounds staleness
+    from writes made by other processes. Misses are not cached, so a freshly
+    registered user is found straight away.
+    """
+
+    def __init__(self, ttl_seconds=300):
+        self.ttl_seconds = ttl_seconds
+        self._entries = {}  # (kind, field, value) -> (expires, record)
+        self._keys_by_id = {}  # (kind, id) -> set of entry keys
+        self._generations = {kind: 0 for kind in _KINDS}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+
+    def get(self, kind, field, value, active_only=False):
+        """Record of `kind` whose `field` equals value, or None"""
+        model, to_record, lookups = _KINDS[kind]
+        if field not in lookups:
+            raise ValueError(f"{kind} records cannot be looked up by {field}")
+        if value is None:
+            return None
+
+        key = (kind, field, value)
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] > now:
+                self.hits += 1
+                record = entry[1]
+                return None if active_only and not record.is_active else record
+            self.misses += 1
+            generation = self._generations[kind]
+
+        if field == 'id':
+            row = model.query.get(value)
+        else:
+            row = model.query.filter(getattr(model, field) == value).first()
+        if row is None:
+            return None
+        record = to_record(row)
+
+        with self._lock:
+            # A commit touching this kind landed while loading: serve the row but don't cache it
+            if self._generations[kind] == generation:
+                expires = now + self.ttl_seconds
+                aliases = self._keys_by_id.setdefault((kind, record.id), set())
+                for lookup in lookups:
+                    lookup_value = getattr(record, lookup)
+                    if lookup_value is not None:
+                        alias = (kind, lookup, lookup_value)
+                        self._entries[alias] = (expires, record)
+                        aliases.add(alias)
+        return None if active_only and not record.is_active else record
+
+    def invalidate(self, kind, ids=None):
+        """Drop cached records of `kind` for the given ids (all when None)"""
+        with self._lock:
+            if ids is None:
+                for entry_key in [k for k in self._entries if k[0] == kind]:
+                    del self._entries[entry_key]
+                for id_key in [k for k in self._keys_by_id if k[0] == kind]:
+                    del self._keys_by_id[id_key]
+            else:
+                for record_id in ids:
+                    for alias in self._keys_by_id.pop((kind, record_id), ()):
+                        self._entries.pop(alias, None)
+            self._generations[kind] += 1
+            self.invalidations += 1
+
+    def get_stats(self):
+        with self._lock:
+            return {
+                'entries': len(self._entries),
+                'hits': self.hits,
+                'misses': self.misses,
+                'invalidations': self.invalidations
+            }
+
+
+_identity_cache = None
+_identity_cache_lock = threading.Lock()
+
+
+def get_identity_cache(config):
+    """Return the shared IdentityCache, or None when disabled"""
+    global _identity_cache
+    if not config.get('IDENTITY_CACHE_ENABLED', True):
+        return None
+    if _identity_cache is None:
+        with _identity_cache_lock:
+            if _identity_cache is None:
+                _identity_cache = IdentityCache(ttl_seconds=config.get('IDENTITY_CACHE_TTL', 300))
+    return _identity_cache
+
+
+# ----------------------------------------------------------------------------
+## CHANGE TRACKING (invalidate after commit, never before)
+# ----------------------------------------------------------------------------
+
+def _kind_of(instance):
+    if isinstance(instance, User):
+        return 'user'
+    if isinstance(instance, Warehouse):
+        return 'warehouse'
+    return None
+
+
+@event.listens_for(Session, 'after_flush')
+def _collect_identity_changes(session, flush_context):
+    # New rows need nothing: misses are never cached
+    dirty = session.info.setdefault(_DIRTY_KEY, set())
+    for instance in session.deleted:
+        kind = _kind_of(instance)
+        if kind:
+            dirty.add((kind, instance.id))
+    for instance in session.dirty:
+        kind = _kind_of(instance)
+        if kind and session.is_modified(instance, include_collections=False):
+            dirty.add((kind, instance.id))
+
+
+def _invalidate_changes(session):
+    changes = session.info.pop(_DIRTY_KEY, None)
+    if not changes or _identity_cache is None:
+        return
+    for kind in _KINDS:
+        ids = {record_id for change_kind, record_id in changes if change_kind == kind}
+        if ids:
+            _identity_cache.invalidate(kind, ids)
+
+
+@event.listens_for(Session, 'after_commit')
+def _invalidate_after_commit(session):
+    _invalidate_changes(session)
+
+
+@event.listens_for(Session, 'after_rollback')
+def _invalidate_after_rollback(session):
+    # A record may have been cached from flushed-but-uncommitted state
+    _invalidate_changes(session)
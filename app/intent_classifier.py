@@ -0,0 +1,366 @@
+import logging
+import math
+import re
+import threading
+import time
+from collections import Counter, defaultdict
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+INTENT_CATEGORIES = [
+    'PLACE_ORDER', 'CALCULATE_COST', 'TRACK_ORDER', 'PRODUCT_INFO',
+    'COMPANY_INFO', 'WEB_SEARCH', 'OTHER'
+]
+
+# Tag stored in Conversation.data_sources next to the intent so the trainer can
+# tell LLM-labelled rows from rows the local tiers labelled themselves.
+INTENT_TIER_TAG = 'intent_tier:'
+
+# ------------------------------------------------------------------------
+## TIER 1: COMPILED RULES (unambiguous messages only)
+# ------------------------------------------------------------------------
+
+_ORDER_ID_RE = re.compile(r'\b(QB\d{8}[A-Z0-9]+)\b', re.IGNORECASE)
+_ADD_QTY_FIRST_RE = re.compile(
+    r'^(?:please\s+)?(?:add|order|buy|purchase|put|include)\s+(\d+)\s*(?:units?\s+of\s+|x\s+)?(.+?)\s*$',
+    re.IGNORECASE
+)
+_ADD_QTY_LAST_RE = re.compile(
+    r'^(?:please\s+)?(?:add|order|buy|purchase|put|include)\s+(.+?)\s+(?:x\s*)?(\d+)\s*(?:units?)?\s*$',
+    re.IGNORECASE
+)
+# Verbs that ask for something other than tracking or pricing; such messages are left to the other tiers
+_ORDER_ACTION_RE = re.compile(
+    r'\b(?:cancel|confirm|approve|reject|return|refund|modify|change|update|edit|delete|remove|add|reorder|repeat|pay|invoice)\b',
+    re.IGNORECASE
+)
+# Business metrics share words with cost questions ("what is the total revenue this month")
+_METRICS_RE = re.compile(
+    r'\b(?:revenue|sales|profit|earnings|turnover|margin|income|report|analytics|performance)\b',
+    re.IGNORECASE
+)
+# Several items in one message ("add 5 RB002 and 3 RB003"): no single product/quantity to extract
+_MULTI_ITEM_RE = re.compile(r',|&|\b(?:and|plus)\b|\b\d+\b', re.IGNORECASE)
+# Destination after the product ("add 10 paracetamol to my cart")
+_PRODUCT_TAIL_RE = re.compile(r'(?:^|\s+)(?:to|into|in\s+(?:my|the))\b.*$', re.IGNORECASE)
+_CONFIRM_ORDER_RE = re.compile(
+    r'^(?:please\s+)?(?:confirm|place|finalize|finalise)\s+(?:my\s+|the\s+)?order\W*$',
+    re.IGNORECASE
+)
+_LIST_PRODUCTS_RE = re.compile(
+    r'^(?:please\s+)?(?:list|show|display|view)\b.*\b(?:products?|catalog(?:ue)?|stock|inventory)\b'
+    r'|^what\s+products\b',
+    re.IGNORECASE
+)
+_TRACK_RE = re.compile(
+    r'^(?:please\s+)?(?:track|where\s+is)\b.*\border\b'
+    r'|\b(?:order\s+history|recent\s+orders|my\s+orders|order\s+status)\b',
+    re.IGNORECASE
+)
+_COST_RE = re.compile(
+    r'^(?:what\s+is|what\'s|calculate|how\s+much)\b.*\b(?:cost|price|total|amount)\b',
+    re.IGNORECASE
+)
+_GREETING_RE = re.compile(
+    r'^(?:hi|hello|hey|thanks|thank\s+you|good\s+(?:morning|afternoon|evening))\W*$',
+    re.IGNORECASE
+)
+
+# Seed corpus so the statistical tier is usable before any history exists
+_SEED_EXAMPLES = [
+    ('add 10 quantum processor', 'PLACE_ORDER'),
+    ('add 5 ai memory cards', 'PLACE_ORDER'),
+    ('order 50 neural network module and 20 quantum sensors', 'PLACE_ORDER'),
+    ('i want to buy some processors', 'PLACE_ORDER'),
+    ('put 3 of product 002 in my cart', 'PLACE_ORDER'),
+    ('confirm order', 'PLACE_ORDER'),
+    ('place the order', 'PLACE_ORDER'),
+    ('how much will 10 sensors cost', 'CALCULATE_COST'),
+    ('what is the total price for my cart', 'CALCULATE_COST'),
+    ('calculate the cost with discount', 'CALCULATE_COST'),
+    ('track my order', 'TRACK_ORDER'),
+    ('where is my delivery', 'TRACK_ORDER'),
+    ('show me recent orders', 'TRACK_ORDER'),
+    ('what is the status of my order', 'TRACK_ORDER'),
+    ('list all products', 'PRODUCT_INFO'),
+    ('what products do you have in stock', 'PRODUCT_INFO'),
+    ('show available products', 'PRODUCT_INFO'),
+    ('tell me about the company', 'COMPANY_INFO'),
+    ('what services does quantum blue offer', 'COMPANY_INFO'),
+    ('contact information', 'COMPANY_INFO'),
+    ('latest news on ai chips today', 'WEB_SEARCH'),
+    ('current market trends in pharma', 'WEB_SEARCH'),
+    ('hello', 'OTHER'),
+    ('how are you', 'OTHER'),
+    ('thanks for the help', 'OTHER'),
+]
+
+_TOKEN_RE = re.compile(r"[a-z0-9']+")
+
+
+def _tokenize(text):
+    """Lowercase word tokens with numbers, product codes and order ids folded"""
+    tokens = []
+    for token in _TOKEN_RE.findall((text or '').lower()):
+        if re.fullmatch(r'qb\d{8}[a-z0-9]+', token):
+            tokens.append('<order_id>')
+        elif re.fullmatch(r'rb\d+', token):
+            tokens.append('<product_code>')
+        elif token.isdigit():
+            tokens.append('<num>')
+        else:
+            tokens.append(token)
+    # Bigrams help separate "confirm order" from "confirm order <id>"
+    tokens.extend(f"{a}_{b}" for a, b in zip(tokens, tokens[1:]))
+    return tokens
+
+
+def _add_entities(product_text, quantity):
+    """(product_name, quantity) from an add/order rule match; (None, None) for multi-item messages"""
+    if _MULTI_ITEM_RE.search(product_text):
+        return None, None
+    return _PRODUCT_TAIL_RE.sub('', product_text).strip() or None, quantity
+
+
+def build_classification(classification, confidence, reasoning, product_name=None, quantity=None, order_id=None, tier=None):
+    """Build a result dict in the same shape as the LLM classifier's output"""
+    remainder = max(0.0, 1.0 - confidence) / max(1, len(INTENT_CATEGORIES) - 1)
+    percentages = {
+        category: round(confidence if category == classification else remainder, 4)
+        for category in INTENT_CATEGORIES
+    }
+    result = {
+        "classification": classification,
+        "confidence": round(confidence, 4),
+        "reasoning": reasoning,
+        "entities": {
+            "product_name": product_name,
+            "quantity": quantity,
+            "order_id": order_id
+        },
+        "percentages": percentages
+    }
+    if tier:
+        result["tier"] = tier
+    return result
+
+
+class NaiveBayesIntentModel:
+    """Small multinomial naive Bayes model over message tokens"""
+
+    def __init__(self):
+        self.class_counts = Counter()
+        self.token_counts = defaultdict(Counter)
+        self.token_totals = Counter()
+        self.vocabulary = set()
+        self.trained_examples = 0
+
+    def fit(self, examples):
+        for text, label in examples:
+            tokens = _tokenize(text)
+            if not tokens:
+                continue
+            self.class_counts[label] += 1
+            self.token_counts[label].update(tokens)
+            self.token_totals[label] += len(tokens)
+            self.vocabulary.update(tokens)
+            self.trained_examples += 1
+        return self
+
+    def coverage(self, text):
+        """Fraction of the message's words (bigrams excluded) seen in training"""
+        words = [token for token in _tokenize(text) if '_' not in token]
+        if not words:
+            return 0.0
+        return sum(1 for token in words if token in self.vocabulary) / len(words)
+
+    def predict(self, text):
+        """Return (label, probability) or (None, 0.0) when untrained"""
+        if not self.trained_examples:
+            return None, 0.0
+        tokens = _tokenize(text)
+        vocab_size = len(self.vocabulary) or 1
+        scores = {}
+        for label, count in self.class_counts.items():
+            score = math.log(count / self.trained_examples)
+            denominator = self.token_totals[label] + vocab_size
+            label_tokens = self.token_counts[label]
+            for token in tokens:
+                score += math.log((label_tokens[token] + 1) / denominator)
+            scores[label] = score
+        best_label = max(scores, key=scores.get)
+        best_score = scores[best_label]
+        norm = sum(math.exp(s - best_score) for s in scores.values())
+        return best_label, 1.0 / norm
+
+
+class IntentTierStats:
+    """Thread-safe per-tier hit counters and latency totals"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counts = Counter()
+        self._latency_ms = Counter()
+
+    def record(self, tier, latency_seconds):
+        with self._lock:
+            self._counts[tier] += 1
+            self._latency_ms[tier] += latency_seconds * 1000
+
+    def get_stats(self):
+        with self._lock:
+            total = sum(self._counts.values())
+            return {
+                'total': total,
+                'tiers': {
+                    tier: {
+                        'count': count,
+                        'hit_rate': round(count / total, 4) if total else 0.0,
+                        'avg_latency_ms': round(self._latency_ms[tier] / count, 3) if count else 0.0
+                    }
+                    for tier, count in self._counts.items()
+                }
+            }
+
+
+class LocalIntentClassifier:
+    """
+    Local fast path ahead of the LLM classifier: compiled rules first, then a
+    naive Bayes model trained on past Conversation rows labelled by the LLM.
+    """
+
+    def __init__(self, retrain_interval=3600, training_limit=5000, min_examples=100, min_coverage=0.6):
+        self.retrain_interval = retrain_interval
+        self.training_limit = training_limit
+        self.min_examples = min_examples
+        self.min_coverage = min_coverage
+        self._model = None
+        self._trained_at = 0.0
+        self._train_lock = threading.Lock()
+
+    # --- Tier 1 ---------------------------------------------------------
+
+    def classify_rules(self, user_message):
+        """Return a classification for unambiguous messages, or None"""
+        message = (user_message or '').strip()
+        if not message:
+            return None
+
+        order_match = _ORDER_ID_RE.search(message)
+        if order_match:
+            if _ORDER_ACTION_RE.search(message):
+                # e.g. "cancel order QB...": not a tracking request
+                return None
+            return build_classification(
+                'TRACK_ORDER', 0.97, 'Rule: message contains an order ID',
+                order_id=order_match.group(1).upper(), tier='rules'
+            )
+
+        if _CONFIRM_ORDER_RE.match(message):
+            return build_classification('PLACE_ORDER', 0.95, 'Rule: cart confirmation', tier='rules')
+
+        add_match = _ADD_QTY_FIRST_RE.match(message)
+        if add_match and not add_match.group(2).isdigit():
+            product_name, quantity = _add_entities(add_match.group(2), add_match.group(1))
+            return build_classification(
+                'PLACE_ORDER', 0.95, 'Rule: add/order with quantity',
+                product_name=product_name, quantity=quantity, tier='rules'
+            )
+        add_match = _ADD_QTY_LAST_RE.match(message)
+        if add_match:
+            product_name, quantity = _add_entities(add_match.group(1), add_match.group(2))
+            return build_classification(
+                'PLACE_ORDER', 0.93, 'Rule: add/order with quantity',
+                product_name=product_name, quantity=quantity, tier='rules'
+            )
+
+        if _LIST_PRODUCTS_RE.search(message):
+            return build_classification('PRODUCT_INFO', 0.93, 'Rule: product listing request', tier='rules')
+
+        # "cancel my orders" / "change my order status" ask for an action, not tracking
+        if _TRACK_RE.search(message) and not _ORDER_ACTION_RE.search(message):
+            return build_classification('TRACK_ORDER', 0.9, 'Rule: order tracking request', tier='rules')
+
+        if _COST_RE.search(message) and not _ORDER_ACTION_RE.search(message) and not _METRICS_RE.search(message):
+            return build_classification('CALCULATE_COST', 0.9, 'Rule: cost question', tier='rules')
+
+        if _GREETING_RE.match(message):
+            return build_classification('OTHER', 0.95, 'Rule: greeting', tier='rules')
+
+        return None
+
+    # --- Tier 2 ---------------------------------------------------------
+
+    def _load_training_examples(self):
+        """Past LLM-labelled conversations plus the seed corpus"""
+        examples = list(_SEED_EXAMPLES)
+        try:
+            from app.models import Conversation
+            rows = Conversation.query.with_entities(
+                Conversation.user_message, Conversation.data_sources
+            ).order_by(Conversation.created_at.desc()).limit(self.training_limit).all()
+            for user_message, data_sources in rows:
+                if not isinstance(data_sources, list) or not data_sources:
+                    continue
+                label = data_sources[0]
+                if label not in INTENT_CATEGORIES:
+                    continue
+                tier_tags = [s for s in data_sources[1:] if isinstance(s, str) and s.startswith(INTENT_TIER_TAG)]
+                if tier_tags and tier_tags[0] != f"{INTENT_TIER_TAG}llm":
+                    # Never learn from our own local predictions
+                    continue
+                examples.append((user_message, label))
+        except Exception as e:
+            logger.warning(f"Could not load intent training data: {str(e)}")
+        return examples
+
+    def _ensure_model(self):
+        if self._model is not None and time.time() - self._trained_at < self.retrain_interval:
+            return self._model
+        with self._train_lock:
+            if self._model is None or time.time() - self._trained_at >= self.retrain_interval:
+                examples = self._load_training_examples()
+                self._model = NaiveBayesIntentModel().fit(examples)
+                self._trained_at = time.time()
+                logger.info(f"Local intent model trained on {self._model.trained_examples} examples")
+        return self._model
+
+    def classify_model(self, user_message):
+        """
+        Return the naive Bayes classification for the message. Its posterior is
+        uncalibrated, so unless the model has min_examples LLM-labelled rows and
+        knows min_coverage of the message's words, the confidence is capped at
+        0.5: the label can still break ties in the fallback, but never skips the LLM.
+        """
+        model = self._ensure_model()
+        label, probability = model.predict(user_message)
+        if label is None:
+            return None
+        coverage = model.coverage(user_message)
+        reasoning = 'Local naive Bayes model'
+        if model.trained_examples < self.min_examples or coverage < self.min_coverage:
+            probability = min(probability, 0.5)
+            reasoning = f"Local naive Bayes model (low trust: {model.trained_examples} examples, {coverage:.0%} known words)"
+        return build_classification(label, probability, reasoning, tier='local_model')
+
+
+# Process-wide tier statistics shared by every classification service instance
+intent_tier_stats = IntentTierStats()
+_local_classifier = None
+_local_classifier_lock = threading.Lock()
+
+
+def get_local_classifier(config):
+    """Return the shared LocalIntentClassifier built from the Flask config"""
+    global _local_classifier
+    if _local_classifier is None:
+        with _local_classifier_lock:
+            if _local_classifier is None:
+                _local_classifier = LocalIntentClassifier(
+                    retrain_interval=config.get('INTENT_MODEL_RETRAIN_INTERVAL', 3600),
+                    training_limit=config.get('INTENT_MODEL_TRAINING_LIMIT', 5000),
+                    min_examples=config.get('INTENT_MODEL_MIN_EXAMPLES', 100),
+                    min_coverage=config.get('INTENT_MODEL_MIN_COVERAGE', 0.6)
+                )
+    return _local_classifier
@@ -0,0 +1,206 @@
+import hashlib
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+
+class LLMResponseCache:
+    """
+    LRU + TTL cache for deterministic (low-temperature) LLM completions.
+
+    Entries are keyed by model, normalized messages and sampling parameters.
+    An optional SQLite file can be used as a second tier so every gunicorn
+    worker on the host shares the same cached responses.
+    """
+
+    def __init__(self, max_entries=1000, ttl_seconds=3600, disk_path=None):
+        self.max_entries = max(1, int(max_entries))
+        self.ttl_seconds = int(ttl_seconds)
+        self.disk_path = disk_path
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.disk_hits = 0
+        self.evictions = 0
+        if self.disk_path:
+            self._init_disk()
+
+    # ------------------------------------------------------------------------
+    ## KEYING
+    # ------------------------------------------------------------------------
+
+    @staticmethod
+    def _normalize_content(content):
+        """Collapse whitespace so cosmetic differences share one entry"""
+        if isinstance(content, str):
+            return ' '.join(content.split())
+        return content
+
+    @classmethod
+    def make_key(cls, model, messages, **params):
+        """Build a stable hash key for a completion request"""
+        normalized = [
+            {'role': m.get('role'), 'content': cls._normalize_content(m.get('content'))}
+            for m in messages
+        ]
+        payload = json.dumps(
+            {'model': model, 'messages': normalized, 'params': params},
+            sort_keys=True,
+            ensure_ascii=False,
+            default=str
+        )
+        return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+    # ------------------------------------------------------------------------
+    ## LOOKUP / STORE
+    # ------------------------------------------------------------------------
+
+    def get(self, key):
+        """Return the cached response text for key, or None"""
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                value, expires_at = entry
+                if expires_at > now:
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return value
+                del self._entries[key]
+
+        value = self._disk_get(key, now)
+        with self._lock:
+            if value is not None:
+                self.hits += 1
+                self.disk_hits += 1
+                self._store_memory(key, value, now + self.ttl_seconds)
+            else:
+                self.misses += 1
+        return value
+
+    def set(self, key, value):
+        """Store a response text under key"""
+        if value is None:
+            return
+        expires_at = time.time() + self.ttl_seconds
+        with self._lock:
+            self._store_memory(key, value, expires_at)
+        self._disk_set(key, value, expires_at)
+
+    def _store_memory(self, key, value, expires_at):
+        self._entries[key] = (value, expires_at)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    def clear(self):
+        """Drop every cached entry (memory and disk)"""
+        with self._lock:
+            self._entries.clear()
+        if self.disk_path:
+            try:
+                with self._connect() as conn:
+                    conn.execute("DELETE FROM llm_cache")
+            except Exception as e:
+                logger.error(f"Failed to clear LLM disk cache: {str(e)}")
+
+    def get_stats(self):
+        """Return hit/miss counters and current size"""
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                'enabled': True,
+                'entries': len(self._entries),
+                'max_entries': self.max_entries,
+                'ttl_seconds': self.ttl_seconds,
+                'hits': self.hits,
+                'misses': self.misses,
+                'disk_hits': self.disk_hits,
+                'evictions': self.evictions,
+                'hit_rate': round(self.hits / total, 4) if total else 0.0,
+                'disk_backend': self.disk_path
+            }
+
+    # ------------------------------------------------------------------------
+    ## OPTIONAL DISK BACKEND (shared between worker processes)
+    # ------------------------------------------------------------------------
+
+    def _connect(self):
+        return sqlite3.connect(self.disk_path, timeout=5)
+
+    def _init_disk(self):
+        try:
+            directory = os.path.dirname(os.path.abspath(self.disk_path))
+            os.makedirs(directory, exist_ok=True)
+            with self._connect() as conn:
+                conn.execute("PRAGMA journal_mode=WAL")
+                conn.execute(
+                    "CREATE TABLE IF NOT EXISTS llm_cache ("
+                    "cache_key TEXT PRIMARY KEY, response TEXT NOT NULL, expires_at REAL NOT NULL)"
+                )
+            logger.info(f"LLM response cache disk backend at {self.disk_path}")
+        except Exception as e:
+            logger.error(f"LLM disk cache unavailable, using memory only: {str(e)}")
+            self.disk_path = None
+
+    def _disk_get(self, key, now):
+        if not self.disk_path:
+            return None
+        try:
+            with self._connect() as conn:
+                row = conn.execute(
+                    "SELECT response, expires_at FROM llm_cache WHERE cache_key = ?", (key,)
+                ).fetchone()
+                if row is None:
+                    return None
+                if row[1] <= now:
+                    conn.execute("DELETE FROM llm_cache WHERE cache_key = ?", (key,))
+                    return None
+                return row[0]
+        except Exception as e:
+            logger.warning(f"LLM disk cache read failed: {str(e)}")
+            return None
+
+    def _disk_set(self, key, value, expires_at):
+        if not self.disk_path:
+            return
+        try:
+            with self._connect() as conn:
+                conn.execute(
+                    "INSERT OR REPLACE INTO llm_cache (cache_key, response, expires_at) VALUES (?, ?, ?)",
+                    (key, value, expires_at)
+                )
+                # Keep the shared file bounded: drop expired rows opportunistically
+                conn.execute("DELETE FROM llm_cache WHERE expires_at <= ?", (time.time(),))
+        except Exception as e:
+            logger.warning(f"LLM disk cache write failed: {str(e)}")
+
+
+# Process-wide cache instance, built lazily from the Flask config
+_response_cache = None
+_response_cache_lock = threading.Lock()
+
+
+def get_response_cache(config):
+    """Return the shared LLMResponseCache, or None when caching is disabled"""
+    global _response_cache
+    if not config.get('LLM_CACHE_ENABLED', True):
+        return None
+    if _response_cache is None:
+        with _response_cache_lock:
+            if _response_cache is None:
+                _response_cache = LLMResponseCache(
+                    max_entries=config.get('LLM_CACHE_MAX_ENTRIES', 1000),
+                    ttl_seconds=config.get('LLM_CACHE_TTL', 3600),
+                    disk_path=config.get('LLM_CACHE_DISK_PATH') or None
+                )
+    return _response_cache
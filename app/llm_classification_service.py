@@ -1,7 +1,11 @@
 import logging
 import json
+import time
 from flask import current_app
 from app.groq_service import GroqService
+from app.catalog_prompt import get_catalog_builder
+from app.intent_classifier import get_local_classifier, intent_tier_stats
+from app.llm_metrics import loads_llm_json
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
@@ -41,13 +45,52 @@ class LLMClassificationService:
     
     def classify_user_intent(self, user_message, context_data=None):
         """
-        Classify user intent using LLM and extract entities (product names, quantities)
-        Returns classification with percentages and extracted entities
+        Classify user intent and extract entities (product names, quantities).
+        Tiered: compiled rules, then the local naive Bayes model, and only when
+        local confidence is below INTENT_LOCAL_CONFIDENCE_THRESHOLD the LLM.
+        Returns classification with percentages, extracted entities and the tier used.
         """
+        start_time = time.perf_counter()
+
+        if current_app.config.get('INTENT_LOCAL_ENABLED', True):
+            local_result = self._classify_locally(user_message)
+            if local_result:
+                intent_tier_stats.record(local_result['tier'], time.perf_counter() - start_time)
+                self.logger.info(f"Intent classified locally ({local_result['tier']}) as: {local_result['classification']} with confidence {local_result['confidence']}")
+                return local_result
+
+        result = self._classify_with_llm(user_message, context_data)
+        result.setdefault('tier', 'fallback')
+        intent_tier_stats.record(result['tier'], time.perf_counter() - start_time)
+        return result
+
+    def _classify_locally(self, user_message):
+        """Return a local classification if it clears the confidence threshold, else None"""
+        try:
+            threshold = current_app.config.get('INTENT_LOCAL_CONFIDENCE_THRESHOLD', 0.85)
+            local_classifier = get_local_classifier(current_app.config)
+
+            result = local_classifier.classify_rules(user_message)
+            if result and result['confidence'] >= threshold:
+                return result
+
+            result = local_classifier.classify_model(user_message)
+            if result and result['confidence'] >= threshold:
+                return result
+        except Exception as e:
+            self.logger.error(f"Local classification error: {str(e)}")
+        return None
+
+    def get_tier_stats(self):
+        """Per-tier hit rates and average latencies of classify_user_intent"""
+        return intent_tier_stats.get_stats()
+
+    def _classify_with_llm(self, user_message, context_data=None):
+        """Classify intent with the LLM, falling back to keyword matching"""
         if not self.groq_service.client:
             self.logger.warning("Groq client not available for classification")
             return self._get_fallback_classification(user_message)
-        
+
         try:
             # Build context for classification
             context_info = ""
@@ -113,19 +156,17 @@ Examples:
 
 Be precise and consider the context provided."""
 
-            response = self.groq_service.client.chat.completions.create(
-                model=current_app.config.get('GROQ_MODEL', 'llama-3.3-70b-versatile'),
+            result_text = self.groq_service.chat_completion(
                 messages=[{"role": "user", "content": classification_prompt}],
                 temperature=0.1,
                 max_tokens=500
-            )
-            
-            result_text = response.choices[0].message.content.strip()
+            ).strip()
             result_text = self._clean_json_response(result_text)
-            
+
             # Try to parse JSON response
             try:
-                classification_result = json.loads(result_text)
+                classification_result = loads_llm_json(result_text, current_app.config)
+                classification_result['tier'] = 'llm'
                 self.logger.info(f"Intent classified as: {classification_result.get('classification')} with confidence {classification_result.get('confidence')}")
                 return classification_result
             except json.JSONDecodeError:
@@ -306,10 +347,8 @@ Respond in a friendly, sales-oriented manner. If the user's request is unclear,
             return self._parse_order_fallback(user_message, products)
         
         try:
-            # Format products for LLM
-            products_info = ""
-            for product in products:
-                products_info += f"- {product.product_name} (Code: {product.product_code}) - ${product.price_of_product} - Available: {product.available_for_sale}\n"
+            # Compact catalog block as a shared, cacheable system prefix
+            catalog_message = get_catalog_builder(current_app.config).system_message(products)
             
             # Build conversation context if available
             conversation_context = ""
@@ -325,8 +364,7 @@ Current User Message: "{user_message}"
 
 {conversation_context}
 
-Available Products:
-{products_info}
+Available Products: the PRODUCT CATALOG above (code|name|price|stock)
 
 Extract the following information:
 1. Product codes and quantities the user wants to order
@@ -356,7 +394,7 @@ If the user's message is unclear or doesn't contain specific order details, set
 
             response = self.groq_service.client.chat.completions.create(
                 model=current_app.config.get('GROQ_MODEL', 'llama-3.3-70b-versatile'),
-                messages=[{"role": "user", "content": parse_prompt}],
+                messages=[catalog_message, {"role": "user", "content": parse_prompt}],
                 temperature=0.1,
                 max_tokens=500
             )
@@ -367,7 +405,7 @@ If the user's message is unclear or doesn't contain specific order details, set
             # Try to parse JSON response
             try:
                 import json
-                order_data = json.loads(result_text)
+                order_data = loads_llm_json(result_text, current_app.config)
                 return order_data
             except json.JSONDecodeError:
                 self.logger.error(f"Failed to parse order JSON: {result_text}")
@@ -422,10 +460,8 @@ If the user's message is unclear or doesn't contain specific order details, set
             return self._calculate_cost_fallback(user_message, products)
         
         try:
-            # Format products for LLM
-            products_info = ""
-            for product in products:
-                products_info += f"- {product.product_name} (Code: {product.product_code}) - ${product.price_of_product} - Available: {product.available_for_sale}\n"
+            # Compact catalog block as a shared, cacheable system prefix
+            catalog_message = get_catalog_builder(current_app.config).system_message(products)
             
             # Build conversation context if available
             conversation_context = ""
@@ -441,8 +477,7 @@ Current User Message: "{user_message}"
 
 {conversation_context}
 
-Available Products:
-{products_info}
+Available Products: the PRODUCT CATALOG above (code|name|price|stock)
 
 Calculate the following:
 1. Identify the products and quantities the user wants
@@ -475,7 +510,7 @@ If the user's message is unclear or doesn't contain specific order details, set
 
             response = self.groq_service.client.chat.completions.create(
                 model=current_app.config.get('GROQ_MODEL', 'llama-3.3-70b-versatile'),
-                messages=[{"role": "user", "content": cost_prompt}],
+                messages=[catalog_message, {"role": "user", "content": cost_prompt}],
                 temperature=0.1,
                 max_tokens=800
             )
@@ -486,7 +521,7 @@ If the user's message is unclear or doesn't contain specific order details, set
             # Try to parse JSON response
             try:
                 import json
-                cost_data = json.loads(result_text)
+                cost_data = loads_llm_json(result_text, current_app.config)
                 return cost_data
             except json.JSONDecodeError:
                 self.logger.error(f"Failed to parse cost JSON: {result_text}")
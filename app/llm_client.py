@@ -0,0 +1,414 @@
+import logging
+import random
+import threading
+import time
+from app.llm_metrics import caller_site, get_llm_metrics, usage_tokens
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+try:
+    import httpx
+    from groq import Groq
+    import groq as groq_errors
+    GROQ_AVAILABLE = True
+except ImportError:
+    GROQ_AVAILABLE = False
+
+RETRYABLE_STATUS_CODES = {429, 500, 502, 503, 504}
+
+
+class CircuitOpenError(RuntimeError):
+    """Raised when the circuit breaker rejects a call without contacting Groq"""
+
+
+class LLMBusyError(RuntimeError):
+    """Raised when no concurrency slot frees up before the call deadline"""
+
+
+class CircuitBreaker:
+    """
+    Consecutive-failure circuit breaker.
+    closed -> open after `failure_threshold` failures; open -> half_open after
+    `reset_timeout` seconds; one successful trial call closes it again.
+    """
+
+    def __init__(self, failure_threshold=5, reset_timeout=30):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = 'closed'
+        self.failures = 0
+        self.opened_at = 0.0
+        self.times_opened = 0
+        self._trial_in_flight = False
+        self._lock = threading.Lock()
+
+    def allow(self):
+        with self._lock:
+            if self.state == 'closed':
+                return True
+            if self.state == 'open' and time.time() - self.opened_at >= self.reset_timeout:
+                self.state = 'half_open'
+                self._trial_in_flight = False
+            if self.state == 'half_open' and not self._trial_in_flight:
+                self._trial_in_flight = True
+                return True
+            return False
+
+    def record_success(self):
+        with self._lock:
+            if self.state != 'closed':
+                logger.info("Groq circuit breaker closed")
+            self.state = 'closed'
+            self.failures = 0
+            self._trial_in_flight = False
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            if self.state == 'half_open' or self.failures >= self.failure_threshold:
+                if self.state != 'open':
+                    self.times_opened += 1
+                    logger.warning(f"Groq circuit breaker OPEN after {self.failures} failure(s); failing fast for {self.reset_timeout}s")
+                self.state = 'open'
+                self.opened_at = time.time()
+                self._trial_in_flight = False
+
+    def release_trial(self):
+        """Give back a half-open trial slot that never reached Groq"""
+        with self._lock:
+            self._trial_in_flight = False
+
+    def get_stats(self):
+        with self._lock:
+            return {
+                'state': self.state,
+                'consecutive_failures': self.failures,
+                'times_opened': self.times_opened
+            }
+
+
+class _GuardedStream:
+    """
+    Iterator over a streamed completion that keeps the client's concurrency slot
+    until the stream is exhausted, fails or is closed, enforces the call deadline
+    between chunks, and reports the outcome to the breaker only at that point.
+    """
+
+    def __init__(self, owner, stream, deadline):
+        self._owner = owner
+        self._stream = stream
+        self._iterator = iter(stream)
+        self._deadline = deadline
+        self._finished = False
+        self._finish_lock = threading.Lock()
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        if self._finished:
+            raise StopIteration
+        if time.monotonic() >= self._deadline:
+            self._close_stream()
+            self._finish(failed=True)
+            raise TimeoutError('Groq stream deadline exceeded')
+        try:
+            return next(self._iterator)
+        except StopIteration:
+            self._finish(failed=False)
+            raise
+        except Exception as e:
+            self._finish(failed=self._owner._is_retryable(e) or isinstance(e, TimeoutError))
+            raise
+
+    def close(self):
+        """
+        Stop reading early. The stream was never seen to completion, so this is
+        neither a success nor a failure for the breaker: only the slot (and a
+        half-open trial) is given back.
+        """
+        if not self._finished:
+            self._close_stream()
+            self._finish(failed=None)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def __del__(self):
+        # Abandoned without close(): don't leak the slot
+        try:
+            self.close()
+        except Exception:
+            pass
+
+    def __getattr__(self, name):
+        return getattr(self._stream, name)
+
+    def _close_stream(self):
+        try:
+            self._stream.close()
+        except Exception:
+            pass
+
+    def _finish(self, failed):
+        """Record the outcome (None: neutral) and release the slot, once"""
+        with self._finish_lock:
+            if self._finished:
+                return
+            self._finished = True
+        if failed is None:
+            self._owner.breaker.release_trial()
+        elif failed:
+            self._owner.breaker.record_failure()
+            with self._owner._lock:
+                self._owner.failures += 1
+        else:
+            self._owner.breaker.record_success()
+        self._owner._release_slot()
+
+
+class _ResilientCompletions:
+    """Drop-in for client.chat.completions with deadline, concurrency limit, retries and breaker"""
+
+    def __init__(self, owner):
+        self._owner = owner
+
+    def create(self, **kwargs):
+        return self._owner._call_with_resilience(kwargs)
+
+
+class _ResilientChat:
+    def __init__(self, owner):
+        self.completions = _ResilientCompletions(owner)
+
+
+class ResilientGroqClient:
+    """
+    Process-wide wrapper around one pooled Groq client. Exposes the same
+    `chat.completions.create(...)` surface so existing call sites keep working,
+    while every call gets a deadline, a bounded concurrency slot, jittered
+    retries on 429/5xx/timeouts and a circuit breaker that fails fast.
+    """
+
+    def __init__(self, api_key, timeout=20.0, connect_timeout=5.0, max_concurrency=8,
+                 max_retries=2, retry_base_delay=0.5, failure_threshold=5, reset_timeout=30,
+                 pool_max_connections=20, pool_keepalive=10, base_url=None, metrics=None):
+        self.timeout = float(timeout)
+        self.metrics = metrics
+        self.max_retries = int(max_retries)
+        self.retry_base_delay = float(retry_base_delay)
+        self._slots = threading.BoundedSemaphore(max(1, int(max_concurrency)))
+        self.max_concurrency = max(1, int(max_concurrency))
+        self.breaker = CircuitBreaker(failure_threshold, reset_timeout)
+        self._lock = threading.Lock()
+        self._in_flight = 0
+        self.calls = 0
+        self.retries = 0
+        self.failures = 0
+        self.rejected = 0
+
+        http_client = httpx.Client(
+            limits=httpx.Limits(
+                max_connections=int(pool_max_connections),
+                max_keepalive_connections=int(pool_keepalive)
+            ),
+            timeout=httpx.Timeout(self.timeout, connect=float(connect_timeout))
+        )
+        client_kwargs = {
+            'api_key': api_key,
+            'http_client': http_client,
+            'timeout': self.timeout,
+            'max_retries': 0  # retries are handled here so they respect the deadline and breaker
+        }
+        if base_url:
+            client_kwargs['base_url'] = base_url
+        self._client = Groq(**client_kwargs)
+        self.chat = _ResilientChat(self)
+
+    def __getattr__(self, name):
+        # Anything besides chat.completions goes straight to the underlying client
+        return getattr(self._client, name)
+
+    @staticmethod
+    def _is_retryable(error):
+        status_code = getattr(error, 'status_code', None)
+        if status_code in RETRYABLE_STATUS_CODES:
+            return True
+        return isinstance(error, (groq_errors.APITimeoutError, groq_errors.APIConnectionError))
+
+    @staticmethod
+    def _retry_after(error):
+        response = getattr(error, 'response', None)
+        try:
+            value = response.headers.get('retry-after') if response is not None else None
+            return float(value) if value else None
+        except (TypeError, ValueError):
+            return None
+
+    def _call_with_resilience(self, kwargs):
+        if self.metrics is None:
+            return self._execute(kwargs, {})
+
+        call_site = caller_site()
+        state = {'attempts': 0}
+        outcome = 'ok'
+        response = None
+        start_time = time.perf_counter()
+        try:
+            response = self._execute(kwargs, state)
+            return response
+        except CircuitOpenError:
+            outcome = 'circuit_open'
+            raise
+        except LLMBusyError:
+            outcome = 'busy'
+            raise
+        except Exception as e:
+            outcome = type(e).__name__
+            raise
+        finally:
+            # Streams report time to first byte; their token usage is not known here
+            prompt_tokens, completion_tokens = usage_tokens(response) if response is not None and not kwargs.get('stream') else (0, 0)
+            self.metrics.record_call(
+                call_site, kwargs.get('model'), time.perf_counter() - start_time,
+                prompt_tokens=prompt_tokens, completion_tokens=completion_tokens,
+                outcome=outcome, stream=bool(kwargs.get('stream')), attempts=state['attempts']
+            )
+
+    def _execute(self, kwargs, state):
+        # A caller-supplied timeout can only shorten the shared deadline
+        timeout = min(float(kwargs.pop('timeout', None) or self.timeout), self.timeout)
+        deadline = time.monotonic() + timeout
+
+        if not self.breaker.allow():
+            with self._lock:
+                self.rejected += 1
+            raise CircuitOpenError('Groq circuit breaker is open')
+
+        if not self._slots.acquire(timeout=max(0.0, deadline - time.monotonic())):
+            with self._lock:
+                self.rejected += 1
+            # Not Groq's fault, so the breaker is left alone
+            self.breaker.release_trial()
+            raise LLMBusyError('No Groq concurrency slot available before deadline')
+
+        with self._lock:
+            self._in_flight += 1
+            self.calls += 1
+        handed_off = False
+        try:
+            attempt = 0
+            while True:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    self.breaker.record_failure()
+                    with self._lock:
+                        self.failures += 1
+                    raise TimeoutError('Groq call deadline exceeded')
+                state['attempts'] = attempt + 1
+                try:
+                    response = self._client.chat.completions.create(timeout=remaining, **kwargs)
+                    if kwargs.get('stream'):
+                        # The stream has only been opened: it holds the slot, the
+                        # deadline and the breaker outcome until it is consumed
+                        handed_off = True
+                        return _GuardedStream(self, response, deadline)
+                    self.breaker.record_success()
+                    return response
+                except Exception as e:
+                    retryable = self._is_retryable(e)
+                    if not retryable:
+                        # Client-side errors (400/401/...) still prove Groq is reachable
+                        self.breaker.record_success()
+                        raise
+                    if attempt >= self.max_retries:
+                        self.breaker.record_failure()
+                        with self._lock:
+                            self.failures += 1
+                        raise
+                    # Full jitter backoff, honouring Retry-After when it fits the deadline
+                    delay = random.uniform(0, self.retry_base_delay * (2 ** attempt))
+                    retry_after = self._retry_after(e)
+                    if retry_after is not None:
+                        delay = max(delay, retry_after)
+                    if time.monotonic() + delay >= deadline:
+                        self.breaker.record_failure()
+                        with self._lock:
+                            self.failures += 1
+                        raise
+                    attempt += 1
+                    with self._lock:
+                        self.retries += 1
+                    logger.warning(f"Groq call failed ({type(e).__name__}), retry {attempt}/{self.max_retries} in {delay:.2f}s")
+                    time.sleep(delay)
+        finally:
+            if not handed_off:
+                self._release_slot()
+
+    def _release_slot(self):
+        with self._lock:
+            self._in_flight -= 1
+        self._slots.release()
+
+    def get_stats(self):
+        with self._lock:
+            stats = {
+                'calls': self.calls,
+                'in_flight': self._in_flight,
+                'max_concurrency': self.max_concurrency,
+                'retries': self.retries,
+                'failures': self.failures,
+                'rejected': self.rejected,
+                'timeout_seconds': self.timeout
+            }
+        stats['circuit_breaker'] = self.breaker.get_stats()
+        return stats
+
+
+# Process-wide registry: one pooled client per (api_key, base_url)
+_clients = {}
+_clients_lock = threading.Lock()
+
+
+def get_groq_client(config):
+    """Return the shared ResilientGroqClient for the current config, or None if not configured"""
+    if not GROQ_AVAILABLE:
+        return None
+    api_key = config.get('GROQ_API_KEY')
+    if not api_key:
+        return None
+    base_url = config.get('GROQ_BASE_URL') or None
+    key = (api_key, base_url)
+    client = _clients.get(key)
+    if client is None:
+        with _clients_lock:
+            client = _clients.get(key)
+            if client is None:
+                client = ResilientGroqClient(
+                    api_key,
+                    timeout=config.get('GROQ_TIMEOUT', 20),
+                    connect_timeout=config.get('GROQ_CONNECT_TIMEOUT', 5),
+                    max_concurrency=config.get('GROQ_MAX_CONCURRENCY', 8),
+                    max_retries=config.get('GROQ_MAX_RETRIES', 2),
+                    retry_base_delay=config.get('GROQ_RETRY_BASE_DELAY', 0.5),
+                    failure_threshold=config.get('GROQ_CIRCUIT_FAILURE_THRESHOLD', 5),
+                    reset_timeout=config.get('GROQ_CIRCUIT_RESET_TIMEOUT', 30),
+                    pool_max_connections=config.get('GROQ_POOL_MAX_CONNECTIONS', 20),
+                    pool_keepalive=config.get('GROQ_POOL_KEEPALIVE', 10),
+                    base_url=base_url,
+                    metrics=get_llm_metrics(config)
+                )
+                _clients[key] = client
+                logger.info('Shared Groq client initialized')
+    return client
+
+
+def get_client_stats():
+    """Stats for every registered client (API keys are not exposed)"""
+    with _clients_lock:
+        clients = list(_clients.values())
+    return [client.get_stats() for client in clients]
@@ -0,0 +1,219 @@
+import bisect
+import json
+import logging
+import sys
+import threading
+from collections import deque
+from datetime import datetime
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Latency histogram upper bounds in milliseconds (last bucket is +inf)
+LATENCY_BUCKETS_MS = (50, 100, 250, 500, 1000, 2000, 5000, 10000, 20000)
+
+# Frames that sit between a call site and the Groq client and should not be reported as the site
+_PASSTHROUGH_FRAMES = {
+    'app.llm_client': None,
+    'app.llm_metrics': None,
+    'app.groq_service': {'chat_completion', 'stream_completion'},
+}
+
+
+def caller_site(depth=1):
+    """Name of the code that issued the LLM call, e.g. 'llm_order_service.analyze_turn'"""
+    frame = sys._getframe(depth)
+    while frame is not None:
+        module = frame.f_globals.get('__name__', '')
+        skipped = _PASSTHROUGH_FRAMES.get(module, ())
+        if module.startswith('app.') and not (skipped is None or frame.f_code.co_name in skipped):
+            return f"{module.split('.', 1)[1]}.{frame.f_code.co_name}"
+        frame = frame.f_back
+    return 'unknown'
+
+
+def _percentile(sorted_values, pct):
+    if not sorted_values:
+        return None
+    index = min(len(sorted_values) - 1, int(round(pct / 100.0 * (len(sorted_values) - 1))))
+    return round(sorted_values[index], 1)
+
+
+class _SiteStats:
+    """Aggregates for one call site"""
+
+    def __init__(self, sample_size):
+        self.calls = 0
+        self.timed_calls = 0
+        self.cache_hits = 0
+        self.errors = {}
+        self.buckets = [0] * (len(LATENCY_BUCKETS_MS) + 1)
+        self.latency_sum_ms = 0.0
+        self.recent_latencies_ms = deque(maxlen=sample_size)
+        self.prompt_tokens = 0
+        self.completion_tokens = 0
+        self.parse_ok = 0
+        self.parse_failed = 0
+        self.models = set()
+
+    def to_dict(self):
+        latencies = sorted(self.recent_latencies_ms)
+        completed = self.timed_calls - sum(self.errors.values())
+        # Non-cumulative bucket counts, keyed by upper bound
+        histogram = {}
+        for bound, count in zip(LATENCY_BUCKETS_MS, self.buckets):
+            histogram[f"le_{bound}ms"] = count
+        histogram['gt_{}ms'.format(LATENCY_BUCKETS_MS[-1])] = self.buckets[-1]
+        return {
+            'calls': self.calls,
+            'cache_hits': self.cache_hits,
+            'errors': dict(self.errors),
+            'models': sorted(self.models),
+            'latency_ms': {
+                'avg': round(self.latency_sum_ms / self.timed_calls, 1) if self.timed_calls else None,
+                'p50': _percentile(latencies, 50),
+                'p95': _percentile(latencies, 95),
+                'p99': _percentile(latencies, 99),
+                'histogram': histogram
+            },
+            'tokens': {
+                'prompt': self.prompt_tokens,
+                'completion': self.completion_tokens,
+                'avg_prompt': round(self.prompt_tokens / completed, 1) if completed else None,
+                'avg_completion': round(self.completion_tokens / completed, 1) if completed else None
+            },
+            'json_parse': {'ok': self.parse_ok, 'failed': self.parse_failed}
+        }
+
+
+class LLMCallMetrics:
+    """
+    Per-call-site LLM instrumentation: latency histogram and percentiles,
+    token usage, error outcomes and JSON parse results. Every record can
+    also be appended to a local JSONL file for offline analysis.
+    """
+
+    def __init__(self, sample_size=1000, jsonl_path=None):
+        self.sample_size = max(10, int(sample_size))
+        self.jsonl_path = jsonl_path
+        self._sites = {}
+        self._lock = threading.Lock()
+        self._file_lock = threading.Lock()
+
+    def _site(self, call_site):
+        stats = self._sites.get(call_site)
+        if stats is None:
+            stats = self._sites[call_site] = _SiteStats(self.sample_size)
+        return stats
+
+    def record_call(self, call_site, model, latency_seconds, prompt_tokens=0, completion_tokens=0,
+                    outcome='ok', stream=False, attempts=1):
+        """Record one completed (or failed) LLM request"""
+        latency_ms = latency_seconds * 1000.0
+        with self._lock:
+            stats = self._site(call_site)
+            stats.calls += 1
+            if model:
+                stats.models.add(model)
+            if outcome == 'cache_hit':
+                stats.cache_hits += 1
+            else:
+                stats.timed_calls += 1
+                stats.buckets[bisect.bisect_left(LATENCY_BUCKETS_MS, latency_ms)] += 1
+                stats.latency_sum_ms += latency_ms
+                stats.recent_latencies_ms.append(latency_ms)
+            if outcome not in ('ok', 'cache_hit'):
+                stats.errors[outcome] = stats.errors.get(outcome, 0) + 1
+            stats.prompt_tokens += prompt_tokens or 0
+            stats.completion_tokens += completion_tokens or 0
+
+        self._write({
+            'event': 'call',
+            'call_site': call_site,
+            'model': model,
+            'latency_ms': round(latency_ms, 1),
+            'prompt_tokens': prompt_tokens,
+            'completion_tokens': completion_tokens,
+            'outcome': outcome,
+            'stream': stream,
+            'attempts': attempts
+        })
+
+    def record_parse(self, call_site, success):
+        """Record whether the JSON in an LLM response could be parsed"""
+        with self._lock:
+            stats = self._site(call_site)
+            if success:
+                stats.parse_ok += 1
+            else:
+                stats.parse_failed += 1
+        if not success:
+            self._write({'event': 'parse', 'call_site': call_site, 'success': False})
+
+    def _write(self, record):
+        if not self.jsonl_path:
+            return
+        record['ts'] = datetime.utcnow().isoformat()
+        try:
+            with self._file_lock:
+                with open(self.jsonl_path, 'a', encoding='utf-8') as f:
+                    f.write(json.dumps(record, default=str) + '\n')
+        except Exception as e:
+            logger.error(f"Failed to write LLM metrics record: {str(e)}")
+
+    def get_stats(self):
+        with self._lock:
+            sites = {name: stats.to_dict() for name, stats in self._sites.items()}
+        # Slowest call sites first
+        ordered = sorted(sites.items(), key=lambda item: item[1]['latency_ms']['p99'] or 0, reverse=True)
+        return {
+            'call_sites': dict(ordered),
+            'total_calls': sum(s['calls'] for s in sites.values()),
+            'jsonl_path': self.jsonl_path or None
+        }
+
+    def reset(self):
+        with self._lock:
+            self._sites.clear()
+
+
+_metrics = None
+_metrics_lock = threading.Lock()
+
+
+def get_llm_metrics(config=None):
+    """Return the shared LLMCallMetrics, or None when instrumentation is disabled"""
+    global _metrics
+    config = config or {}
+    if not config.get('LLM_METRICS_ENABLED', True):
+        return None
+    if _metrics is None:
+        with _metrics_lock:
+            if _metrics is None:
+                _metrics = LLMCallMetrics(
+                    sample_size=config.get('LLM_METRICS_SAMPLE_SIZE', 1000),
+                    jsonl_path=config.get('LLM_METRICS_JSONL_PATH') or None
+                )
+    return _metrics
+
+
+def loads_llm_json(text, config=None):
+    """json.loads for LLM output that also records the parse outcome for the calling site"""
+    metrics = get_llm_metrics(config)
+    try:
+        data = json.loads(text)
+    except json.JSONDecodeError:
+        if metrics is not None:
+            metrics.record_parse(caller_site(), False)
+        raise
+    if metrics is not None:
+        metrics.record_parse(caller_site(), True)
+    return data
+
+
+def usage_tokens(response):
+    """(prompt_tokens, completion_tokens) from a completion response, zeros if unavailable"""
+    usage = getattr(response, 'usage', None)
+    if usage is None:
+        return 0, 0
+    return getattr(usage, 'prompt_tokens', 0) or 0, getattr(usage, 'completion_tokens', 0) or 0
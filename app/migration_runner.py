@@ -0,0 +1,108 @@
+import importlib
+import logging
+import pkgutil
+import re
+import time
+from contextlib import contextmanager
+from datetime import datetime
+from sqlalchemy import select
+from app import migrations
+from app.models import SchemaMigration
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+_MIGRATION_NAME = re.compile(r'^m\d{4}_\w+$')
+
+# Explicit transaction statements on an AUTOCOMMIT connection: pysqlite does not
+# put DDL in its implicit transactions and pymssql runs with autocommit=True
+_TRANSACTION_SQL = {
+    'mssql': ('BEGIN TRANSACTION', 'COMMIT TRANSACTION', 'ROLLBACK TRANSACTION'),
+    'sqlite': ('BEGIN', 'COMMIT', 'ROLLBACK'),
+}
+
+
+def discover_migrations():
+    """Migration module names in app/migrations, in order"""
+    return sorted(
+        name for _, name, is_package in pkgutil.iter_modules(migrations.__path__)
+        if not is_package and _MIGRATION_NAME.match(name)
+    )
+
+
+class MigrationRunner:
+    """
+    Applies pending app/migrations steps and records them in schema_migrations.
+    A failed step is rolled back (with its record, when transactional) and the
+    run stops, so the next run resumes from it. Callers serialize runs across
+    processes (bootstrap_lock).
+    """
+
+    def __init__(self, engine):
+        self.engine = engine
+        self.dialect = engine.dialect.name
+        self.logger = logger
+
+    def applied(self):
+        SchemaMigration.__table__.create(self.engine, checkfirst=True)
+        with self.engine.connect() as conn:
+            return set(conn.execute(select(SchemaMigration.id)).scalars())
+
+    def pending(self):
+        applied = self.applied()
+        return [name for name in discover_migrations() if name not in applied]
+
+    def upgrade(self):
+        """Run every pending step; returns the names applied"""
+        done = []
+        for name in self.pending():
+            module = importlib.import_module(f"app.migrations.{name}")
+            transactional = getattr(module, 'TRANSACTIONAL', True)
+            started = time.time()
+            try:
+                with self._connection(transactional) as conn:
+                    module.upgrade(conn, self.dialect)
+                    self._record(conn, name, int((time.time() - started) * 1000))
+            except Exception as e:
+                self.logger.error(f"Migration {name} failed: {str(e)}")
+                raise
+            self.logger.info(f"Applied migration {name} in {time.time() - started:.2f}s")
+            done.append(name)
+        return done
+
+    def stamp(self):
+        """Record every pending step as applied without running it (schema just built by create_all)"""
+        names = self.pending()
+        if names:
+            with self._connection(True) as conn:
+                for name in names:
+                    self._record(conn, name, None)
+            self.logger.info(f"Marked {len(names)} migration(s) as applied on a new database")
+        return names
+
+    def _record(self, conn, name, duration_ms):
+        conn.execute(SchemaMigration.__table__.insert().values(
+            id=name, applied_at=datetime.utcnow(), duration_ms=duration_ms
+        ))
+
+    @contextmanager
+    def _connection(self, transactional):
+        statements = _TRANSACTION_SQL.get(self.dialect)
+        if statements is None:
+            # Other dialects: SQLAlchemy's own transaction
+            with self.engine.begin() as conn:
+                yield conn
+            return
+
+        begin, commit, rollback = statements
+        with self.engine.connect().execution_options(isolation_level='AUTOCOMMIT') as conn:
+            if not transactional:
+                yield conn
+                return
+            conn.exec_driver_sql(begin)
+            try:
+                yield conn
+            except Exception:
+                conn.exec_driver_sql(rollback)
+                raise
+            conn.exec_driver_sql(commit)
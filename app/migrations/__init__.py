@@ -0,0 +1,10 @@
+"""
+Ordered schema migrations, applied by app/migration_runner.py.
+
+Each step is a module named mNNNN_description.py with an
+upgrade(conn, dialect) function ('mssql' or 'sqlite'). It runs once per
+database, inside a transaction together with its schema_migrations row,
+unless the module sets TRANSACTIONAL = False. New databases get the current
+schema from create_all and are marked as fully migrated, so steps only need
+to handle databases created before them.
+"""
@@ -0,0 +1,30 @@
+"""
+Composite indexes backing the hot query paths (mirrors __table_args__ in
+app/models.py) for databases created before they were added.
+"""
+from sqlalchemy import text
+
+HOT_PATH_INDEXES = [
+    ('IX_products_code_warehouse_active_expiry', 'products', ('product_code', 'warehouse_id', 'is_active', 'expiry_date')),
+    ('IX_users_phone', 'users', ('phone',)),
+    ('IX_cart_items_user_product', 'cart_items', ('user_id', 'product_id')),
+    ('IX_orders_warehouse_order_date', 'orders', ('warehouse_location', 'order_date')),
+    ('IX_conversations_user_created', 'conversations', ('user_id', 'created_at')),
+    ('IX_conversations_session_created', 'conversations', ('session_id', 'created_at')),
+    ('IX_pending_order_products_status_warehouse_code', 'pending_order_products', ('status', 'warehouse_id', 'product_code')),
+]
+
+
+def upgrade(conn, dialect):
+    for index_name, table_name, columns in HOT_PATH_INDEXES:
+        column_list = ', '.join(columns)
+        if dialect == 'mssql':
+            conn.execute(text(f"""
+                IF NOT EXISTS (SELECT 1 FROM sys.indexes WHERE name = '{index_name}'
+                               AND object_id = OBJECT_ID('dbo.{table_name}'))
+                BEGIN
+                    CREATE INDEX {index_name} ON dbo.{table_name}({column_list});
+                END
+            """))
+        else:
+            conn.execute(text(f"CREATE INDEX IF NOT EXISTS {index_name} ON {table_name}({column_list})"))
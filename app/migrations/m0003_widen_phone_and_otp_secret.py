@@ -0,0 +1,30 @@
+"""
+Widen users.phone to NVARCHAR(50) and users.otp_secret to NVARCHAR(255) on
+MSSQL databases created with the original column sizes (previously run by
+create_app on every start).
+"""
+from sqlalchemy import text
+
+
+def upgrade(conn, dialect):
+    if dialect != 'mssql':
+        return
+    
+    # Increase phone column to NVARCHAR(50)
+    conn.execute(text("""
+IF EXISTS (SELECT 1 FROM sys.columns c
+           JOIN sys.objects o ON o.object_id = c.object_id
+           WHERE o.name = 'users' AND c.name = 'phone' AND c.max_length < 100)
+BEGIN
+    ALTER TABLE dbo.users ALTER COLUMN phone NVARCHAR(50) NOT NULL;
+END
+"""))
+    # Increase otp_secret column to NVARCHAR(255)
+    conn.execute(text("""
+IF EXISTS (SELECT 1 FROM sys.columns c
+           JOIN sys.objects o ON o.object_id = c.object_id
+           WHERE o.name = 'users' AND c.name = 'otp_secret' AND c.max_length < 510)
+BEGIN
+    ALTER TABLE dbo.users ALTER COLUMN otp_secret NVARCHAR(255) NULL;
+END
+"""))
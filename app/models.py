@@ -2,6 +2,8 @@ from datetime import datetime, timedelta
 from flask_login import UserMixin
 from werkzeug.security import generate_password_hash, check_password_hash
 import hashlib
+import json
+import zlib
 from app import db
 import pyotp
 import secrets
@@ -10,6 +12,9 @@ import uuid
 class User(UserMixin, db.Model):
     """Enhanced User model for RB (Powered by Quantum Blue AI)"""
     __tablename__ = 'users'
+    __table_args__ = (
+        db.Index('IX_users_phone', 'phone'),  # WhatsApp webhook user lookup
+    )
     
     id = db.Column(db.Integer, primary_key=True)
     unique_id = db.Column(db.String(50), unique=True, nullable=False, index=True)  # Unique identifier for users
@@ -112,6 +117,10 @@ class User(UserMixin, db.Model):
 class Conversation(db.Model):
     """Conversation history model"""
     __tablename__ = 'conversations'
+    __table_args__ = (
+        db.Index('IX_conversations_user_created', 'user_id', 'created_at'),
+        db.Index('IX_conversations_session_created', 'session_id', 'created_at'),
+    )
     
     id = db.Column(db.Integer, primary_key=True)
     user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
@@ -182,6 +191,10 @@ class Warehouse(db.Model):
 class Product(db.Model):
     """Enhanced Product model for RB (Powered by Quantum Blue AI)"""
     __tablename__ = 'products'
+    __table_args__ = (
+        # FEFO allocation and availability checks
+        db.Index('IX_products_code_warehouse_active_expiry', 'product_code', 'warehouse_id', 'is_active', 'expiry_date'),
+    )
     
     id = db.Column(db.Integer, primary_key=True)
     product_code = db.Column(db.String(50), nullable=False, index=True)
@@ -246,6 +259,9 @@ class Product(db.Model):
 class Order(db.Model):
     """Enhanced Order model for RB (Powered by Quantum Blue AI)"""
     __tablename__ = 'orders'
+    __table_args__ = (
+        db.Index('IX_orders_warehouse_order_date', 'warehouse_location', 'order_date'),  # Distributor order lists
+    )
     
     id = db.Column(db.Integer, primary_key=True)
     order_id = db.Column(db.String(50), unique=True, nullable=False, index=True)
@@ -314,6 +330,9 @@ class Order(db.Model):
 class CartItem(db.Model):
     """Cart item model for managing user shopping cart"""
     __tablename__ = 'cart_items'
+    __table_args__ = (
+        db.Index('IX_cart_items_user_product', 'user_id', 'product_id'),
+    )
     
     id = db.Column(db.Integer, primary_key=True)
     product_code = db.Column(db.String(50), nullable=False)
@@ -404,6 +423,9 @@ class ChatSession(db.Model):
 class PendingOrderProducts(db.Model):
     """Model to track expired product orders that are waiting for stock"""
     __tablename__ = 'pending_order_products'
+    __table_args__ = (
+        db.Index('IX_pending_order_products_status_warehouse_code', 'status', 'warehouse_id', 'product_code'),
+    )
     
     id = db.Column(db.Integer, primary_key=True)
     
@@ -453,4 +475,135 @@ class PendingOrderProducts(db.Model):
             'requested_quantity': self.requested_quantity,
             'status': self.status,
             'created_at': self.created_at.isoformat() if self.created_at else None
-        }
\ No newline at end of file
+        }
+
+class DailySalesRollup(db.Model):
+    """Per-day, per-warehouse, per-product sales totals, maintained incrementally (see sales_rollup.py)"""
+    __tablename__ = 'daily_sales_rollups'
+    __table_args__ = (
+        db.UniqueConstraint('rollup_date', 'warehouse_location', 'product_code', name='UQ_daily_sales_rollups_day_warehouse_product'),
+        db.Index('IX_daily_sales_rollups_warehouse_date', 'warehouse_location', 'rollup_date'),
+    )
+    
+    id = db.Column(db.Integer, primary_key=True)
+    rollup_date = db.Column(db.Date, nullable=False)  # Day of the order (order_date)
+    warehouse_location = db.Column(db.String(100), nullable=False)
+    product_code = db.Column(db.String(50), nullable=False)
+    product_name = db.Column(db.String(200))
+    
+    # Placed orders
+    order_count = db.Column(db.Integer, default=0, nullable=False)
+    units = db.Column(db.Integer, default=0, nullable=False)  # Quantity ordered
+    paid_quantity = db.Column(db.Integer, default=0, nullable=False)
+    free_quantity = db.Column(db.Integer, default=0, nullable=False)
+    revenue = db.Column(db.Float, default=0.0, nullable=False)
+    discount = db.Column(db.Float, default=0.0, nullable=False)
+    
+    # Orders confirmed by the distributor (bucketed by order day as well)
+    confirmed_order_count = db.Column(db.Integer, default=0, nullable=False)
+    confirmed_units = db.Column(db.Integer, default=0, nullable=False)
+    confirmed_revenue = db.Column(db.Float, default=0.0, nullable=False)
+    
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    
+    def __repr__(self):
+        return f'<DailySalesRollup {self.rollup_date} {self.warehouse_location} {self.product_code}>'
+    
+    def to_dict(self):
+        """Convert to dictionary"""
+        return {
+            'date': self.rollup_date.isoformat() if self.rollup_date else None,
+            'warehouse_location': self.warehouse_location,
+            'product_code': self.product_code,
+            'product_name': self.product_name,
+            'order_count': self.order_count,
+            'units': self.units,
+            'paid_quantity': self.paid_quantity,
+            'free_quantity': self.free_quantity,
+            'revenue': round(self.revenue or 0, 2),
+            'discount': round(self.discount or 0, 2),
+            'confirmed_order_count': self.confirmed_order_count,
+            'confirmed_units': self.confirmed_units,
+            'confirmed_revenue': round(self.confirmed_revenue or 0, 2)
+        }
+
+class ConversationArchive(db.Model):
+    """
+    Cold storage for old conversations (see conversation_archive.py). Keeps the
+    original id, owner and timestamps uncompressed for lookups; the message
+    texts and data_sources are stored as one zlib-compressed JSON body.
+    """
+    __tablename__ = 'conversation_archives'
+    __table_args__ = (
+        db.Index('IX_conversation_archives_user_created', 'user_id', 'created_at'),
+        db.Index('IX_conversation_archives_session_created', 'session_id', 'created_at'),
+    )
+    
+    id = db.Column(db.Integer, primary_key=True, autoincrement=False)  # Original conversations.id
+    user_id = db.Column(db.Integer, nullable=False)
+    session_id = db.Column(db.Integer, nullable=True)  # chat_sessions.id
+    response_time = db.Column(db.Float)
+    created_at = db.Column(db.DateTime, nullable=False)
+    archived_at = db.Column(db.DateTime, default=datetime.utcnow)
+    
+    # Compressed {user_message, bot_response, data_sources}
+    body = db.Column(db.LargeBinary, nullable=False)
+    codec = db.Column(db.String(10), default='zlib', nullable=False)
+    raw_size = db.Column(db.Integer, default=0, nullable=False)  # Bytes of the uncompressed body
+    
+    @staticmethod
+    def pack_body(user_message, bot_response, data_sources):
+        """(compressed body, uncompressed size)"""
+        raw = json.dumps({
+            'user_message': user_message,
+            'bot_response': bot_response,
+            'data_sources': data_sources
+        }, default=str, ensure_ascii=False).encode('utf-8')
+        return zlib.compress(raw, 9), len(raw)
+    
+    @staticmethod
+    def unpack(body, codec='zlib'):
+        """{user_message, bot_response, data_sources} from a packed body"""
+        if codec != 'zlib':
+            raise ValueError(f"Unknown archive codec: {codec}")
+        return json.loads(zlib.decompress(body).decode('utf-8'))
+    
+    def unpack_body(self):
+        return self.unpack(self.body, self.codec)
+    
+    def __repr__(self):
+        return f'<ConversationArchive {self.id} - User {self.user_id}>'
+    
+    def to_dict(self):
+        """Same shape as Conversation.to_dict"""
+        body = self.unpack_body()
+        return {
+            'id': self.id,
+            'user_message': body.get('user_message'),
+            'bot_response': body.get('bot_response'),
+            'data_sources': body.get('data_sources'),
+            'response_time': self.response_time,
+            'created_at': self.created_at.isoformat()
+        }
+
+class BootstrapState(db.Model):
+    """Applied schema fingerprint and sample-data version, so startup skips work already done (see bootstrap.py)"""
+    __tablename__ = 'app_bootstrap_state'
+    
+    component = db.Column(db.String(50), primary_key=True)  # 'schema' or 'seed'
+    version = db.Column(db.String(64), nullable=False)
+    applied_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    
+    def __repr__(self):
+        return f'<BootstrapState {self.component}={self.version}>'
+
+class SchemaMigration(db.Model):
+    """One applied step from app/migrations (see migration_runner.py)"""
+    __tablename__ = 'schema_migrations'
+    
+    id = db.Column(db.String(100), primary_key=True)  # Module name, e.g. m0002_hot_path_indexes
+    applied_at = db.Column(db.DateTime, default=datetime.utcnow)
+    duration_ms = db.Column(db.Integer)  # NULL when stamped without running (new database)
+    
+    def __repr__(self):
+        return f'<SchemaMigration {self.id}>'
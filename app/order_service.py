@@ -4,6 +4,7 @@ from flask import current_app
 from app import db
 from app.models import Order, OrderItem, Product, User
 from app.database_service import DatabaseService
+from app.sales_rollup import SalesRollupService
 from app.email_utils import send_email
 
 logging.basicConfig(level=logging.INFO)
@@ -14,6 +15,7 @@ class OrderService:
     
     def __init__(self):
         self.db_service = DatabaseService()
+        self.rollup_service = SalesRollupService()
         self.logger = logger
     
     def create_order_from_cart(self, user_id, cart_items, warehouse_id, warehouse_location, user_email):
@@ -26,36 +28,47 @@ class OrderService:
             if not validated_items:
                 return None, "Invalid cart items or insufficient stock"
             
-            # Create order
-            order = self.db_service.create_order(
+            # Reserve stock for every line with guarded UPDATEs (FEFO across batches);
+            # nothing is written when any line can no longer be covered
+            allocations, allocation_message = self.db_service.allocate_order_fefo(
+                [{'product_code': item['product_code'], 'quantity': item['quantity']} for item in validated_items],
+                warehouse_id=warehouse_id,
+                commit=False
+            )
+            if allocations is None:
+                return None, allocation_message
+            
+            # Create order; the order, its items and the reservations are committed together
+            order = Order(
                 user_id=user_id,
                 warehouse_id=warehouse_id,
                 warehouse_location=warehouse_location,
                 user_email=user_email
             )
+            order.generate_order_id()
+            db.session.add(order)
+            db.session.flush()
             
             total_amount = 0
             
             # Add order items
             for item in validated_items:
-                order_item = self.db_service.add_order_item(
+                order_item = OrderItem(
                     order_id=order.id,
                     product_id=item['product_id'],
                     product_code=item['product_code'],
-                    quantity=item['quantity'],
-                    unit_price=item['unit_price']
+                    product_quantity_ordered=item['quantity'],
+                    unit_price=item['unit_price'],
+                    total_price=item['quantity'] * item['unit_price']
                 )
+                db.session.add(order_item)
                 total_amount += order_item.total_price
-                
-                # Update product quantities
-                self.db_service.update_product_quantities(
-                    {item['product_code']: item['quantity']}
-                )
             
             # Update order total
             order.total_amount = total_amount
             order.status = 'confirmed'
             db.session.commit()
+            self.rollup_service.record_order_placed(order)
             
             # Send confirmation emails
             self._send_order_confirmation_emails(order, user_email)
@@ -0,0 +1,351 @@
+import logging
+import math
+import threading
+import time
+from collections import deque
+from sqlalchemy import event
+from sqlalchemy.exc import TimeoutError as PoolTimeoutError
+from sqlalchemy.pool import QueuePool
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Recent checkouts kept per pool for percentiles and sizing recommendations
+SAMPLE_SIZE = 2000
+
+SIZING_MODES = ('off', 'recommend', 'apply')
+
+# Wait time of the checkout in progress on this thread (set by _do_get, read by connect)
+_checkout_local = threading.local()
+
+
+def _percentile(sorted_values, pct):
+    if not sorted_values:
+        return None
+    index = min(len(sorted_values) - 1, int(round(pct / 100.0 * (len(sorted_values) - 1))))
+    return sorted_values[index]
+
+
+def _round(value):
+    return round(value, 2) if value is not None else None
+
+
+class PoolStats:
+    """Checkout counters and recent samples of one named pool ('primary', 'replica')"""
+
+    def __init__(self, name):
+        self.name = name
+        self.lock = threading.Lock()
+        self.pool = None  # Current pool; engines replace it on dispose() and resize
+        self.checkouts = 0
+        self.checkins = 0
+        self.in_use = 0
+        self.peak_in_use = 0
+        self.overflow_checkouts = 0
+        self.timeouts = 0
+        self.connects = 0
+        self.invalidations = 0
+        self.soft_invalidations = 0
+        self.wait_ms_sum = 0.0
+        self.wait_ms_max = 0.0
+        self.overhead_ms_sum = 0.0
+        self.recent_wait_ms = deque(maxlen=SAMPLE_SIZE)
+        self.recent_overhead_ms = deque(maxlen=SAMPLE_SIZE)
+        self.recent_in_use = deque(maxlen=SAMPLE_SIZE)  # Connections in use right after each checkout
+        self.timeouts_at_last_sizing = 0
+        self.resizes = 0
+        self.started_at = time.time()
+
+    def record_wait(self, wait_ms, overflowing):
+        with self.lock:
+            self.wait_ms_sum += wait_ms
+            self.wait_ms_max = max(self.wait_ms_max, wait_ms)
+            self.recent_wait_ms.append(wait_ms)
+            if overflowing:
+                self.overflow_checkouts += 1
+
+    def record_overhead(self, overhead_ms):
+        with self.lock:
+            self.overhead_ms_sum += overhead_ms
+            self.recent_overhead_ms.append(overhead_ms)
+
+    def concurrency_sample(self):
+        with self.lock:
+            return sorted(self.recent_in_use)
+
+    def to_dict(self):
+        with self.lock:
+            waits = sorted(self.recent_wait_ms)
+            overheads = sorted(self.recent_overhead_ms)
+            concurrency = sorted(self.recent_in_use)
+            data = {
+                'checkouts': self.checkouts,
+                'checkins': self.checkins,
+                'in_use': self.in_use,
+                'peak_in_use': self.peak_in_use,
+                'overflow_checkouts': self.overflow_checkouts,
+                'timeouts': self.timeouts,
+                'connections_opened': self.connects,
+                'invalidations': self.invalidations,
+                'soft_invalidations': self.soft_invalidations,
+                'resizes': self.resizes,
+                # Time spent waiting for a free (or new overflow) connection
+                'checkout_wait_ms': {
+                    'avg': round(self.wait_ms_sum / self.checkouts, 2) if self.checkouts else None,
+                    'p50': _round(_percentile(waits, 50)),
+                    'p95': _round(_percentile(waits, 95)),
+                    'p99': _round(_percentile(waits, 99)),
+                    'max': round(self.wait_ms_max, 2)
+                },
+                # Rest of the checkout, mostly the pool_pre_ping round trip
+                'checkout_overhead_ms': {
+                    'avg': round(self.overhead_ms_sum / self.checkouts, 2) if self.checkouts else None,
+                    'p95': _round(_percentile(overheads, 95))
+                },
+                'concurrency': {
+                    'p50': _percentile(concurrency, 50),
+                    'p95': _percentile(concurrency, 95),
+                    'max_recent': concurrency[-1] if concurrency else None
+                },
+                'uptime_seconds': round(time.time() - self.started_at)
+            }
+        pool = self.pool
+        if pool is not None:
+            data['pool'] = {
+                'pool_size': pool.size(),
+                'max_overflow': pool._max_overflow,
+                'timeout': pool.timeout(),
+                'checked_in': pool.checkedin(),
+                'checked_out': pool.checkedout(),
+                'status': pool.status()
+            }
+        return data
+
+
+_pool_stats = {}
+_pool_stats_lock = threading.Lock()
+
+
+def get_pool_stats(name):
+    """PoolStats for a pool name, shared by every pool the engine creates under that name"""
+    with _pool_stats_lock:
+        if name not in _pool_stats:
+            _pool_stats[name] = PoolStats(name)
+        return _pool_stats[name]
+
+
+def _listen(pool, stats):
+    def on_connect(dbapi_connection, connection_record):
+        with stats.lock:
+            stats.connects += 1
+
+    def on_checkout(dbapi_connection, connection_record, connection_proxy):
+        with stats.lock:
+            stats.checkouts += 1
+            stats.in_use += 1
+            stats.peak_in_use = max(stats.peak_in_use, stats.in_use)
+            stats.recent_in_use.append(stats.in_use)
+
+    def on_checkin(dbapi_connection, connection_record):
+        with stats.lock:
+            stats.checkins += 1
+            stats.in_use = max(stats.in_use - 1, 0)
+
+    def on_invalidate(dbapi_connection, connection_record, exception):
+        with stats.lock:
+            stats.invalidations += 1
+
+    def on_soft_invalidate(dbapi_connection, connection_record, exception):
+        with stats.lock:
+            stats.soft_invalidations += 1
+
+    event.listen(pool, 'connect', on_connect)
+    event.listen(pool, 'checkout', on_checkout)
+    event.listen(pool, 'checkin', on_checkin)
+    event.listen(pool, 'invalidate', on_invalidate)
+    event.listen(pool, 'soft_invalidate', on_soft_invalidate)
+
+
+class TelemetryQueuePool(QueuePool):
+    """
+    QueuePool that reports to the PoolStats of its logging name: pool events
+    count checkouts, connects and invalidations, _do_get times the wait for a
+    connection (and counts timeouts), connect() times the rest of the
+    checkout (pre-ping). Listeners travel with recreate(), so the counters
+    survive engine.dispose() and resize_pool().
+    """
+
+    def __init__(self, creator, **kw):
+        recreated = kw.get('_dispatch') is not None
+        super().__init__(creator, **kw)
+        self.stats = get_pool_stats(self._orig_logging_name or 'default')
+        self.stats.pool = self
+        if not recreated:
+            _listen(self, self.stats)
+
+    def connect(self):
+        started = time.perf_counter()
+        _checkout_local.wait_ms = 0.0
+        connection = super().connect()
+        total_ms = (time.perf_counter() - started) * 1000
+        self.stats.record_overhead(max(total_ms - _checkout_local.wait_ms, 0.0))
+        return connection
+
+    def _do_get(self):
+        # QueuePool._do_get retries by calling itself; only time the outermost call
+        if getattr(_checkout_local, 'in_get', False):
+            return super()._do_get()
+        _checkout_local.in_get = True
+        started = time.perf_counter()
+        try:
+            record = super()._do_get()
+        except PoolTimeoutError:
+            with self.stats.lock:
+                self.stats.timeouts += 1
+            raise
+        finally:
+            _checkout_local.in_get = False
+        wait_ms = (time.perf_counter() - started) * 1000
+        _checkout_local.wait_ms = wait_ms
+        self.stats.record_wait(wait_ms, self.overflow() > 0)
+        return record
+
+
+def configure_pool_telemetry(app):
+    """Select TelemetryQueuePool for the primary and bind engines; call before db.init_app"""
+    if app.config.get('POOL_SIZING_MODE', 'off') not in SIZING_MODES:
+        logger.warning(f"Unknown POOL_SIZING_MODE {app.config.get('POOL_SIZING_MODE')!r}; pool sizing is off")
+        app.config['POOL_SIZING_MODE'] = 'off'
+    if not app.config.get('POOL_TELEMETRY_ENABLED', True):
+        app.config['POOL_SIZING_MODE'] = 'off'  # Sizing needs the telemetry pool
+        return
+    # Copies: from_object() shares these dicts with the Config class
+    options = dict(app.config.get('SQLALCHEMY_ENGINE_OPTIONS') or {})
+    options.setdefault('poolclass', TelemetryQueuePool)
+    options.setdefault('pool_logging_name', 'primary')
+    app.config['SQLALCHEMY_ENGINE_OPTIONS'] = options
+
+    binds = {}
+    for key, value in (app.config.get('SQLALCHEMY_BINDS') or {}).items():
+        # Binds do not inherit SQLALCHEMY_ENGINE_OPTIONS; plain URL binds keep the default pool
+        if isinstance(value, dict):
+            value = dict(value)
+            value.setdefault('poolclass', TelemetryQueuePool)
+            value.setdefault('pool_logging_name', key)
+        binds[key] = value
+    app.config['SQLALCHEMY_BINDS'] = binds
+
+
+def telemetry_pools(engines):
+    """{pool name: engine} for the engines whose pool reports telemetry"""
+    return {
+        engine.pool.stats.name: engine
+        for engine in engines.values()
+        if isinstance(engine.pool, TelemetryQueuePool)
+    }
+
+
+# ----------------------------------------------------------------------------
+## ADAPTIVE SIZING (POOL_SIZING_MODE: off, recommend or apply)
+# ----------------------------------------------------------------------------
+
+def recommend_pool_size(stats, config):
+    """
+    Pool size covering the p95 checkout concurrency and overflow up to the
+    recent peak, both with POOL_SIZING_HEADROOM, clamped to POOL_MIN_SIZE and
+    POOL_MAX_CONNECTIONS (per process). Timeouts since the last sizing grow
+    the pool by half its current capacity. None until enough checkouts.
+    """
+    pool = stats.pool
+    concurrency = stats.concurrency_sample()
+    if pool is None or len(concurrency) < config.get('POOL_SIZING_MIN_SAMPLES', 200):
+        return None
+
+    headroom = config.get('POOL_SIZING_HEADROOM', 1.25)
+    min_size = config.get('POOL_MIN_SIZE', 2)
+    max_connections = max(config.get('POOL_MAX_CONNECTIONS', 30), min_size)
+    p95 = _percentile(concurrency, 95)
+    peak = concurrency[-1]
+
+    pool_size = math.ceil(p95 * headroom)
+    capacity = math.ceil(peak * headroom)
+    reason = f"p95 concurrency {p95}, peak {peak}"
+    new_timeouts = stats.timeouts - stats.timeouts_at_last_sizing
+    if new_timeouts > 0:
+        current_capacity = pool.size() + max(pool._max_overflow, 0)
+        capacity = max(capacity, math.ceil(current_capacity * 1.5))
+        reason += f", {new_timeouts} checkout timeout(s)"
+
+    pool_size = min(max(pool_size, min_size), max_connections)
+    max_overflow = min(max(capacity - pool_size, 0), max_connections - pool_size)
+    return {
+        'pool_size': pool_size,
+        'max_overflow': max_overflow,
+        'current_pool_size': pool.size(),
+        'current_max_overflow': pool._max_overflow,
+        'changed': (pool_size, max_overflow) != (pool.size(), pool._max_overflow),
+        'reason': reason
+    }
+
+
+def resize_pool(engine, pool_size, max_overflow):
+    """
+    Swap the engine's pool for one of the same class with the new size.
+    Checked-out connections finish on the old pool and are closed with it;
+    idle ones are closed now, as in engine.dispose().
+    """
+    old_pool = engine.pool
+    engine.pool = old_pool.__class__(
+        old_pool._creator,
+        pool_size=pool_size,
+        max_overflow=max_overflow,
+        pre_ping=old_pool._pre_ping,
+        use_lifo=old_pool._pool.use_lifo,
+        timeout=old_pool._timeout,
+        recycle=old_pool._recycle,
+        echo=old_pool.echo,
+        logging_name=old_pool._orig_logging_name,
+        reset_on_return=old_pool._reset_on_return,
+        _dispatch=old_pool.dispatch,
+        dialect=old_pool._dialect,
+    )
+    old_pool.dispose()
+    return engine.pool
+
+
+def get_pool_report(engines, config):
+    """Stats of every telemetry pool, with sizing recommendations unless sizing is off"""
+    mode = config.get('POOL_SIZING_MODE', 'off')
+    pools = {}
+    for name, engine in telemetry_pools(engines).items():
+        pools[name] = engine.pool.stats.to_dict()
+        if mode != 'off':
+            pools[name]['recommendation'] = recommend_pool_size(engine.pool.stats, config)
+    return {'sizing_mode': mode, 'pools': pools}
+
+
+def apply_pool_sizing(engines, config):
+    """Resize pools whose recommendation differs from their size; returns {name: recommendation}"""
+    applied = {}
+    for name, engine in telemetry_pools(engines).items():
+        stats = engine.pool.stats
+        recommendation = recommend_pool_size(stats, config)
+        if recommendation is None:
+            continue
+        with stats.lock:
+            stats.timeouts_at_last_sizing = stats.timeouts
+        if not recommendation['changed']:
+            continue
+        try:
+            resize_pool(engine, recommendation['pool_size'], recommendation['max_overflow'])
+            with stats.lock:
+                stats.resizes += 1
+            applied[name] = recommendation
+            logger.info(
+                f"Resized {name} pool to pool_size={recommendation['pool_size']} "
+                f"max_overflow={recommendation['max_overflow']} "
+                f"(was {recommendation['current_pool_size']}/{recommendation['current_max_overflow']}; {recommendation['reason']})"
+            )
+        except Exception as e:
+            logger.error(f"Error resizing {name} pool: {str(e)}")
+    return applied
@@ -13,13 +13,15 @@ class PricingService:
     def __init__(self):
         self.logger = logger
     
-    def calculate_product_pricing(self, product_id, quantity):
+    def calculate_product_pricing(self, product_id, quantity, product=None):
         """
         Calculate pricing for a product with discounts and schemes
         Returns detailed pricing breakdown
+        Pass product when it is already loaded to skip the lookup
         """
         try:
-            product = Product.query.get(product_id)
+            if product is None:
+                product = Product.query.get(product_id)
             if not product:
                 return {
                     'error': 'Product not found',
@@ -0,0 +1,148 @@
+import logging
+import threading
+import time
+from flask import current_app, g, has_app_context, has_request_context, session as flask_session
+from sqlalchemy import event
+from sqlalchemy.orm import Session, scoped_session, sessionmaker
+from app import db
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+REPLICA_BIND = 'replica'
+
+# Flask session key holding the time until which this browser reads from the primary
+_STICKY_KEY = 'db_primary_until'
+_WROTE_KEY = 'db_session_wrote'
+# g key for the user of requests without a browser session (WhatsApp webhook)
+_USER_KEY = 'db_user_id'
+
+# user id -> time until which that user's requests read from the primary
+_primary_until = {}
+_primary_until_lock = threading.Lock()
+
+
+class ReplicaSession(Session):
+    """Session on the read replica: anything it would write is a bug, so flushing changes raises"""
+
+    def flush(self, objects=None):
+        if self.new or self.dirty or self.deleted:
+            raise RuntimeError("Read replica session cannot write; load rows to modify from db.session")
+
+
+def init_read_replica(app):
+    """Create the replica session factory when READ_REPLICA_DATABASE_URI is configured"""
+    if not app.config.get('READ_REPLICA_DATABASE_URI'):
+        return
+    with app.app_context():
+        engine = db.engines[REPLICA_BIND]
+    factory = scoped_session(sessionmaker(bind=engine, class_=ReplicaSession, query_cls=db.Query, autoflush=False))
+    app.extensions['read_replica'] = factory
+
+    @app.teardown_appcontext
+    def remove_replica_session(exception=None):
+        factory.remove()
+
+    logger.info(f"Read replica enabled ({engine.url.render_as_string(hide_password=True)})")
+
+
+def disable_read_replica(app):
+    """Route everything to the primary again (e.g. after falling back to SQLite)"""
+    app.extensions.pop('read_replica', None)
+
+
+def replica_session():
+    """The request's replica session, or None when no replica is configured"""
+    return current_app.extensions.get('read_replica')
+
+
+def set_request_user(user_id):
+    """
+    Name the user a request acts for when it has no browser session (WhatsApp
+    webhook), so their commits and reads share the read-your-writes window
+    """
+    setattr(g, _USER_KEY, user_id)
+
+
+def _request_user_id():
+    user_id = g.get(_USER_KEY)
+    if user_id is None and has_request_context():
+        user_id = flask_session.get('user_id')
+    return user_id
+
+
+def _user_pinned(user_id, now):
+    with _primary_until_lock:
+        return _primary_until.get(user_id, 0) > now
+
+
+def _pin_user(user_id, until):
+    with _primary_until_lock:
+        _primary_until[user_id] = until
+        if len(_primary_until) > 10000:
+            now = time.time()
+            for expired in [key for key, value in _primary_until.items() if value <= now]:
+                del _primary_until[expired]
+
+
+def should_read_from_replica():
+    """
+    Replica reads only serve web requests whose user has not written recently:
+    background jobs, scripts and any request within READ_YOUR_WRITES_SECONDS
+    of the same user's last commit read the primary. The window is kept per
+    user id in this process, so it also covers WhatsApp (no cookie) and commits
+    made while streaming; the cookie copy carries it to other workers for browsers.
+    """
+    if replica_session() is None or not has_request_context():
+        return False
+    if g.get(_WROTE_KEY):
+        return False
+    now = time.time()
+    user_id = _request_user_id()
+    if user_id is not None and _user_pinned(user_id, now):
+        return False
+    primary_until = flask_session.get(_STICKY_KEY)
+    return not primary_until or primary_until <= now
+
+
+def read_session():
+    """Session for read-only queries whose results are never modified"""
+    return replica_session() if should_read_from_replica() else db.session
+
+
+# ----------------------------------------------------------------------------
+## READ-YOUR-WRITES (a commit that wrote pins its user to the primary)
+# ----------------------------------------------------------------------------
+
+@event.listens_for(Session, 'after_flush')
+def _note_flush(session, flush_context):
+    session.info[_WROTE_KEY] = True
+
+
+@event.listens_for(Session, 'do_orm_execute')
+def _note_bulk_write(orm_execute_state):
+    # Query.update()/delete() (e.g. stock reservation) write without a flush
+    if orm_execute_state.is_update or orm_execute_state.is_delete:
+        orm_execute_state.session.info[_WROTE_KEY] = True
+
+
+@event.listens_for(Session, 'after_commit')
+def _pin_to_primary(session):
+    if not session.info.pop(_WROTE_KEY, False) or not has_app_context():
+        return
+    try:
+        setattr(g, _WROTE_KEY, True)
+        until = time.time() + current_app.config.get('READ_YOUR_WRITES_SECONDS', 10)
+        user_id = _request_user_id()
+        if user_id is not None:
+            _pin_user(user_id, until)
+        if has_request_context():
+            # Not saved once a streaming response has sent its headers; the per-user window still applies
+            flask_session[_STICKY_KEY] = until
+    except Exception as e:
+        logger.debug(f"Could not record read-your-writes window: {str(e)}")
+
+
+@event.listens_for(Session, 'after_rollback')
+def _discard_flush(session):
+    session.info.pop(_WROTE_KEY, None)
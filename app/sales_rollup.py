@@ -0,0 +1,307 @@
+import logging
+from datetime import date, datetime, timedelta
+from flask import current_app
+from sqlalchemy import func
+from sqlalchemy.exc import IntegrityError
+from app import db
+from app.database_service import DatabaseService
+from app.models import DailySalesRollup, Order, OrderItem, Product
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# product_code of the per-day order-level row (an order with several products counts once)
+ORDER_TOTAL_CODE = '*'
+
+PLACED_COLUMNS = ('order_count', 'units', 'paid_quantity', 'free_quantity', 'revenue', 'discount')
+CONFIRMED_COLUMNS = ('confirmed_order_count', 'confirmed_units', 'confirmed_revenue')
+
+
+def _as_date(value):
+    """Day values come back as date objects, or as 'YYYY-MM-DD' strings on SQLite"""
+    if isinstance(value, datetime):
+        return value.date()
+    if isinstance(value, date):
+        return value
+    return datetime.strptime(str(value)[:10], '%Y-%m-%d').date()
+
+
+class SalesRollupService:
+    """
+    Maintains daily_sales_rollups: per day, warehouse and product totals of
+    placed and distributor-confirmed orders, plus one order-level row per day
+    (product_code '*'). Cancelled orders are left out, as in the SQL analytics.
+    Rows are bumped right after an order is committed (and taken back out when
+    it is cancelled); rebuild() recomputes any range from orders/order_items.
+    """
+
+    def __init__(self):
+        self.db_service = DatabaseService()
+        self.logger = logger
+
+    def _enabled(self):
+        return current_app.config.get('SALES_ROLLUP_ENABLED', True)
+
+    # Incremental maintenance
+    def record_order_placed(self, order):
+        """Add a just-committed order to the rollups"""
+        self._record(order, confirmed=False)
+
+    def record_order_confirmed(self, order):
+        """Add a just-confirmed order to the confirmed columns of the rollups"""
+        self._record(order, confirmed=True)
+
+    def record_order_cancelled(self, order):
+        """Take a just-cancelled order back out of the placed (and confirmed) columns"""
+        self._record(order, confirmed=False, sign=-1)
+        if order.distributor_confirmed:
+            self._record(order, confirmed=True, sign=-1)
+
+    def _record(self, order, confirmed, sign=1):
+        if not self._enabled():
+            return
+        if sign > 0 and order.status == 'cancelled':
+            return
+        # A concurrent first insert of the same (day, warehouse, product) row loses once, then updates
+        for attempt in range(2):
+            try:
+                deltas = self._order_deltas(order, confirmed, sign)
+                if not deltas:
+                    return
+                day = (order.order_date or datetime.utcnow()).date()
+                self._apply_deltas(day, order.warehouse_location, deltas)
+                db.session.commit()
+                return
+            except IntegrityError:
+                db.session.rollback()
+                if attempt:
+                    self.logger.error(f"Sales rollup update for order {order.order_id} kept conflicting; run rebuild_sales_rollups.py")
+            except Exception as e:
+                db.session.rollback()
+                self.logger.error(f"Sales rollup update failed for order {order.order_id}: {str(e)}; run rebuild_sales_rollups.py")
+                return
+
+    def _order_deltas(self, order, confirmed, sign=1):
+        """Column increments per product_code (and the order-level row) for one order; sign=-1 removes it"""
+        rows = db.session.query(
+            OrderItem.product_code,
+            func.max(Product.product_name),
+            func.coalesce(func.sum(OrderItem.product_quantity_ordered), 0),
+            func.coalesce(func.sum(OrderItem.paid_quantity), 0),
+            func.coalesce(func.sum(OrderItem.free_quantity), 0),
+            func.coalesce(func.sum(OrderItem.total_price), 0),
+            func.coalesce(func.sum(OrderItem.discount_amount), 0)
+        ).outerjoin(
+            Product, Product.id == OrderItem.product_id
+        ).filter(
+            OrderItem.order_id == order.id
+        ).group_by(OrderItem.product_code).all()
+        if not rows:
+            return {}
+
+        deltas = {}
+        total = {'product_name': None}
+        for product_code, product_name, units, paid, free, revenue, discount in rows:
+            if confirmed:
+                values = {'confirmed_order_count': sign, 'confirmed_units': sign * int(units), 'confirmed_revenue': sign * float(revenue)}
+            else:
+                values = {
+                    'order_count': sign, 'units': sign * int(units), 'paid_quantity': sign * int(paid),
+                    'free_quantity': sign * int(free), 'revenue': sign * float(revenue), 'discount': sign * float(discount)
+                }
+            for column, value in values.items():
+                if column not in ('order_count', 'confirmed_order_count'):
+                    total[column] = total.get(column, 0) + value
+                else:
+                    total[column] = sign
+            values['product_name'] = product_name
+            deltas[product_code] = values
+        deltas[ORDER_TOTAL_CODE] = total
+        return deltas
+
+    def _apply_deltas(self, day, warehouse_location, deltas):
+        """Increment existing rows in SQL, insert missing ones (caller commits)"""
+        existing = dict(db.session.query(DailySalesRollup.product_code, DailySalesRollup.id).filter(
+            DailySalesRollup.rollup_date == day,
+            DailySalesRollup.warehouse_location == warehouse_location,
+            DailySalesRollup.product_code.in_(list(deltas))
+        ).all())
+
+        for product_code, values in deltas.items():
+            product_name = values.pop('product_name', None)
+            rollup_id = existing.get(product_code)
+            if rollup_id is None:
+                db.session.add(DailySalesRollup(
+                    rollup_date=day,
+                    warehouse_location=warehouse_location,
+                    product_code=product_code,
+                    product_name=product_name,
+                    **{column: values.get(column, 0) for column in PLACED_COLUMNS + CONFIRMED_COLUMNS}
+                ))
+            else:
+                updates = {getattr(DailySalesRollup, column): getattr(DailySalesRollup, column) + value for column, value in values.items()}
+                updates[DailySalesRollup.updated_at] = datetime.utcnow()
+                DailySalesRollup.query.filter(DailySalesRollup.id == rollup_id).update(updates, synchronize_session=False)
+        db.session.flush()
+
+    # Backfill / rebuild
+    def rebuild(self, since=None, until=None):
+        """
+        Recompute the rollups for order days in [since, until] (dates, both optional)
+        from orders and order_items, replacing the existing rows in that range.
+        Returns the number of rollup rows written.
+        """
+        try:
+            day = self.db_service.order_day_expression().label('day')
+
+            def in_range(query):
+                if since:
+                    query = query.filter(Order.order_date >= datetime.combine(since, datetime.min.time()))
+                if until:
+                    query = query.filter(Order.order_date < datetime.combine(until + timedelta(days=1), datetime.min.time()))
+                return query
+
+            rows = {}
+
+            def row_for(order_day, warehouse_location, product_code, product_name=None):
+                key = (_as_date(order_day), warehouse_location, product_code)
+                if key not in rows:
+                    rows[key] = dict(
+                        rollup_date=key[0], warehouse_location=warehouse_location, product_code=product_code,
+                        product_name=product_name, **{column: 0 for column in PLACED_COLUMNS + CONFIRMED_COLUMNS}
+                    )
+                return rows[key]
+
+            # Per product
+            for confirmed in (False, True):
+                query = db.session.query(
+                    day,
+                    Order.warehouse_location,
+                    OrderItem.product_code,
+                    func.max(Product.product_name),
+                    func.count(func.distinct(Order.id)),
+                    func.coalesce(func.sum(OrderItem.product_quantity_ordered), 0),
+                    func.coalesce(func.sum(OrderItem.paid_quantity), 0),
+                    func.coalesce(func.sum(OrderItem.free_quantity), 0),
+                    func.coalesce(func.sum(OrderItem.total_price), 0),
+                    func.coalesce(func.sum(OrderItem.discount_amount), 0)
+                ).join(
+                    Order, Order.id == OrderItem.order_id
+                ).outerjoin(
+                    Product, Product.id == OrderItem.product_id
+                ).filter(
+                    Order.status != 'cancelled'
+                )
+                if confirmed:
+                    query = query.filter(Order.distributor_confirmed == True)
+                query = in_range(query).group_by(day, Order.warehouse_location, OrderItem.product_code)
+
+                for order_day, location, product_code, product_name, orders, units, paid, free, revenue, discount in query.all():
+                    for code in (product_code, ORDER_TOTAL_CODE):
+                        row = row_for(order_day, location, code, product_name if code == product_code else None)
+                        if confirmed:
+                            row['confirmed_units'] += int(units)
+                            row['confirmed_revenue'] += float(revenue)
+                            if code == product_code:
+                                row['confirmed_order_count'] = orders
+                        else:
+                            row['units'] += int(units)
+                            row['paid_quantity'] += int(paid)
+                            row['free_quantity'] += int(free)
+                            row['revenue'] += float(revenue)
+                            row['discount'] += float(discount)
+                            if code == product_code:
+                                row['order_count'] = orders
+
+            # Order-level counts (an order counts once per day, whatever its products)
+            for confirmed in (False, True):
+                query = db.session.query(
+                    day, Order.warehouse_location, func.count(func.distinct(Order.id))
+                ).join(OrderItem, OrderItem.order_id == Order.id).filter(Order.status != 'cancelled')
+                if confirmed:
+                    query = query.filter(Order.distributor_confirmed == True)
+                for order_day, location, orders in in_range(query).group_by(day, Order.warehouse_location).all():
+                    row_for(order_day, location, ORDER_TOTAL_CODE)['confirmed_order_count' if confirmed else 'order_count'] = orders
+
+            delete_query = DailySalesRollup.query
+            if since:
+                delete_query = delete_query.filter(DailySalesRollup.rollup_date >= since)
+            if until:
+                delete_query = delete_query.filter(DailySalesRollup.rollup_date <= until)
+            deleted = delete_query.delete(synchronize_session=False)
+
+            db.session.bulk_insert_mappings(DailySalesRollup, list(rows.values()))
+            db.session.commit()
+            self.logger.info(f"Sales rollups rebuilt: {deleted} rows replaced by {len(rows)}")
+            return len(rows)
+        except Exception as e:
+            self.logger.error(f"Error rebuilding sales rollups: {str(e)}")
+            db.session.rollback()
+            raise
+
+    # Reads (O(days), no scan of orders; served by the read replica when configured)
+    def get_revenue_by_day(self, warehouse_location, days=30):
+        """Orders and revenue per day over the last `days` days"""
+        since = datetime.utcnow().date() - timedelta(days=days)
+        rows = self.db_service.read_query(DailySalesRollup).filter(
+            DailySalesRollup.warehouse_location == warehouse_location,
+            DailySalesRollup.product_code == ORDER_TOTAL_CODE,
+            DailySalesRollup.rollup_date >= since
+        ).order_by(DailySalesRollup.rollup_date).all()
+        return [{
+            'date': row.rollup_date.isoformat(),
+            'orders': row.order_count,
+            'revenue': round(row.revenue or 0, 2)
+        } for row in rows]
+
+    def get_product_sales(self, warehouse_location, days=None, limit=10):
+        """Units, free units, revenue and order count per product, best sellers first"""
+        revenue = func.sum(DailySalesRollup.revenue)
+        query = self.db_service.read_query(
+            DailySalesRollup.product_code,
+            func.max(DailySalesRollup.product_name),
+            func.sum(DailySalesRollup.units),
+            func.sum(DailySalesRollup.free_quantity),
+            revenue,
+            func.sum(DailySalesRollup.order_count)
+        ).filter(
+            DailySalesRollup.warehouse_location == warehouse_location,
+            DailySalesRollup.product_code != ORDER_TOTAL_CODE
+        )
+        if days:
+            query = query.filter(DailySalesRollup.rollup_date >= datetime.utcnow().date() - timedelta(days=days))
+        rows = query.group_by(DailySalesRollup.product_code).order_by(revenue.desc()).limit(limit).all()
+        return [{
+            'product_code': product_code,
+            'product_name': product_name or product_code,
+            'units': int(units or 0),
+            'free_units': int(free_units or 0),
+            'revenue': round(float(total or 0), 2),
+            'orders': int(orders or 0)
+        } for product_code, product_name, units, free_units, total, orders in rows]
+
+    def get_period_totals(self, warehouse_location, since, until=None):
+        """Placed and confirmed totals for order days in [since, until]"""
+        query = self.db_service.read_query(
+            func.coalesce(func.sum(DailySalesRollup.order_count), 0),
+            func.coalesce(func.sum(DailySalesRollup.units), 0),
+            func.coalesce(func.sum(DailySalesRollup.revenue), 0),
+            func.coalesce(func.sum(DailySalesRollup.discount), 0),
+            func.coalesce(func.sum(DailySalesRollup.confirmed_order_count), 0),
+            func.coalesce(func.sum(DailySalesRollup.confirmed_revenue), 0)
+        ).filter(
+            DailySalesRollup.warehouse_location == warehouse_location,
+            DailySalesRollup.product_code == ORDER_TOTAL_CODE,
+            DailySalesRollup.rollup_date >= since
+        )
+        if until:
+            query = query.filter(DailySalesRollup.rollup_date <= until)
+        orders, units, revenue, discount, confirmed_orders, confirmed_revenue = query.one()
+        return {
+            'orders': int(orders),
+            'units': int(units),
+            'revenue': round(float(revenue), 2),
+            'discount': round(float(discount), 2),
+            'confirmed_orders': int(confirmed_orders),
+            'confirmed_revenue': round(float(confirmed_revenue), 2)
+        }
@@ -2,9 +2,10 @@ import logging
 from datetime import datetime, date
 from flask import current_app
 from app import db
-from app.models import Product, PendingOrderProducts, Order, OrderItem, User
+from app.models import Product, PendingOrderProducts, Order, OrderItem
 from app.database_service import DatabaseService
 from app.pricing_service import PricingService
+from app.sales_rollup import SalesRollupService
 from app.email_utils import send_email
 
 logging.basicConfig(level=logging.INFO)
@@ -16,6 +17,7 @@ class StockCheckService:
     def __init__(self):
         self.db_service = DatabaseService()
         self.pricing_service = PricingService()
+        self.rollup_service = SalesRollupService()
         self.logger = logger
     
     def check_and_fulfill_pending_orders(self):
@@ -31,7 +33,11 @@ class StockCheckService:
             
             if not pending_products:
                 self.logger.info("No pending products to check")
-                return
+                return {
+                    'success': True,
+                    'fulfilled_count': 0,
+                    'fulfilled_orders': []
+                }
             
             self.logger.info(f"Found {len(pending_products)} pending products to check")
             
@@ -132,7 +138,7 @@ class StockCheckService:
         """
         try:
             # Get user information
-            user = User.query.get(pending_product.user_id)
+            user = self.db_service.get_user_record(pending_product.user_id)
             if not user:
                 return {
                     'success': False,
@@ -172,7 +178,7 @@ class StockCheckService:
             )
             order.generate_order_id()
             db.session.add(order)
-            db.session.commit()
+            db.session.flush()  # Assigns order.id; committed once with the item and allocation
             
             # Calculate pricing
             pricing = self.pricing_service.calculate_product_pricing(
@@ -181,6 +187,7 @@ class StockCheckService:
             )
             
             if 'error' in pricing:
+                db.session.rollback()
                 return {
                     'success': False,
                     'message': f"Pricing error: {pricing['error']}"
@@ -205,10 +212,10 @@ class StockCheckService:
             db.session.add(order_item)
             
             # Allocate quantity using FEFO
-            allocations, allocation_message = self.db_service.allocate_quantity_fefo(
-                product_code=pending_product.product_code,
+            allocations, allocation_message = self.db_service.allocate_order_fefo(
+                [{'product_code': pending_product.product_code, 'quantity': pending_product.requested_quantity}],
                 warehouse_id=warehouse.id,
-                quantity_to_allocate=pending_product.requested_quantity
+                commit=False
             )
             
             if not allocations:
@@ -221,6 +228,7 @@ class StockCheckService:
             order.total_amount = pricing['pricing']['total_amount']
             
             db.session.commit()
+            self.rollup_service.record_order_placed(order)
             
             # Update pending order status
             self.db_service.update_pending_order_status(
@@ -0,0 +1,74 @@
+import json
+import logging
+from flask import Response, stream_with_context
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+SSE_HEADERS = {
+    'Cache-Control': 'no-cache',
+    'X-Accel-Buffering': 'no',  # Disable proxy buffering (nginx / Azure front ends)
+    'Connection': 'keep-alive'
+}
+
+
+def sse_event(event, data):
+    """Format one Server-Sent Event with a JSON payload"""
+    return f"event: {event}\ndata: {json.dumps(data, default=str)}\n\n"
+
+
+def sse_response(events):
+    """Wrap a generator of SSE strings in a streaming response bound to the request context"""
+    return Response(stream_with_context(events), mimetype='text/event-stream', headers=SSE_HEADERS)
+
+
+def stream_text_response(deltas, on_complete=None, extra=None, fallback_text=None):
+    """
+    Stream text deltas as 'token' events, then a single 'done' event carrying
+    the full response text plus any extra fields. on_complete(full_text) runs
+    before the 'done' event (e.g. to persist the conversation). If the stream
+    fails before the first token, fallback_text is sent instead.
+    """
+    def generate():
+        parts = []
+        try:
+            for delta in deltas:
+                parts.append(delta)
+                yield sse_event('token', {'text': delta})
+        except Exception as e:
+            logger.error(f"Streaming error: {str(e)}")
+            if not parts:
+                if not fallback_text:
+                    yield sse_event('error', {'error': 'Failed to generate response'})
+                    return
+                parts.append(fallback_text)
+                yield sse_event('token', {'text': fallback_text})
+
+        full_text = ''.join(parts)
+        if on_complete:
+            try:
+                on_complete(full_text)
+            except Exception as e:
+                logger.error(f"Error finalizing streamed response: {str(e)}")
+
+        payload = {'response': full_text}
+        if extra:
+            payload.update(extra)
+        yield sse_event('done', payload)
+
+    return sse_response(generate())
+
+
+def json_to_sse_response(result):
+    """Convert a regular (jsonify(...), status) view result into a one-shot SSE stream"""
+    response, status = result if isinstance(result, tuple) else (result, 200)
+    if response.mimetype == 'text/event-stream':
+        return response
+
+    payload = response.get_json(silent=True) or {}
+    payload['status'] = status
+
+    def generate():
+        yield sse_event('error' if status >= 400 else 'done', payload)
+
+    return sse_response(generate())
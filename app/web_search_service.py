@@ -21,6 +21,11 @@ class WebSearchService:
             api_key = current_app.config.get('TAVILY_API_KEY')
             if api_key:
                 self.client = TavilyClient(api_key=api_key)
+                base_url = current_app.config.get('TAVILY_BASE_URL')
+                if base_url:
+                    # Older clients keep the full /search endpoint in base_url, newer ones just the host
+                    suffix = '/search' if self.client.base_url.endswith('/search') else ''
+                    self.client.base_url = base_url.rstrip('/') + suffix
                 if hasattr(self, 'logger') and self.logger:
                     self.logger.info('Tavily client initialized')
             else:
@@ -5,9 +5,11 @@ from app.whatsapp_service import WhatsAppService
 from app.llm_classification_service import LLMClassificationService
 from app.groq_service import GroqService
 from app.enhanced_order_service import EnhancedOrderService
+from app.llm_order_service import LLMOrderService
 from app.database_service import DatabaseService
 from app.web_search_service import WebSearchService
 from app.order_service import OrderService
+from app.read_replica import set_request_user
 import logging
 import json
 from datetime import datetime
@@ -23,6 +25,7 @@ whatsapp_service = None
 classification_service = None
 llm_service = None
 enhanced_order_service = None
+llm_order_service = None
 db_service = None
 web_search_service = None
 order_service = None
@@ -89,6 +92,13 @@ def get_enhanced_order_service():
         enhanced_order_service = EnhancedOrderService()
     return enhanced_order_service
 
+def get_llm_order_service():
+    """Get LLM order service instance"""
+    global llm_order_service
+    if llm_order_service is None:
+        llm_order_service = LLMOrderService()
+    return llm_order_service
+
 def get_db_service():
     """Get database service instance"""
     global db_service
@@ -183,6 +193,8 @@ def webhook():
                 logger.info(f"Created new WhatsApp user: {from_number} with name: {contact_name}")
             else:
                 logger.info(f"Found existing WhatsApp user: {from_number} with name: {user.name}")
+            # No browser session here: key read-your-writes on this user (see read_replica.py)
+            set_request_user(user.id)
             
             # Create or get active chat session
             session = ChatSession.query.filter_by(
@@ -354,7 +366,7 @@ def handle_whatsapp_order_flow(user, session, message_text, order_session, db_se
         if not warehouse:
             return "I couldn't find your warehouse information. Please contact support."
         
-        products = db_service.get_products_by_warehouse(warehouse.id)
+        products = db_service.get_catalog_snapshot(warehouse.id)
         
         # Check if user wants to place order (finalize)
         if any(keyword in message_text.lower() for keyword in ['confirm order', 'place order', 'checkout', 'finalize', 'place my order', 'place it']):
@@ -757,7 +769,6 @@ def handle_whatsapp_chat(user, session, message_text):
     try:
         # Get all services like in web interface
         db_service = get_db_service()
-        classification_service = get_classification_service()
         web_search_service = get_web_search_service()
         order_service = get_order_service()
         llm_service = get_llm_service()
@@ -798,8 +809,13 @@ def handle_whatsapp_chat(user, session, message_text):
             save_whatsapp_session(user.phone, whatsapp_session_data)
             return response
 
-        # Classify user intent using LLM (same as web interface)
-        classification_result = classification_service.classify_user_intent(message_text, context_data)
+        # Fused turn analysis: intent, products and order IDs in one call (same as web interface)
+        classification_result = get_llm_order_service().analyze_turn(
+            message_text,
+            user_id=user.id,
+            context_data=context_data,
+            has_cart=bool(order_session['items'])
+        )
         intent = classification_result.get('classification', 'OTHER')
         
         logger.info(f"WhatsApp Intent classified as: {intent}")
@@ -0,0 +1,78 @@
+#!/usr/bin/env python3
+"""
+Conversation archival for RB (Powered by Quantum Blue AI)
+Moves old conversations into conversation_archives (zlib-compressed bodies)
+and prints a compaction report. The app also runs this on a schedule
+(CONVERSATION_ARCHIVE_ENABLED / CONVERSATION_ARCHIVE_INTERVAL).
+
+Usage:
+    python archive_conversations.py                # archive conversations older than CONVERSATION_ARCHIVE_AFTER_DAYS
+    python archive_conversations.py --days 30      # archive conversations older than 30 days
+    python archive_conversations.py --dry-run      # report what would be moved, change nothing
+"""
+
+import argparse
+import sys
+from pathlib import Path
+
+# Add the project root to Python path
+project_root = Path(__file__).resolve().parent
+sys.path.insert(0, str(project_root))
+
+
+def format_bytes(size):
+    for unit in ('B', 'KB', 'MB', 'GB'):
+        if size < 1024 or unit == 'GB':
+            return f"{size:.1f} {unit}" if unit != 'B' else f"{size} B"
+        size /= 1024
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Archive old conversations')
+    parser.add_argument('--days', type=int, help='Archive conversations older than this many days')
+    parser.add_argument('--batch-size', type=int, help='Conversations moved per transaction')
+    parser.add_argument('--max-batches', type=int, help='Stop after this many batches')
+    parser.add_argument('--dry-run', action='store_true', help='Measure only, do not move anything')
+    args = parser.parse_args()
+
+    try:
+        print("=" * 60)
+        print("🗄️ RB (Powered by Quantum Blue AI) - Conversation Archive")
+        print("=" * 60)
+
+        from app import create_app
+        app = create_app()
+
+        with app.app_context():
+            from app.conversation_archive import ConversationArchiveService
+
+            service = ConversationArchiveService()
+            report = service.archive_old_conversations(
+                older_than_days=args.days,
+                batch_size=args.batch_size,
+                max_batches=args.max_batches,
+                dry_run=args.dry_run
+            )
+            stats = service.get_archive_stats()
+
+        print(f"Cutoff: conversations created before {report['cutoff']}{' (dry run)' if report['dry_run'] else ''}")
+        print(f"📦 Rows moved:      {report['rows_moved']} in {report['batches']} batches ({report['duration_seconds']}s)")
+        print(f"📏 Bytes before:    {format_bytes(report['bytes_before'])}")
+        print(f"📏 Bytes after:     {format_bytes(report['bytes_after'])}")
+        print(f"💾 Bytes saved:     {format_bytes(report['bytes_saved'])}"
+              + (f" (ratio {report['compression_ratio']}x)" if report['compression_ratio'] else ''))
+        print(f"📊 Hot table rows:  {stats['hot_rows']}")
+        print(f"📊 Archived rows:   {stats['archived_rows']} "
+              f"({format_bytes(stats['archived_raw_bytes'])} stored as {format_bytes(stats['archived_stored_bytes'])})")
+        if report['errors']:
+            print(f"⚠️ {report['errors']} batch(es) failed; see the log")
+            sys.exit(1)
+        print("✅ Conversation archive complete")
+
+    except ImportError as e:
+        print(f"❌ Import Error: {e}")
+        print("💡 Make sure you're running from the correct directory and all dependencies are installed.")
+        sys.exit(1)
+    except Exception as e:
+        print(f"❌ Archive failed: {e}")
+        sys.exit(1)
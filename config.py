@@ -17,7 +17,59 @@ class Config:
     GROQ_API_KEY = os.getenv('GROQ_API_KEY')
     # Defaulting to a high-speed Groq model
     GROQ_MODEL = os.getenv('GROQ_MODEL', 'llama-3.3-70b-versatile')
-    
+    # Point at a local stand-in (python fake_services.py) for offline load testing; empty = api.groq.com
+    GROQ_BASE_URL = os.getenv('GROQ_BASE_URL', '')
+
+    # Shared Groq client: connection pool, per-call deadline, retries and circuit breaker
+    GROQ_TIMEOUT = float(os.getenv('GROQ_TIMEOUT', 20))  # Total deadline per call, retries included
+    GROQ_CONNECT_TIMEOUT = float(os.getenv('GROQ_CONNECT_TIMEOUT', 5))
+    GROQ_MAX_CONCURRENCY = int(os.getenv('GROQ_MAX_CONCURRENCY', 8))  # In-flight calls per process
+    GROQ_MAX_RETRIES = int(os.getenv('GROQ_MAX_RETRIES', 2))
+    GROQ_RETRY_BASE_DELAY = float(os.getenv('GROQ_RETRY_BASE_DELAY', 0.5))
+    GROQ_CIRCUIT_FAILURE_THRESHOLD = int(os.getenv('GROQ_CIRCUIT_FAILURE_THRESHOLD', 5))
+    GROQ_CIRCUIT_RESET_TIMEOUT = int(os.getenv('GROQ_CIRCUIT_RESET_TIMEOUT', 30))
+    GROQ_POOL_MAX_CONNECTIONS = int(os.getenv('GROQ_POOL_MAX_CONNECTIONS', 20))
+    GROQ_POOL_KEEPALIVE = int(os.getenv('GROQ_POOL_KEEPALIVE', 10))
+
+    # Per-call LLM instrumentation (served at /health/llm)
+    LLM_METRICS_ENABLED = os.getenv('LLM_METRICS_ENABLED', 'true').lower() == 'true'
+    LLM_METRICS_SAMPLE_SIZE = int(os.getenv('LLM_METRICS_SAMPLE_SIZE', 1000))  # Recent latencies kept per call site for percentiles
+    # Optional JSONL file receiving one line per LLM call (empty = disabled)
+    LLM_METRICS_JSONL_PATH = os.getenv('LLM_METRICS_JSONL_PATH', '')
+
+    # Response cache for deterministic (low-temperature) completions
+    LLM_CACHE_ENABLED = os.getenv('LLM_CACHE_ENABLED', 'true').lower() == 'true'
+    LLM_CACHE_MAX_ENTRIES = int(os.getenv('LLM_CACHE_MAX_ENTRIES', 1000))
+    LLM_CACHE_TTL = int(os.getenv('LLM_CACHE_TTL', 3600))  # 1 hour
+    LLM_CACHE_MAX_TEMPERATURE = float(os.getenv('LLM_CACHE_MAX_TEMPERATURE', 0.1))
+    # Optional SQLite file shared by all workers on the host (empty = memory only)
+    LLM_CACHE_DISK_PATH = os.getenv('LLM_CACHE_DISK_PATH', '')
+
+    # Tiered intent classification: local rules/model first, Groq below this confidence
+    INTENT_LOCAL_ENABLED = os.getenv('INTENT_LOCAL_ENABLED', 'true').lower() == 'true'
+    INTENT_LOCAL_CONFIDENCE_THRESHOLD = float(os.getenv('INTENT_LOCAL_CONFIDENCE_THRESHOLD', 0.85))
+    INTENT_MODEL_RETRAIN_INTERVAL = int(os.getenv('INTENT_MODEL_RETRAIN_INTERVAL', 3600))
+    INTENT_MODEL_TRAINING_LIMIT = int(os.getenv('INTENT_MODEL_TRAINING_LIMIT', 5000))
+    # The model only answers above the threshold once trained on this many LLM-labelled turns
+    # and when this fraction of the message's words were seen in training
+    INTENT_MODEL_MIN_EXAMPLES = int(os.getenv('INTENT_MODEL_MIN_EXAMPLES', 100))
+    INTENT_MODEL_MIN_COVERAGE = float(os.getenv('INTENT_MODEL_MIN_COVERAGE', 0.6))
+
+    # Compact product catalog block sent as the leading (cacheable) system message
+    CATALOG_PROMPT_TTL = int(os.getenv('CATALOG_PROMPT_TTL', 300))  # Safety net for out-of-process writes
+    CATALOG_PROMPT_MAX_PRODUCTS = int(os.getenv('CATALOG_PROMPT_MAX_PRODUCTS', 50))
+    # Per-warehouse read-only product snapshot, invalidated after committed product changes
+    CATALOG_SNAPSHOT_ENABLED = os.getenv('CATALOG_SNAPSHOT_ENABLED', 'true').lower() == 'true'
+    CATALOG_SNAPSHOT_TTL = int(os.getenv('CATALOG_SNAPSHOT_TTL', 60))  # Bounds staleness from other workers
+    # Read-only User/Warehouse records by id and unique lookups, invalidated after committed changes
+    IDENTITY_CACHE_ENABLED = os.getenv('IDENTITY_CACHE_ENABLED', 'true').lower() == 'true'
+    IDENTITY_CACHE_TTL = int(os.getenv('IDENTITY_CACHE_TTL', 300))  # Bounds staleness from other workers
+
+    # Run each turn's LLM analysis on a worker thread while the request thread loads user context
+    TURN_CONCURRENCY_ENABLED = os.getenv('TURN_CONCURRENCY_ENABLED', 'true').lower() == 'true'
+    TURN_WORKER_THREADS = int(os.getenv('TURN_WORKER_THREADS', 8))
+    TURN_ANALYSIS_TIMEOUT = int(os.getenv('TURN_ANALYSIS_TIMEOUT', 30))
+
     # NOTE: Azure OpenAI configuration removed/commented out for Groq usage.
     # AZURE_OPENAI_ENDPOINT = os.getenv('AZURE_OPENAI_ENDPOINT')
     # AZURE_OPENAI_KEY = os.getenv('AZURE_OPENAI_KEY')
@@ -44,6 +96,8 @@ class Config:
     SQL_PASSWORD = os.getenv('SQL_PASSWORD')
     
     REQUIRE_AZURE_DB = os.getenv('REQUIRE_AZURE_DB', 'false').lower() == 'true'
+    # Seconds a worker waits for another worker's schema/sample-data bootstrap before running it unlocked
+    BOOTSTRAP_LOCK_TIMEOUT = int(os.getenv('BOOTSTRAP_LOCK_TIMEOUT', 120))
 
     if SQL_SERVER:
         from urllib.parse import quote_plus
@@ -78,6 +132,64 @@ class Config:
             # Note: 'use_mars' is not supported by pymssql driver
         }
     
+    # Connection pool telemetry (/health/db-pool) and sizing from observed checkout concurrency:
+    # off, recommend (report only) or apply (resize every POOL_SIZING_INTERVAL seconds).
+    # POOL_MAX_CONNECTIONS caps pool_size + max_overflow per process; keep workers x cap under the Azure SQL limit
+    POOL_TELEMETRY_ENABLED = os.getenv('POOL_TELEMETRY_ENABLED', 'true').lower() == 'true'
+    POOL_SIZING_MODE = os.getenv('POOL_SIZING_MODE', 'off').lower()
+    POOL_SIZING_INTERVAL = int(os.getenv('POOL_SIZING_INTERVAL', 300))
+    POOL_SIZING_MIN_SAMPLES = int(os.getenv('POOL_SIZING_MIN_SAMPLES', 200))  # Checkouts observed before recommending
+    POOL_SIZING_HEADROOM = float(os.getenv('POOL_SIZING_HEADROOM', 1.25))
+    POOL_MIN_SIZE = int(os.getenv('POOL_MIN_SIZE', 2))
+    POOL_MAX_CONNECTIONS = int(os.getenv('POOL_MAX_CONNECTIONS', 30))
+    
+    # Optional read replica for read-only chat/dashboard queries (history, order tracking,
+    # analytics, product search); empty = everything on the primary.
+    # Local test: READ_REPLICA_DATABASE_URI=sqlite:///chatbot_replica.db + python sync_sqlite_replica.py
+    SQL_READ_SERVER = os.getenv('SQL_READ_SERVER')
+    if SQL_SERVER and SQL_READ_SERVER:
+        READ_REPLICA_DATABASE_URI = (
+            f"mssql+pymssql://{SQL_USERNAME}:{encoded_password}@{SQL_READ_SERVER}/{SQL_DATABASE}"
+            f"?charset=utf8&tds_version=7.4&timeout=30&login_timeout=15"
+        )
+    else:
+        READ_REPLICA_DATABASE_URI = os.getenv('READ_REPLICA_DATABASE_URI')
+    READ_YOUR_WRITES_SECONDS = float(os.getenv('READ_YOUR_WRITES_SECONDS', 10))  # Reads stay on the primary after a user's own write
+    SQLALCHEMY_BINDS = {}
+    if READ_REPLICA_DATABASE_URI:
+        SQLALCHEMY_BINDS['replica'] = {
+            'url': READ_REPLICA_DATABASE_URI,
+            'pool_size': int(os.getenv('DB_REPLICA_POOL_SIZE', SQLALCHEMY_ENGINE_OPTIONS['pool_size'])),
+            'max_overflow': int(os.getenv('DB_REPLICA_MAX_OVERFLOW', SQLALCHEMY_ENGINE_OPTIONS['max_overflow'])),
+        }
+    
+    # Stock reservation: guarded UPDATEs retried when another order takes the stock first
+    STOCK_RESERVATION_MAX_RETRIES = int(os.getenv('STOCK_RESERVATION_MAX_RETRIES', 3))
+    STOCK_RESERVATION_RETRY_DELAY = float(os.getenv('STOCK_RESERVATION_RETRY_DELAY', 0.05))  # Seconds, grows per attempt
+    
+    # Daily sales rollups (daily_sales_rollups) for analytics; backfilled from orders on the first start
+    # with this enabled (app/bootstrap.py), rebuild a range with rebuild_sales_rollups.py
+    SALES_ROLLUP_ENABLED = os.getenv('SALES_ROLLUP_ENABLED', 'true').lower() == 'true'
+    
+    # Conversation export: rows fetched per server-side chunk, emailed format, largest file attached (else linked)
+    EXPORT_CHUNK_SIZE = int(os.getenv('EXPORT_CHUNK_SIZE', 500))
+    EXPORT_EMAIL_FORMAT = os.getenv('EXPORT_EMAIL_FORMAT', 'html')  # html, csv or jsonl
+    EXPORT_ATTACHMENT_MAX_BYTES = int(os.getenv('EXPORT_ATTACHMENT_MAX_BYTES', 5 * 1024 * 1024))
+    # Larger exports are kept here and emailed as a signed link valid EXPORT_LINK_TTL seconds (empty = instance/exports)
+    EXPORT_STORAGE_DIR = os.getenv('EXPORT_STORAGE_DIR', '')
+    EXPORT_LINK_TTL = int(os.getenv('EXPORT_LINK_TTL', 7 * 86400))
+    
+    # Conversation archival: move old conversations to conversation_archives (zlib-compressed bodies)
+    CONVERSATION_ARCHIVE_ENABLED = os.getenv('CONVERSATION_ARCHIVE_ENABLED', 'true').lower() == 'true'
+    CONVERSATION_ARCHIVE_AFTER_DAYS = int(os.getenv('CONVERSATION_ARCHIVE_AFTER_DAYS', 90))
+    CONVERSATION_ARCHIVE_BATCH_SIZE = int(os.getenv('CONVERSATION_ARCHIVE_BATCH_SIZE', 500))
+    CONVERSATION_ARCHIVE_INTERVAL = int(os.getenv('CONVERSATION_ARCHIVE_INTERVAL', 86400))  # Seconds between scheduled runs
+    
+    # Bulk catalog/stock import (import_catalog.py, /enhanced-chat/distributor/import_stock): rows per
+    # validated and committed chunk (keep under ~2000 on MSSQL, codes are sent as IN parameters), errors listed
+    CATALOG_IMPORT_CHUNK_SIZE = int(os.getenv('CATALOG_IMPORT_CHUNK_SIZE', 1000))
+    CATALOG_IMPORT_MAX_ERRORS = int(os.getenv('CATALOG_IMPORT_MAX_ERRORS', 100))
+    
     # ------------------------------------------------------------------------
     ## EMAIL/SMTP CONFIGURATION
     # ------------------------------------------------------------------------
@@ -100,6 +212,8 @@ class Config:
     ## WEB SEARCH APIs (Tavily for Quantum Blue)
     # ------------------------------------------------------------------------
     TAVILY_API_KEY = os.getenv('TAVILY_API_KEY')
+    # Point at a local stand-in (python fake_services.py); empty = api.tavily.com
+    TAVILY_BASE_URL = os.getenv('TAVILY_BASE_URL', '')
     
     # 🚨 New setting to constrain web search for Quantum Blue
     _DOMAIN_STRING = os.getenv('ALLOWED_SEARCH_DOMAINS', 'investopedia.com,financialservices.gov.in,highvolt.tech')
@@ -0,0 +1,132 @@
+#!/usr/bin/env python3
+"""
+Query plan report for RB (Powered by Quantum Blue AI) hot paths
+Prints the plan of each hot query and which hot-path indexes exist.
+Run it before and after `python migrate_database.py` to compare: it connects
+with a plain engine and never bootstraps, so it does not apply migrations itself.
+"""
+
+import sys
+from pathlib import Path
+
+# Add the project root to Python path
+project_root = Path(__file__).resolve().parent
+sys.path.insert(0, str(project_root))
+
+# (label, SQL, parameters) - parameter values only need to be plausible
+HOT_QUERIES = [
+    ('FEFO allocation / availability',
+     "SELECT * FROM products WHERE product_code = :code AND warehouse_id = :warehouse_id "
+     "AND is_active = 1 AND expiry_date >= :today ORDER BY expiry_date",
+     {'code': 'P001', 'warehouse_id': 1, 'today': '2024-01-01'}),
+    ('WhatsApp webhook user lookup',
+     "SELECT * FROM users WHERE phone = :phone",
+     {'phone': '+10000000000'}),
+    ('Cart item lookup',
+     "SELECT * FROM cart_items WHERE user_id = :user_id AND product_id = :product_id",
+     {'user_id': 1, 'product_id': 1}),
+    ('Distributor orders',
+     "SELECT * FROM orders WHERE warehouse_location = :location ORDER BY order_date DESC",
+     {'location': 'Main Warehouse'}),
+    ('Conversation history by user',
+     "SELECT * FROM conversations WHERE user_id = :user_id ORDER BY created_at DESC",
+     {'user_id': 1}),
+    ('Conversation history by session',
+     "SELECT * FROM conversations WHERE session_id = :session_id ORDER BY created_at DESC",
+     {'session_id': 1}),
+    ('Pending stock fulfilment',
+     "SELECT * FROM pending_order_products WHERE status = :status AND warehouse_id = :warehouse_id "
+     "AND product_code = :code",
+     {'status': 'pending', 'warehouse_id': 1, 'code': 'P001'}),
+]
+
+
+def _inline(sql, params):
+    """SHOWPLAN_TEXT cannot take bound parameters, so inline the literals"""
+    for key, value in params.items():
+        literal = str(value) if isinstance(value, int) else "'" + str(value).replace("'", "''") + "'"
+        sql = sql.replace(f":{key}", literal)
+    return sql
+
+
+def create_engine_from_config():
+    """Engine for Config's database without create_app (whose bootstrap would migrate it)"""
+    from sqlalchemy import create_engine
+    from sqlalchemy.engine import make_url
+    from config import Config
+
+    url = make_url(Config.SQLALCHEMY_DATABASE_URI)
+    options = dict(Config.SQLALCHEMY_ENGINE_OPTIONS)
+    if url.drivername.startswith('sqlite'):
+        # Flask-SQLAlchemy resolves relative SQLite paths against the instance folder
+        if url.database not in (None, '', ':memory:') and not Path(url.database).is_absolute():
+            url = url.set(database=str(project_root / 'instance' / url.database))
+        if url.database not in (None, '', ':memory:') and not Path(url.database).exists():
+            raise FileNotFoundError(f"SQLite database {url.database} does not exist yet; start the app once first")
+        for key in ('pool_size', 'max_overflow', 'pool_timeout'):
+            options.pop(key, None)
+    return create_engine(url, **options)
+
+
+def print_plans(conn, dialect):
+    from sqlalchemy import text
+
+    for label, sql, params in HOT_QUERIES:
+        print(f"\n▶ {label}")
+        try:
+            if dialect == 'mssql':
+                conn.execute(text("SET SHOWPLAN_TEXT ON"))
+                try:
+                    result = conn.execute(text(_inline(sql, params)))
+                    # First result set echoes the statement, the plan follows
+                    while True:
+                        for row in result.fetchall():
+                            print(f"   {row[0]}")
+                        if not result.cursor.nextset():
+                            break
+                finally:
+                    conn.execute(text("SET SHOWPLAN_TEXT OFF"))
+            else:
+                for row in conn.execute(text(f"EXPLAIN QUERY PLAN {sql}"), params):
+                    print(f"   {row[-1]}")
+        except Exception as e:
+            print(f"   ⚠️ Could not explain query: {str(e)}")
+
+
+def print_indexes(engine):
+    from sqlalchemy import inspect
+    from app.migrations.m0002_hot_path_indexes import HOT_PATH_INDEXES
+
+    inspector = inspect(engine)
+    print("\n📇 Hot-path indexes:")
+    for index_name, table_name, columns in HOT_PATH_INDEXES:
+        try:
+            existing = {index['name'] for index in inspector.get_indexes(table_name)}
+        except Exception:
+            existing = set()
+        status = '✓' if index_name in existing else '✗ missing'
+        print(f"   {status} {index_name} ON {table_name}({', '.join(columns)})")
+
+
+if __name__ == '__main__':
+    try:
+        print("=" * 60)
+        print("🔍 RB (Powered by Quantum Blue AI) - Hot Query Plans")
+        print("=" * 60)
+
+        engine = create_engine_from_config()
+        dialect = engine.dialect.name
+        print(f"📊 Database dialect: {dialect}")
+
+        print_indexes(engine)
+        with engine.connect() as conn:
+            print_plans(conn, dialect)
+        engine.dispose()
+
+    except ImportError as e:
+        print(f"❌ Import Error: {e}")
+        print("💡 Make sure you're running from the correct directory and all dependencies are installed.")
+        sys.exit(1)
+    except Exception as e:
+        print(f"❌ Error: {e}")
+        sys.exit(1)
@@ -0,0 +1,411 @@
+#!/usr/bin/env python3
+"""
+Local stand-ins for the Groq (OpenAI-compatible) and Tavily APIs.
+
+Lets the real chatbot pipeline run end to end with no network and no API
+quota, for load and latency testing. Responses are scripted per prompt type
+(turn analysis / classification JSON, product extraction JSON, order parsing,
+cost calculation, routing decisions and free-text summaries), and every
+request gets a configurable log-normal latency and error rate.
+
+Usage:
+    python fake_services.py --port 8089 --latency-median-ms 400 --error-rate 0.02
+
+Then start the app with:
+    GROQ_API_KEY=fake GROQ_BASE_URL=http://localhost:8089
+    TAVILY_API_KEY=fake TAVILY_BASE_URL=http://localhost:8089
+"""
+
+import argparse
+import json
+import math
+import random
+import re
+import sys
+import threading
+import time
+import uuid
+
+from flask import Flask, Response, jsonify, request
+
+app = Flask(__name__)
+
+# Defaults, overridden from the command line / --profile file
+SETTINGS = {
+    'latency_median_ms': 400.0,
+    'latency_sigma': 0.5,
+    'token_delay_ms': 15.0,
+    'error_rate': 0.0,
+    'search_latency_median_ms': 800.0,
+    'seed': None,
+    # Optional per prompt type overrides: {"extraction": {"latency_median_ms": 900, "error_rate": 0.05}}
+    'profiles': {}
+}
+
+_random = random.Random()
+_random_lock = threading.Lock()
+_stats = {'completions': 0, 'searches': 0, 'errors': 0, 'by_type': {}}
+_stats_lock = threading.Lock()
+
+CATALOG_ROW = re.compile(r'^([A-Z]{2,4}\d{2,5})\|(.+?)\|([\d.]+)\|(-?\d+)$', re.MULTILINE)
+USER_MESSAGE = re.compile(r'(?:Current User Message|User Message|User\'s message|User Query|User):\s*"?(.+?)"?\s*$', re.MULTILINE)
+ORDER_ID = re.compile(r'\bQB\d{8}[A-Z0-9]+\b', re.IGNORECASE)
+QUANTITY_BEFORE = r'(\d+)\s*(?:x\s*|units?\s+(?:of\s+)?|pcs\s+|pieces\s+(?:of\s+)?)?'
+
+# Prompt type markers, checked in order against the full prompt text
+PROMPT_TYPES = (
+    ('turn_analysis', 'You analyze one message'),
+    ('login_intent', 'A user just logged in'),
+    ('classification', 'AI intent classifier'),
+    ('extraction', 'extracts product orders'),
+    ('order_parse', 'You are an order parser'),
+    ('cost', 'You are a cost calculator'),
+    ('router', 'PERFORM_SEARCH'),
+)
+
+
+# ----------------------------------------------------------------------------
+## SCRIPTED RESPONSES
+# ----------------------------------------------------------------------------
+
+def _prompt_type(prompt_text):
+    for name, marker in PROMPT_TYPES:
+        if marker in prompt_text:
+            return name
+    return 'text'
+
+
+def _user_message(prompt_text):
+    match = USER_MESSAGE.search(prompt_text)
+    return match.group(1).strip() if match else prompt_text.strip().splitlines()[-1]
+
+
+def _catalog(prompt_text):
+    return [
+        {'code': code, 'name': name, 'price': float(price), 'stock': int(stock)}
+        for code, name, price, stock in CATALOG_ROW.findall(prompt_text)
+    ]
+
+
+def _match_products(message, catalog):
+    """Products mentioned in the message (by code or name words) with their quantities"""
+    message_lower = message.lower()
+    removing = any(word in message_lower for word in ('remove', 'delete', 'take out'))
+    matches = []
+    for product in catalog:
+        digits = re.sub(r'\D', '', product['code'])
+        name_words = [w for w in re.findall(r'[a-z]+', product['name'].lower()) if len(w) > 2]
+        code_hit = re.search(rf'\b{re.escape(product["code"].lower())}\b|\(?\b{digits}\b\)?', message_lower)
+        name_hits = sum(1 for w in name_words if w in message_lower)
+        if not code_hit and name_hits < min(2, len(name_words)):
+            continue
+        first_word = name_words[0] if name_words else product['code'].lower()
+        quantity_match = re.search(QUANTITY_BEFORE + re.escape(first_word), message_lower)
+        quantity = int(quantity_match.group(1)) if quantity_match else 1
+        matches.append({
+            'product_code': product['code'],
+            'product_name': product['name'],
+            'quantity': -quantity if removing else quantity,
+            'confidence': 0.9,
+            'original_text': message
+        })
+    return matches
+
+
+def _intent(message):
+    message_lower = message.lower()
+    if ORDER_ID.search(message):
+        return 'TRACK_ORDER'
+    if any(w in message_lower for w in ('track', 'status', 'where is my order', 'order history')):
+        return 'TRACK_ORDER'
+    if any(w in message_lower for w in ('cost', 'price', 'total', 'how much')):
+        return 'CALCULATE_COST'
+    if any(w in message_lower for w in ('order', 'add', 'buy', 'purchase', 'remove', 'confirm')):
+        return 'PLACE_ORDER'
+    if any(w in message_lower for w in ('product', 'stock', 'catalog', 'list', 'show')):
+        return 'PRODUCT_INFO'
+    if any(w in message_lower for w in ('company', 'contact', 'about')):
+        return 'COMPANY_INFO'
+    return 'OTHER'
+
+
+def _cart_action(message, intent, products):
+    message_lower = message.lower().strip()
+    if products:
+        return 'MODIFY_CART' if products[0]['quantity'] < 0 else 'ADD_TO_CART'
+    if intent == 'PRODUCT_INFO':
+        return 'PRODUCT_INFO'
+    if message_lower in ('yes', 'ok', 'okay', 'proceed', 'confirm', 'place order', 'confirm order', 'place the order'):
+        return 'CONFIRM_ORDER'
+    return None
+
+
+def scripted_response(prompt_type, prompt_text):
+    message = _user_message(prompt_text)
+    catalog = _catalog(prompt_text)
+    products = _match_products(message, catalog)
+    intent = _intent(message)
+    order_ids = [o.upper() for o in ORDER_ID.findall(message)]
+
+    if prompt_type == 'turn_analysis':
+        return json.dumps({
+            'classification': intent,
+            'confidence': 0.9,
+            'reasoning': 'scripted by fake_services',
+            'cart_action': _cart_action(message, intent, products),
+            'extracted_products': products if intent == 'PLACE_ORDER' else [],
+            'order_ids': order_ids,
+            'unclear_requests': [],
+            'suggestions': []
+        })
+    if prompt_type == 'classification':
+        first = products[0] if products else {}
+        return json.dumps({
+            'classification': intent,
+            'confidence': 0.9,
+            'reasoning': 'scripted by fake_services',
+            'entities': {
+                'product_name': first.get('product_name'),
+                'quantity': first.get('quantity'),
+                'order_id': order_ids[0] if order_ids else None
+            }
+        })
+    if prompt_type == 'login_intent':
+        login_intent = intent if intent in ('PLACE_ORDER', 'TRACK_ORDER', 'PRODUCT_INFO', 'COMPANY_INFO') else 'OTHER'
+        return json.dumps({
+            'intent': login_intent,
+            'confidence': 0.9,
+            'next_state': 'continue_conversation' if login_intent == 'OTHER' else 'ready'
+        })
+    if prompt_type == 'extraction':
+        return json.dumps({
+            'extracted_products': products,
+            'total_products': len(products),
+            'order_ready': bool(products),
+            'unclear_requests': [],
+            'suggestions': [] if products else ['Please mention a product name and quantity']
+        })
+    if prompt_type == 'order_parse':
+        return json.dumps({
+            'cart_items': [{'product_code': p['product_code'], 'quantity': p['quantity']} for p in products],
+            'total_items': len(products),
+            'order_ready': bool(products)
+        })
+    if prompt_type == 'cost':
+        prices = {p['code']: p['price'] for p in catalog}
+        items = [{
+            'product_name': p['product_name'],
+            'product_code': p['product_code'],
+            'quantity': p['quantity'],
+            'unit_price': prices.get(p['product_code'], 0),
+            'item_total': prices.get(p['product_code'], 0) * p['quantity']
+        } for p in products]
+        subtotal = sum(item['item_total'] for item in items)
+        discount = round(subtotal * 0.05, 2) if subtotal > 5000 else 0
+        return json.dumps({
+            'order_items': items,
+            'subtotal': subtotal,
+            'discount_amount': discount,
+            'discount_percentage': 5 if discount else 0,
+            'final_total': subtotal - discount,
+            'order_ready': bool(items)
+        })
+    if prompt_type == 'router':
+        return 'NO_SEARCH'
+
+    # Free text (summaries, notifications, general conversation)
+    return (
+        f"Thanks for your message about \"{message[:80]}\". This is a scripted response from the local "
+        "test server. Your request has been noted and the details are summarized below.\n\n"
+        "- Everything looks in order\n- No further action is needed right now\n\n"
+        "Let me know if there is anything else I can help with."
+    )
+
+
+# ----------------------------------------------------------------------------
+## LATENCY / ERROR INJECTION
+# ----------------------------------------------------------------------------
+
+def _setting(prompt_type, name):
+    return SETTINGS['profiles'].get(prompt_type, {}).get(name, SETTINGS[name])
+
+
+def _sample_latency(median_ms, sigma):
+    """Log-normal latency in seconds with the given median"""
+    with _random_lock:
+        return median_ms * math.exp(sigma * _random.gauss(0, 1)) / 1000.0
+
+
+def _maybe_error(prompt_type):
+    with _random_lock:
+        failed = _random.random() < _setting(prompt_type, 'error_rate')
+        rate_limited = _random.random() < 0.5
+    if not failed:
+        return None
+    with _stats_lock:
+        _stats['errors'] += 1
+    if rate_limited:
+        response = jsonify({'error': {'message': 'Rate limit reached (fake)', 'type': 'rate_limit_exceeded'}})
+        response.status_code = 429
+        response.headers['Retry-After'] = '1'
+        return response
+    response = jsonify({'error': {'message': 'Service unavailable (fake)', 'type': 'server_error'}})
+    response.status_code = 503
+    return response
+
+
+def _estimate_tokens(text):
+    return max(1, (len(text) + 3) // 4)
+
+
+# ----------------------------------------------------------------------------
+## GROQ / OPENAI-COMPATIBLE ENDPOINT
+# ----------------------------------------------------------------------------
+
+@app.route('/openai/v1/chat/completions', methods=['POST'])
+@app.route('/v1/chat/completions', methods=['POST'])
+def chat_completions():
+    body = request.get_json(force=True) or {}
+    messages = body.get('messages') or []
+    prompt_text = '\n'.join(str(m.get('content') or '') for m in messages)
+    prompt_type = _prompt_type(prompt_text)
+
+    with _stats_lock:
+        _stats['completions'] += 1
+        _stats['by_type'][prompt_type] = _stats['by_type'].get(prompt_type, 0) + 1
+
+    time.sleep(_sample_latency(_setting(prompt_type, 'latency_median_ms'), _setting(prompt_type, 'latency_sigma')))
+    error = _maybe_error(prompt_type)
+    if error is not None:
+        return error
+
+    content = scripted_response(prompt_type, prompt_text)
+    model = body.get('model', 'fake-model')
+    completion_id = f"chatcmpl-{uuid.uuid4().hex[:24]}"
+    created = int(time.time())
+    usage = {
+        'prompt_tokens': _estimate_tokens(prompt_text),
+        'completion_tokens': _estimate_tokens(content),
+    }
+    usage['total_tokens'] = usage['prompt_tokens'] + usage['completion_tokens']
+
+    if body.get('stream'):
+        token_delay = _setting(prompt_type, 'token_delay_ms') / 1000.0
+
+        def generate():
+            pieces = re.findall(r'\S+\s*', content)
+            for index, piece in enumerate(pieces):
+                chunk = {
+                    'id': completion_id, 'object': 'chat.completion.chunk', 'created': created, 'model': model,
+                    'choices': [{'index': 0, 'delta': {'role': 'assistant', 'content': piece} if index == 0 else {'content': piece}, 'finish_reason': None}]
+                }
+                yield f"data: {json.dumps(chunk)}\n\n"
+                time.sleep(token_delay)
+            final = {
+                'id': completion_id, 'object': 'chat.completion.chunk', 'created': created, 'model': model,
+                'choices': [{'index': 0, 'delta': {}, 'finish_reason': 'stop'}],
+                'x_groq': {'usage': usage}
+            }
+            yield f"data: {json.dumps(final)}\n\n"
+            yield "data: [DONE]\n\n"
+
+        return Response(generate(), mimetype='text/event-stream')
+
+    return jsonify({
+        'id': completion_id,
+        'object': 'chat.completion',
+        'created': created,
+        'model': model,
+        'choices': [{
+            'index': 0,
+            'message': {'role': 'assistant', 'content': content},
+            'finish_reason': 'stop'
+        }],
+        'usage': usage
+    })
+
+
+# ----------------------------------------------------------------------------
+## TAVILY-COMPATIBLE ENDPOINT
+# ----------------------------------------------------------------------------
+
+@app.route('/search', methods=['POST'])
+def tavily_search():
+    body = request.get_json(force=True, silent=True) or {}
+    query = body.get('query', '')
+    domains = body.get('include_domains') or ['example.com']
+    max_results = int(body.get('max_results') or 5)
+
+    with _stats_lock:
+        _stats['searches'] += 1
+
+    time.sleep(_sample_latency(_setting('search', 'search_latency_median_ms'), _setting('search', 'latency_sigma')))
+    error = _maybe_error('search')
+    if error is not None:
+        return error
+
+    results = []
+    for index in range(min(max_results, 3)):
+        domain = domains[index % len(domains)]
+        content = f"Scripted search result {index + 1} for '{query}' from {domain}. It contains enough text to exercise result formatting and synthesis."
+        results.append({
+            'title': f"{query[:60]} - {domain}",
+            'url': f"https://{domain}/fake/{index + 1}",
+            'content': content,
+            'raw_content': content if body.get('include_raw_content') else None,
+            'score': round(0.9 - index * 0.1, 2),
+            'published_date': ''
+        })
+
+    return jsonify({
+        'query': query,
+        'answer': f"Scripted answer for '{query}'." if body.get('include_answer') else None,
+        'images': [],
+        'results': results,
+        'response_time': 0.0
+    })
+
+
+@app.route('/stats')
+def stats():
+    with _stats_lock:
+        return jsonify(dict(_stats, by_type=dict(_stats['by_type']), settings=SETTINGS))
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Local fake Groq + Tavily servers for offline load testing')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8089)
+    parser.add_argument('--latency-median-ms', type=float, default=SETTINGS['latency_median_ms'])
+    parser.add_argument('--latency-sigma', type=float, default=SETTINGS['latency_sigma'],
+                        help='Log-normal spread; 0 gives a constant latency')
+    parser.add_argument('--token-delay-ms', type=float, default=SETTINGS['token_delay_ms'],
+                        help='Delay between streamed chunks')
+    parser.add_argument('--error-rate', type=float, default=SETTINGS['error_rate'],
+                        help='Fraction of requests answered with 429/503')
+    parser.add_argument('--search-latency-median-ms', type=float, default=SETTINGS['search_latency_median_ms'])
+    parser.add_argument('--profile', help='JSON file with per prompt type overrides, e.g. {"extraction": {"latency_median_ms": 900}}')
+    parser.add_argument('--seed', type=int, help='Random seed for reproducible runs')
+    args = parser.parse_args()
+
+    SETTINGS.update({
+        'latency_median_ms': args.latency_median_ms,
+        'latency_sigma': args.latency_sigma,
+        'token_delay_ms': args.token_delay_ms,
+        'error_rate': args.error_rate,
+        'search_latency_median_ms': args.search_latency_median_ms,
+        'seed': args.seed
+    })
+    if args.profile:
+        with open(args.profile, encoding='utf-8') as f:
+            SETTINGS['profiles'] = json.load(f)
+    if args.seed is not None:
+        _random.seed(args.seed)
+
+    print(f"🧪 Fake Groq/Tavily server on http://{args.host}:{args.port}")
+    print(f"   GROQ_BASE_URL=http://{args.host}:{args.port}  TAVILY_BASE_URL=http://{args.host}:{args.port}")
+    app.run(host=args.host, port=args.port, threaded=True)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,78 @@
+#!/usr/bin/env python3
+"""
+Bulk catalog/stock import for RB (Powered by Quantum Blue AI)
+Upserts product batches from a CSV or XLSX stock file in chunks (columns:
+product_code, product_name, batch_number, expiry_date, quantity, price,
+discount/scheme fields and optionally warehouse), then places pending orders
+the new stock can fulfil.
+
+Usage:
+    python import_catalog.py stock.csv --warehouse "Mumbai Central"
+    python import_catalog.py stock.xlsx                   # warehouse column in the file
+    python import_catalog.py stock.csv --dry-run          # validate and count, change nothing
+"""
+
+import argparse
+import sys
+from pathlib import Path
+
+# Add the project root to Python path
+project_root = Path(__file__).resolve().parent
+sys.path.insert(0, str(project_root))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Import product batches from a CSV/XLSX stock file')
+    parser.add_argument('path', help='CSV or XLSX file')
+    parser.add_argument('--warehouse', help='Warehouse location for rows without a warehouse column')
+    parser.add_argument('--chunk-size', type=int, help='Rows validated and committed per chunk')
+    parser.add_argument('--dry-run', action='store_true', help='Validate and count only, do not write')
+    parser.add_argument('--skip-pending-check', action='store_true', help='Do not run the pending-order stock check afterwards')
+    args = parser.parse_args()
+
+    try:
+        print("=" * 60)
+        print("📦 RB (Powered by Quantum Blue AI) - Catalog Import")
+        print("=" * 60)
+
+        from app import create_app
+        app = create_app()
+
+        with app.app_context():
+            from app.catalog_import import CatalogImportService
+
+            report = CatalogImportService().import_file(
+                args.path,
+                args.path,
+                warehouse_location=args.warehouse,
+                chunk_size=args.chunk_size,
+                dry_run=args.dry_run,
+                check_pending_orders=not args.skip_pending_check
+            )
+
+        if not report['success']:
+            print(f"❌ Import failed: {report.get('error')}")
+            sys.exit(1)
+
+        print(f"File: {report['filename']}{' (dry run)' if report['dry_run'] else ''}")
+        print(f"📄 Rows read:       {report['rows_read']} in {report['chunks']} chunk(s) ({report['duration_seconds']}s)")
+        print(f"➕ Inserted:        {report['inserted']}")
+        print(f"🔁 Updated:         {report['updated']}")
+        print(f"⚠️ Invalid rows:    {report['rows_invalid']}")
+        for error in report['errors']:
+            print(f"   {'line ' + str(error['row']) if error['row'] else 'chunk'}: {error['error']}")
+        pending = report.get('pending_order_check')
+        if pending:
+            print(f"🛒 Pending orders fulfilled: {pending.get('fulfilled_count', 0)}")
+        if report['rows_failed']:
+            print(f"❌ {report['rows_failed']} row(s) in failed chunks; see the log")
+            sys.exit(1)
+        print("✅ Catalog import complete")
+
+    except ImportError as e:
+        print(f"❌ Import Error: {e}")
+        print("💡 Make sure you're running from the correct directory and all dependencies are installed.")
+        sys.exit(1)
+    except Exception as e:
+        print(f"❌ Catalog import failed: {e}")
+        sys.exit(1)
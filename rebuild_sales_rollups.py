@@ -0,0 +1,58 @@
+#!/usr/bin/env python3
+"""
+Sales rollup backfill for RB (Powered by Quantum Blue AI)
+Recomputes daily_sales_rollups from orders and order_items.
+
+Usage:
+    python rebuild_sales_rollups.py                      # rebuild everything
+    python rebuild_sales_rollups.py --since 2024-01-01   # rebuild order days from a date
+    python rebuild_sales_rollups.py --days 7             # rebuild the last 7 days
+"""
+
+import argparse
+import sys
+from datetime import datetime, timedelta
+from pathlib import Path
+
+# Add the project root to Python path
+project_root = Path(__file__).resolve().parent
+sys.path.insert(0, str(project_root))
+
+
+def parse_date(value):
+    return datetime.strptime(value, '%Y-%m-%d').date()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Rebuild daily sales rollups')
+    parser.add_argument('--since', type=parse_date, help='First order day to rebuild (YYYY-MM-DD)')
+    parser.add_argument('--until', type=parse_date, help='Last order day to rebuild (YYYY-MM-DD)')
+    parser.add_argument('--days', type=int, help='Rebuild the last N days (overrides --since)')
+    args = parser.parse_args()
+
+    since = args.since
+    if args.days:
+        since = datetime.utcnow().date() - timedelta(days=args.days)
+
+    try:
+        print("=" * 60)
+        print("📈 RB (Powered by Quantum Blue AI) - Sales Rollup Rebuild")
+        print("=" * 60)
+        print(f"Range: {since or 'beginning'} → {args.until or 'today'}")
+
+        from app import create_app
+        app = create_app()
+
+        with app.app_context():
+            from app.sales_rollup import SalesRollupService
+
+            rows_written = SalesRollupService().rebuild(since=since, until=args.until)
+            print(f"✅ Sales rollups rebuilt: {rows_written} rows")
+
+    except ImportError as e:
+        print(f"❌ Import Error: {e}")
+        print("💡 Make sure you're running from the correct directory and all dependencies are installed.")
+        sys.exit(1)
+    except Exception as e:
+        print(f"❌ Rebuild failed: {e}")
+        sys.exit(1)
@@ -77,56 +77,10 @@ async function sendMessage() {
     showTypingIndicator();
     
     try {
-        const response = await fetch('/enhanced-chat/message', {
-            method: 'POST',
-            headers: {
-                'Content-Type': 'application/json',
-                'X-Requested-With': 'XMLHttpRequest'
-            },
-            body: JSON.stringify({ message: message })
-        });
-        
-        if (!response.ok) {
-            throw new Error(`HTTP error! status: ${response.status}`);
-        }
-        
-        const data = await response.json();
-        
-        if (data.error) {
-            addMessage(`Error: ${data.error}`, 'bot', 'error');
+        if (window.ReadableStream && window.TextDecoder) {
+            await sendMessageStreaming(message);
         } else {
-            // Handle user info display
-            if (data.user_info) {
-                displayUserInfo(data.user_info);
-            }
-            
-            // Add bot response (avatar speaking will be triggered by addMessage)
-            addMessage(data.response, 'bot');
-            
-            // Handle action buttons - REMOVED: No longer showing action buttons
-            // if (data.action_buttons) {
-            //     showActionButtons(data.action_buttons);
-            // }
-            
-            // Handle cart items
-            if (data.cart_items) {
-                updateCartDisplay(data.cart_items);
-            }
-            
-            // Handle order summary
-            if (data.order_summary) {
-                currentOrderSummary = data.order_summary;
-            }
-            
-            // Handle recent orders
-            if (data.recent_orders) {
-                displayRecentOrders(data.recent_orders);
-            }
-            
-            // Handle order details
-            if (data.order_details) {
-                displayOrderDetails(data.order_details);
-            }
+            await sendMessageJSON(message);
         }
     } catch (error) {
         console.error('Error:', error);
@@ -141,6 +95,181 @@ async function sendMessage() {
     }
 }
 
+async function sendMessageJSON(message) {
+    const response = await fetch('/enhanced-chat/message', {
+        method: 'POST',
+        headers: {
+            'Content-Type': 'application/json',
+            'X-Requested-With': 'XMLHttpRequest'
+        },
+        body: JSON.stringify({ message: message })
+    });
+    
+    if (!response.ok) {
+        throw new Error(`HTTP error! status: ${response.status}`);
+    }
+    
+    const data = await response.json();
+    handleBotPayload(data, false);
+}
+
+// Stream the reply over Server-Sent Events and render tokens as they arrive
+async function sendMessageStreaming(message) {
+    const response = await fetch('/enhanced-chat/message/stream', {
+        method: 'POST',
+        headers: {
+            'Content-Type': 'application/json',
+            'Accept': 'text/event-stream',
+            'X-Requested-With': 'XMLHttpRequest'
+        },
+        body: JSON.stringify({ message: message })
+    });
+    
+    if (!response.ok || !response.body) {
+        throw new Error(`HTTP error! status: ${response.status}`);
+    }
+    
+    const reader = response.body.getReader();
+    const decoder = new TextDecoder();
+    let buffer = '';
+    let streamedText = '';
+    let streamingBubble = null;
+    
+    while (true) {
+        const { value, done } = await reader.read();
+        if (done) break;
+        buffer += decoder.decode(value, { stream: true });
+        
+        // SSE events are separated by a blank line
+        let boundary;
+        while ((boundary = buffer.indexOf('\n\n')) !== -1) {
+            const rawEvent = buffer.slice(0, boundary);
+            buffer = buffer.slice(boundary + 2);
+            const event = parseSSEEvent(rawEvent);
+            if (!event) continue;
+            
+            if (event.type === 'token') {
+                if (!streamingBubble) {
+                    hideTypingIndicator();
+                    streamingBubble = createStreamingBotMessage();
+                }
+                streamedText += event.data.text;
+                updateStreamingBotMessage(streamingBubble, streamedText);
+            } else if (event.type === 'done') {
+                if (streamingBubble) {
+                    finishStreamingBotMessage(streamedText);
+                }
+                handleBotPayload(event.data, !!streamingBubble);
+            } else if (event.type === 'error') {
+                addMessage(event.data.response || `Error: ${event.data.error || 'Failed to process message'}`, 'bot', 'error');
+            }
+        }
+    }
+}
+
+function parseSSEEvent(rawEvent) {
+    let type = 'message';
+    const dataLines = [];
+    rawEvent.split('\n').forEach(line => {
+        if (line.startsWith('event:')) {
+            type = line.slice(6).trim();
+        } else if (line.startsWith('data:')) {
+            dataLines.push(line.slice(5).trim());
+        }
+    });
+    if (!dataLines.length) return null;
+    try {
+        return { type: type, data: JSON.parse(dataLines.join('\n')) };
+    } catch (e) {
+        console.error('Invalid SSE payload:', e);
+        return null;
+    }
+}
+
+function handleBotPayload(data, alreadyRendered) {
+    if (data.error) {
+        addMessage(`Error: ${data.error}`, 'bot', 'error');
+        return;
+    }
+    
+    // Handle user info display
+    if (data.user_info) {
+        displayUserInfo(data.user_info);
+    }
+    
+    // Add bot response (avatar speaking will be triggered by addMessage)
+    if (!alreadyRendered && data.response) {
+        addMessage(data.response, 'bot');
+    }
+    
+    // Handle action buttons - REMOVED: No longer showing action buttons
+    // if (data.action_buttons) {
+    //     showActionButtons(data.action_buttons);
+    // }
+    
+    // Handle cart items
+    if (data.cart_items) {
+        updateCartDisplay(data.cart_items);
+    }
+    
+    // Handle order summary
+    if (data.order_summary) {
+        currentOrderSummary = data.order_summary;
+    }
+    
+    // Handle recent orders
+    if (data.recent_orders) {
+        displayRecentOrders(data.recent_orders);
+    }
+    
+    // Handle order details
+    if (data.order_details) {
+        displayOrderDetails(data.order_details);
+    }
+}
+
+function createStreamingBotMessage() {
+    const messagesDiv = document.getElementById('chatMessages');
+    const messageDiv = document.createElement('div');
+    messageDiv.className = 'message bot mb-3';
+    
+    const bubbleDiv = document.createElement('div');
+    bubbleDiv.className = 'message-bubble bot';
+    bubbleDiv.innerHTML = `
+        <div class="d-flex justify-content-start">
+            <div class="bg-light border rounded-3 px-3 py-2" style="max-width: 70%; font-size: 0.875rem; width: 100%;"></div>
+        </div>
+    `;
+    
+    messageDiv.appendChild(bubbleDiv);
+    messagesDiv.appendChild(messageDiv);
+    return bubbleDiv.querySelector('.bg-light');
+}
+
+function updateStreamingBotMessage(contentDiv, text) {
+    const hasTable = text.includes('|') && text.includes('---');
+    if (hasTable) {
+        contentDiv.classList.add('table-bubble');
+        contentDiv.style.maxWidth = '95%';
+    }
+    contentDiv.innerHTML = formatMessage(text);
+    
+    const messagesDiv = document.getElementById('chatMessages');
+    messagesDiv.scrollTop = messagesDiv.scrollHeight;
+}
+
+function finishStreamingBotMessage(text) {
+    // Add to message history
+    messageHistory.push({ message: text, sender: 'bot', timestamp: new Date() });
+    
+    // Trigger avatar speaking once the full reply is known
+    if (typeof avatarSpeak === 'function') {
+        const wordCount = text.split(/\s+/).length;
+        const estimatedDuration = Math.max(1000, Math.min(10000, (wordCount / 2.5) * 1000));
+        avatarSpeak(estimatedDuration);
+    }
+}
+
 function addMessage(message, sender, type = 'normal') {
     const messagesDiv = document.getElementById('chatMessages');
     const messageDiv = document.createElement('div');
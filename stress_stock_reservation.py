@@ -0,0 +1,170 @@
+#!/usr/bin/env python3
+"""
+Concurrent stock reservation stress check for RB (Powered by Quantum Blue AI)
+Many threads reserve the same product batches on a throwaway SQLite database
+at once and the script verifies that no batch is ever oversold.
+
+Usage: python stress_stock_reservation.py [--threads 32] [--orders 400] [--stock 500] [--quantity 3]
+Exits with status 1 if any stock was oversold.
+"""
+
+import argparse
+import os
+import sys
+import tempfile
+import threading
+from datetime import date, timedelta
+from pathlib import Path
+
+# Add the project root to Python path
+project_root = Path(__file__).resolve().parent
+sys.path.insert(0, str(project_root))
+
+STRESS_PRODUCT_CODE = 'STRESS-001'
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description='Concurrent stock reservation stress check (SQLite)')
+    parser.add_argument('--threads', type=int, default=32, help='Concurrent worker threads')
+    parser.add_argument('--orders', type=int, default=400, help='Total orders to attempt')
+    parser.add_argument('--stock', type=int, default=500, help='Total stock, split over three batches')
+    parser.add_argument('--quantity', type=int, default=3, help='Units per order')
+    return parser.parse_args()
+
+
+def build_app(db_path, threads):
+    from config import Config
+    from app import create_app
+
+    class StressConfig(Config):
+        SQLALCHEMY_DATABASE_URI = f"sqlite:///{db_path}"
+        SQLALCHEMY_ENGINE_OPTIONS = {
+            'pool_size': threads,
+            'max_overflow': threads,
+            'pool_timeout': 60,
+            # Wait on SQLite's write lock instead of failing straight away
+            'connect_args': {'timeout': 60, 'check_same_thread': False},
+        }
+        STOCK_RESERVATION_MAX_RETRIES = 10
+        STOCK_RESERVATION_RETRY_DELAY = 0.01
+
+    return create_app(StressConfig)
+
+
+def seed_batches(app, stock):
+    """Three batches of one product with different expiry dates; returns (warehouse_id, batch ids)"""
+    from app import db
+    from app.models import Product, Warehouse
+
+    with app.app_context():
+        warehouse = Warehouse.query.filter_by(is_active=True).first()
+        Product.query.filter_by(product_code=STRESS_PRODUCT_CODE).delete()
+        batch_sizes = [stock // 3, stock // 3, stock - 2 * (stock // 3)]
+        batch_ids = []
+        for index, size in enumerate(batch_sizes):
+            batch = Product(
+                product_code=STRESS_PRODUCT_CODE,
+                product_name='Stress Test Product',
+                batch_number=f"STRESS-B{index + 1}",
+                expiry_date=date.today() + timedelta(days=30 * (index + 1)),
+                product_quantity=size,
+                blocked_quantity=0,
+                available_for_sale=size,
+                confirmed_quantity=0,
+                price_of_product=10.0,
+                is_active=True,
+                warehouse_id=warehouse.id
+            )
+            db.session.add(batch)
+            db.session.flush()
+            batch_ids.append(batch.id)
+        db.session.commit()
+        return warehouse.id, batch_ids
+
+
+def run_orders(app, warehouse_id, orders, threads, quantity):
+    from app import db
+    from app.database_service import DatabaseService
+
+    counts = {'reserved': 0, 'rejected': 0, 'errors': 0}
+    counts_lock = threading.Lock()
+    remaining = {'orders': orders}
+    start = threading.Barrier(threads)
+
+    def worker():
+        db_service = DatabaseService()
+        start.wait()
+        while True:
+            with counts_lock:
+                if remaining['orders'] <= 0:
+                    return
+                remaining['orders'] -= 1
+            with app.app_context():
+                allocations, message = db_service.allocate_order_fefo(
+                    [{'product_code': STRESS_PRODUCT_CODE, 'quantity': quantity}],
+                    warehouse_id=warehouse_id
+                )
+                db.session.remove()
+            with counts_lock:
+                if allocations:
+                    counts['reserved'] += 1
+                elif message.startswith('Insufficient') or message.startswith('Stock changed'):
+                    counts['rejected'] += 1
+                else:
+                    counts['errors'] += 1
+                    print(f"   ⚠️ {message}")
+
+    workers = [threading.Thread(target=worker, name=f"stress-{i}") for i in range(threads)]
+    for thread in workers:
+        thread.start()
+    for thread in workers:
+        thread.join()
+    return counts
+
+
+def verify(app, batch_ids, stock, quantity, counts):
+    from app.models import Product
+
+    with app.app_context():
+        batches = Product.query.filter(Product.id.in_(batch_ids)).order_by(Product.id).all()
+        total_blocked = sum(batch.blocked_quantity for batch in batches)
+        problems = []
+        for batch in batches:
+            print(f"   {batch.batch_number}: quantity={batch.product_quantity} blocked={batch.blocked_quantity} available={batch.available_for_sale}")
+            if batch.available_for_sale < 0 or batch.blocked_quantity > batch.product_quantity:
+                problems.append(f"{batch.batch_number} oversold")
+            if batch.available_for_sale != batch.product_quantity - batch.blocked_quantity:
+                problems.append(f"{batch.batch_number} quantities inconsistent")
+        if total_blocked != counts['reserved'] * quantity:
+            problems.append(f"blocked {total_blocked} units but {counts['reserved']} orders x {quantity} were reserved")
+        if total_blocked > stock:
+            problems.append(f"blocked {total_blocked} units of {stock} in stock")
+        return problems
+
+
+if __name__ == '__main__':
+    args = parse_args()
+    db_path = os.path.join(tempfile.mkdtemp(prefix='rb_stress_'), 'stress.db')
+
+    print("=" * 60)
+    print("🧪 RB (Powered by Quantum Blue AI) - Stock Reservation Stress Check")
+    print("=" * 60)
+    print(f"Database: {db_path}")
+    print(f"Threads: {args.threads} | Orders: {args.orders} x {args.quantity} units | Stock: {args.stock}")
+
+    try:
+        app = build_app(db_path, args.threads)
+        warehouse_id, batch_ids = seed_batches(app, args.stock)
+        counts = run_orders(app, warehouse_id, args.orders, args.threads, args.quantity)
+        print(f"📊 Reserved: {counts['reserved']} | Rejected (no stock): {counts['rejected']} | Errors: {counts['errors']}")
+        problems = verify(app, batch_ids, args.stock, args.quantity, counts)
+    except ImportError as e:
+        print(f"❌ Import Error: {e}")
+        print("💡 Make sure you're running from the correct directory and all dependencies are installed.")
+        sys.exit(1)
+
+    if problems:
+        for problem in problems:
+            print(f"❌ {problem}")
+        sys.exit(1)
+    print("✅ No oversell: every reserved unit is backed by stock")
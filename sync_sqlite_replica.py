@@ -0,0 +1,83 @@
+#!/usr/bin/env python3
+"""
+Local read-replica simulator for RB (Powered by Quantum Blue AI)
+Copies the primary SQLite database into the replica SQLite file with the
+SQLite backup API, once or every --interval seconds, so replica routing and
+read-your-writes can be tried locally with two files.
+
+Usage:
+    READ_REPLICA_DATABASE_URI=sqlite:///chatbot_replica.db python sync_sqlite_replica.py
+    READ_REPLICA_DATABASE_URI=sqlite:///chatbot_replica.db python sync_sqlite_replica.py --interval 5
+"""
+
+import argparse
+import sqlite3
+import sys
+import time
+from pathlib import Path
+
+# Add the project root to Python path
+project_root = Path(__file__).resolve().parent
+sys.path.insert(0, str(project_root))
+
+
+def sqlite_paths(app):
+    """Resolved (primary, replica) database file paths of the app's engines"""
+    from app import db
+    from app.read_replica import REPLICA_BIND
+
+    with app.app_context():
+        primary = db.engines[None].url
+        replica = db.engines[REPLICA_BIND].url
+    if primary.get_backend_name() != 'sqlite' or replica.get_backend_name() != 'sqlite':
+        raise ValueError("Both the primary and READ_REPLICA_DATABASE_URI must be SQLite for local replication")
+    return primary.database, replica.database
+
+
+def copy_database(source_path, target_path):
+    source = sqlite3.connect(source_path)
+    target = sqlite3.connect(target_path)
+    try:
+        source.backup(target)
+    finally:
+        target.close()
+        source.close()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Copy the primary SQLite database to the read replica file')
+    parser.add_argument('--interval', type=float, help='Keep copying every N seconds (simulated replication lag)')
+    args = parser.parse_args()
+
+    try:
+        print("=" * 60)
+        print("🔁 RB (Powered by Quantum Blue AI) - SQLite Read Replica Sync")
+        print("=" * 60)
+
+        from config import Config
+        if not Config.READ_REPLICA_DATABASE_URI:
+            print("❌ READ_REPLICA_DATABASE_URI is not set")
+            sys.exit(1)
+
+        from app import create_app
+        primary_path, replica_path = sqlite_paths(create_app())
+        print(f"Primary: {primary_path}")
+        print(f"Replica: {replica_path}")
+
+        while True:
+            started = time.time()
+            copy_database(primary_path, replica_path)
+            print(f"✅ Replica refreshed in {time.time() - started:.2f}s")
+            if not args.interval:
+                break
+            time.sleep(args.interval)
+
+    except ImportError as e:
+        print(f"❌ Import Error: {e}")
+        print("💡 Make sure you're running from the correct directory and all dependencies are installed.")
+        sys.exit(1)
+    except KeyboardInterrupt:
+        print("\n👋 Replica sync stopped")
+    except Exception as e:
+        print(f"❌ Replica sync failed: {e}")
+        sys.exit(1)